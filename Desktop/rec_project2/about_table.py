@@ -1,7 +1,7 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-import matplotlib.pyplot as plt
+from dataset import courses_table, ratings_table
+from aggregates import aggregates_key, load_or_build_aggregates
 
 st.set_page_config(layout="wide", page_title="Анализ данных")
 st.title("📊 Анализ датасетов системы рекомендаций курсов")
@@ -24,19 +24,28 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-@st.cache_data
+# Каталог из колоночного слоя (dataset.py); cache_resource, а не cache_data:
+# кадр только читается, копировать его на каждый rerun незачем
+@st.cache_resource
 def load_data():
-    ratings = pd.read_csv('Desktop/rec_project2/df_ratings.csv')
-    courses = pd.read_csv('Desktop/rec_project2/info2022_final.csv')
-    return courses, ratings
-
-courses_df, ratings_df = load_data()
+    courses = courses_table()
+    return courses.to_frame([c for c in courses.columns if c != 'description'])
+
+# Агрегаты по оценкам (aggregates.py) вместо groupby по всей таблице на каждый показ.
+# Ключ зависит только от размера и mtime CSV, новые оценки из incremental.py ingest
+# дописываются в агрегаты без пересчёта
+@st.cache_resource
+def load_aggregates(key):
+    return load_or_build_aggregates()
+
+courses_df = load_data()
+aggregates = load_aggregates(aggregates_key())
 col1, col2, col3 = st.columns(3)
 with col1:
     st.markdown(f"""
     <div class="metric-card">
         <h3>👥 Пользователи</h3>
-        <p style="font-size: 2em; margin: 0;">{ratings_df['user_id'].nunique():,}</p>
+        <p style="font-size: 2em; margin: 0;">{aggregates.n_users:,}</p>
     </div>
     """, unsafe_allow_html=True)
 
@@ -52,7 +61,7 @@ with col3:
     st.markdown(f"""
     <div class="metric-card">
         <h3>⭐ Оценки</h3>
-        <p style="font-size: 2em; margin: 0;">{len(ratings_df):,}</p>
+        <p style="font-size: 2em; margin: 0;">{aggregates.n_ratings:,}</p>
     </div>
     """, unsafe_allow_html=True)
 
@@ -61,15 +70,13 @@ with col3:
 st.markdown('<div class="dataset-header">🎓 Анализ датасета курсов</div>', unsafe_allow_html=True)
 tab1, tab2, tab3 = st.tabs(["Распределение по категориям", "Топ курсов", "Длительность курсов"])
 with tab1:
-    fig = px.pie(courses_df, names='category', title='Распределение курсов по категориям',
+    fig = px.pie(aggregates.category_distribution(), names='category', values='courses',
+                 title='Распределение курсов по категориям',
                  color_discrete_sequence=px.colors.sequential.RdBu)
     st.plotly_chart(fig, use_container_width=True)
 
 with tab2:
-    course_ratings = ratings_df.groupby('course_id') \
-        .agg(num_ratings=('user_id', 'count'),
-             avg_rating=('rate', 'mean')) \
-        .reset_index()
+    course_ratings = aggregates.course_stats()
     
     top_courses = course_ratings.merge(
         courses_df, 
@@ -123,10 +130,17 @@ with tab3:
         st.plotly_chart(fig, use_container_width=True)
     else:
         st.warning("В данных отсутствует подходящий числовой столбец для анализа длительности")
-        st.info("Доступные числовые столбцы: " + ", ".join(courses_df.select_dtypes(include=['int64', 'float64']).columns.tolist()))
+        st.info("Доступные числовые столбцы: " + ", ".join(courses_df.select_dtypes(include='number').columns.tolist()))
+
 
+fig = px.bar(aggregates.rating_histogram(), x='rate', y='count', title='Распределение оценок',
+             labels={'rate': 'Оценка', 'count': 'Количество'}, color_discrete_sequence=['#EF553B'])
+st.plotly_chart(fig, use_container_width=True)
 
-fig = px.histogram(ratings_df, x='rate',  title='Распределение оценок', nbins=5,color_discrete_sequence=['#EF553B'])
+fig = px.bar(aggregates.activity_histogram(), x='num_ratings', y='users',
+             title='Активность пользователей',
+             labels={'num_ratings': 'Оценок у пользователя', 'users': 'Пользователей'},
+             color_discrete_sequence=['#00CC96'])
 st.plotly_chart(fig, use_container_width=True)
 
 
@@ -136,4 +150,4 @@ dataset = st.radio("Выберите датасет:", ["Курсы", "Оцен
 if dataset == "Курсы":
     st.dataframe(courses_df.head(10))
 else:
-    st.dataframe(ratings_df.head(10))
+    st.dataframe(ratings_table().head(10))
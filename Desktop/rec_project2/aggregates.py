@@ -0,0 +1,241 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from artifacts import ArtifactStore, artifact_key
+from dataset import (COURSES_PATH, RATINGS_PATH, courses_table, ratings_table, source_key,
+                     write_synthetic_ratings)
+
+AGGREGATES_ARTIFACT = 'aggregates'
+# Меняется при изменении состава агрегатов — старые перестают находиться
+AGGREGATES_FORMAT = 1
+
+
+# Прибавление к отсортированным ключам: у найденных значения складываются, новые ключи
+# вставляются на свои места (копирование массивов — только если новые есть)
+def _merge_sorted(keys, columns, new_keys, new_columns):
+    pos = np.searchsorted(keys, new_keys)
+    found = np.zeros(len(new_keys), dtype=bool)
+    if len(keys):
+        found = keys[np.minimum(pos, len(keys) - 1)] == new_keys
+    merged = []
+    for values, new_values in zip(columns, new_columns):
+        values = np.array(values)
+        np.add.at(values, pos[found], new_values[found])
+        if not found.all():
+            values = np.insert(values, pos[~found], new_values[~found])
+        merged.append(values)
+    if not found.all():
+        keys = np.insert(keys, pos[~found], new_keys[~found])
+    return keys, merged
+
+
+# Материализованные агрегаты для страницы «Обзор»: по курсам — число и сумма оценок,
+# по пользователям — число оценок и гистограмма активности, гистограмма оценок,
+# распределение курсов по категориям. Всё — небольшие отсортированные массивы: чтение
+# не зависит от размера таблицы оценок, новые оценки добавляются через add_ratings.
+class DashboardAggregates:
+    def __init__(self, course_ids, course_count, course_sum, user_ids, user_count, activity,
+                 rate_values, rate_count, categories, category_count):
+        self.course_ids = course_ids
+        self.course_count = course_count
+        self.course_sum = course_sum
+        self.user_ids = user_ids
+        self.user_count = user_count
+        # activity[c] — сколько пользователей поставили ровно c оценок
+        self.activity = activity
+        self.rate_values = rate_values
+        self.rate_count = rate_count
+        self.categories = categories
+        self.category_count = category_count
+
+    @classmethod
+    def build(cls, df_ratings, df_courses):
+        course_ids, course_rows = np.unique(df_ratings['course_id'].to_numpy(), return_inverse=True)
+        rates = df_ratings['rate'].to_numpy(dtype=np.float64)
+        user_ids, user_count = np.unique(df_ratings['user_id'].to_numpy(), return_counts=True)
+        rate_values, rate_count = np.unique(rates, return_counts=True)
+        categories, category_count = np.unique(
+            df_courses['category'].astype(str).to_numpy(dtype=str), return_counts=True)
+        return cls(
+            course_ids, np.bincount(course_rows, minlength=len(course_ids)),
+            np.bincount(course_rows, weights=rates, minlength=len(course_ids)),
+            user_ids, user_count, np.bincount(user_count),
+            rate_values, rate_count, categories, category_count,
+        )
+
+    @property
+    def n_ratings(self):
+        return int(self.rate_count.sum())
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    # Микро-батч новых оценок: работа пропорциональна батчу, плюс вставка новых id
+    def add_ratings(self, df_new):
+        rates = df_new['rate'].to_numpy(dtype=np.float64)
+        new_courses, rows = np.unique(df_new['course_id'].to_numpy(), return_inverse=True)
+        self.course_ids, (self.course_count, self.course_sum) = _merge_sorted(
+            self.course_ids, [self.course_count, self.course_sum], new_courses,
+            [np.bincount(rows), np.bincount(rows, weights=rates)])
+
+        new_users, added = np.unique(df_new['user_id'].to_numpy(), return_counts=True)
+        self.user_ids, (self.user_count,) = _merge_sorted(self.user_ids, [self.user_count],
+                                                          new_users, [added])
+        # Пользователь с c оценками переходит в c + added; у новых было 0
+        after = self.user_count[np.searchsorted(self.user_ids, new_users)]
+        before = after - added
+        if len(after) and after.max() >= len(self.activity):
+            activity = np.zeros(after.max() + 1, dtype=self.activity.dtype)
+            activity[:len(self.activity)] = self.activity
+            self.activity = activity
+        else:
+            self.activity = np.array(self.activity)
+        np.subtract.at(self.activity, before[before > 0], 1)
+        np.add.at(self.activity, after, 1)
+
+        values, counts = np.unique(rates, return_counts=True)
+        self.rate_values, (self.rate_count,) = _merge_sorted(
+            self.rate_values, [self.rate_count], values, [counts])
+        return self
+
+    def course_stats(self):
+        return pd.DataFrame({
+            'course_id': self.course_ids,
+            'num_ratings': self.course_count,
+            'avg_rating': self.course_sum / np.maximum(self.course_count, 1),
+        })
+
+    def rating_histogram(self):
+        return pd.DataFrame({'rate': self.rate_values, 'count': self.rate_count})
+
+    def activity_histogram(self):
+        counts = np.flatnonzero(self.activity)
+        return pd.DataFrame({'num_ratings': counts, 'users': self.activity[counts]})
+
+    def category_distribution(self):
+        return pd.DataFrame({'category': self.categories, 'courses': self.category_count})
+
+    def save(self, store, key, meta=None):
+        store.save_arrays(AGGREGATES_ARTIFACT, key, {
+            'course_ids': self.course_ids, 'course_count': self.course_count,
+            'course_sum': self.course_sum, 'user_ids': self.user_ids, 'user_count': self.user_count,
+            'activity': self.activity, 'rate_values': self.rate_values, 'rate_count': self.rate_count,
+            'categories': self.categories, 'category_count': self.category_count,
+        }, dict(meta or {}, n_ratings=self.n_ratings))
+
+    # Массивы читаются через mmap; add_ratings работает с копиями
+    @classmethod
+    def load(cls, store, key):
+        arrays, _ = store.load_arrays(AGGREGATES_ARTIFACT, key, mmap_mode='r')
+        return cls(**arrays)
+
+
+# Ключ — ключи колоночных таблиц (путь, размер, mtime исходных CSV): проверка за O(1)
+def aggregates_key(ratings_path=RATINGS_PATH, courses_path=COURSES_PATH):
+    return artifact_key(source_key(ratings_path, 'ratings') + source_key(courses_path, 'courses'),
+                        {'format': AGGREGATES_FORMAT})
+
+
+def build_aggregates(ratings_path=RATINGS_PATH, courses_path=COURSES_PATH, store=None):
+    store = store or ArtifactStore()
+    df_ratings = ratings_table(ratings_path, store).to_frame(['user_id', 'course_id', 'rate'])
+    df_courses = courses_table(courses_path, store).to_frame(['course_id', 'category'])
+    aggregates = DashboardAggregates.build(df_ratings, df_courses)
+    aggregates.save(store, aggregates_key(ratings_path, courses_path), {'source': str(ratings_path)})
+    return aggregates
+
+
+# Готовые агрегаты; полный пересчёт — только если их ещё нет для текущих файлов
+def load_or_build_aggregates(ratings_path=RATINGS_PATH, courses_path=COURSES_PATH, store=None):
+    store = store or ArtifactStore()
+    key = aggregates_key(ratings_path, courses_path)
+    if store.exists(AGGREGATES_ARTIFACT, key):
+        return DashboardAggregates.load(store, key)
+    return build_aggregates(ratings_path, courses_path, store)
+
+
+# То, что страница «Обзор» считала на каждый показ, в лоб через pandas
+def _pandas_dashboard(ratings_df, courses_df):
+    course_ratings = ratings_df.groupby('course_id') \
+        .agg(num_ratings=('user_id', 'count'), avg_rating=('rate', 'mean')).reset_index()
+    top = course_ratings.merge(courses_df, on='course_id').sort_values('num_ratings', ascending=False).head(10)
+    return (ratings_df['user_id'].nunique(), courses_df['course_id'].nunique(), len(ratings_df), top,
+            ratings_df['rate'].value_counts(), courses_df['category'].value_counts())
+
+
+def _aggregates_dashboard(aggregates, courses_df):
+    top = aggregates.course_stats().merge(courses_df, on='course_id') \
+        .sort_values('num_ratings', ascending=False).head(10)
+    return (aggregates.n_users, courses_df['course_id'].nunique(), aggregates.n_ratings, top,
+            aggregates.rating_histogram(), aggregates.category_distribution())
+
+
+def _best_of(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def bench(sizes, batch_size=1000, courses_path=COURSES_PATH):
+    rows = []
+    for n_ratings in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ArtifactStore(tmp)
+            path = os.path.join(tmp, 'ratings.csv')
+            courses_df = courses_table(courses_path, store).to_frame()
+            write_synthetic_ratings(path, n_ratings, n_courses=len(courses_df))
+            # Курсы синтетики — позиции каталога, переводим в его course_id при чтении
+            ratings_df = ratings_table(path, store).to_frame(['user_id', 'course_id', 'rate'])
+            ratings_df['course_id'] = courses_df['course_id'].to_numpy()[ratings_df['course_id']]
+
+            started = time.perf_counter()
+            aggregates = DashboardAggregates.build(ratings_df, courses_df)
+            build_time = time.perf_counter() - started
+            key = f'bench{n_ratings}'
+            aggregates.save(store, key)
+
+            pandas_time = _best_of(lambda: _pandas_dashboard(ratings_df, courses_df))
+            page_time = _best_of(lambda: _aggregates_dashboard(DashboardAggregates.load(store, key),
+                                                               courses_df))
+            batch = ratings_df.sample(batch_size, random_state=0)
+            update_time = _best_of(lambda: DashboardAggregates.load(store, key).add_ratings(batch))
+            rows.append({
+                'ratings': n_ratings,
+                'pandas_page_ms': round(pandas_time * 1000, 2),
+                'aggregates_page_ms': round(page_time * 1000, 2),
+                'build_sec': round(build_time, 2),
+                f'add_{batch_size}_ms': round(update_time * 1000, 2),
+            })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Материализованные агрегаты страницы «Обзор»')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='пересчитать агрегаты по текущим CSV')
+    build_parser.add_argument('--ratings', default=str(RATINGS_PATH))
+    build_parser.add_argument('--courses', default=str(COURSES_PATH))
+    bench_parser = subparsers.add_parser('bench', help='агрегаты против pandas на каждый показ')
+    bench_parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    bench_parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        aggregates = build_aggregates(args.ratings, args.courses)
+        print(f'ratings: {aggregates.n_ratings}, users: {aggregates.n_users}, '
+              f'courses: {len(aggregates.course_ids)}')
+    else:
+        print(bench(args.sizes, args.batch_size).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+ARTIFACTS_DIR = Path(os.environ.get('REC_ARTIFACTS_DIR', BASE_DIR / 'artifacts'))
+
+# Меняется при изменении формата сохранения — старые артефакты перестают находиться
+ARTIFACT_VERSION = 1
+
+
+# Хэш содержимого таблицы (значения + названия колонок), не зависит от индекса
+def frame_hash(df, columns=None):
+    if columns is not None:
+        df = df[list(columns)]
+    h = hashlib.sha256()
+    h.update(json.dumps([str(c) for c in df.columns]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def artifact_key(data_hash, params):
+    payload = json.dumps({'version': ARTIFACT_VERSION, 'data': data_hash, 'params': params},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+# Каталог артефактов: <root>/<name>/<key>/ с .npy-массивами и meta.json
+class ArtifactStore:
+    def __init__(self, root=ARTIFACTS_DIR):
+        self.root = Path(root)
+
+    def path(self, name, key):
+        return self.root / name / key
+
+    def exists(self, name, key):
+        return (self.path(name, key) / 'meta.json').exists()
+
+    # Ключи артефактов name с префиксом prefix, по возрастанию
+    def keys(self, name, prefix=''):
+        return sorted(path.parent.name for path in (self.root / name).glob(f'{prefix}*/meta.json'))
+
+    def read_meta(self, name, key):
+        with open(self.path(name, key) / 'meta.json') as f:
+            return json.load(f)
+
+    # Запись во временный каталог и атомарное переименование: читатель
+    # никогда не увидит наполовину записанный артефакт
+    def write(self, name, key, writer, meta):
+        final = self.path(name, key)
+        tmp = final.parent / f'.tmp-{key}-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        try:
+            writer(tmp)
+            meta = dict(meta, version=ARTIFACT_VERSION, key=key, created_at=time.time())
+            with open(tmp / 'meta.json', 'w') as f:
+                json.dump(meta, f, indent=2, default=str)
+            shutil.rmtree(final, ignore_errors=True)
+            os.replace(tmp, final)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return final
+
+    def save_arrays(self, name, key, arrays, meta):
+        def writer(path):
+            for array_name, array in arrays.items():
+                np.save(path / f'{array_name}.npy', np.ascontiguousarray(array))
+        return self.write(name, key, writer, dict(meta, arrays=sorted(arrays)))
+
+    def load_arrays(self, name, key, mmap_mode='r'):
+        path = self.path(name, key)
+        meta = self.read_meta(name, key)
+        arrays = {
+            array_name: np.load(path / f'{array_name}.npy', mmap_mode=mmap_mode)
+            for array_name in meta['arrays']
+        }
+        return arrays, meta
+
+
+def _ratings_dataset(df_ratings):
+    from surprise import Dataset, Reader
+
+    reader = Reader(rating_scale=(1, 5))
+    return Dataset.load_from_df(df_ratings[['user_id', 'course_id', 'rate']], reader)
+
+
+def _restore_knn(params, trainset, arrays):
+    from surprise import KNNBaseline
+    from surprise.prediction_algorithms.knns import SymmetricAlgo
+
+    model = KNNBaseline(verbose=False, **params)
+    # Только дешёвая часть fit: trainset и xr/yr; базовые и similarity — из артефакта
+    SymmetricAlgo.fit(model, trainset)
+    model.bu, model.bi = arrays['bu'], arrays['bi']
+    model.bx, model.by = model.switch(model.bu, model.bi)
+    model.sim = arrays['sim']
+    return model
+
+
+# Повторная оценка пары заменяет прежнюю: в обучение и ключ идёт последняя
+def latest_ratings(df_ratings):
+    return df_ratings.drop_duplicates(['user_id', 'course_id'], keep='last')
+
+
+def knn_key(df_ratings, params):
+    return artifact_key(frame_hash(latest_ratings(df_ratings), ['user_id', 'course_id', 'rate']), params)
+
+
+# KNNBaseline из хранилища, если данные и гиперпараметры не менялись, иначе fit и сохранение.
+# Артефакт может быть записан инкрементальным обновлением (incremental.py, meta.incremental);
+# exact=True такой не принимает и переобучает модель полностью.
+def load_or_fit_knn(df_ratings, params, store=None, exact=False):
+    from surprise import KNNBaseline
+
+    store = store or ArtifactStore()
+    df_ratings = latest_ratings(df_ratings)
+    data_hash = frame_hash(df_ratings, ['user_id', 'course_id', 'rate'])
+    key = artifact_key(data_hash, params)
+    trainset = _ratings_dataset(df_ratings).build_full_trainset()
+    raw_users = np.array([trainset.to_raw_uid(u) for u in trainset.all_users()])
+    raw_items = np.array([trainset.to_raw_iid(i) for i in trainset.all_items()])
+
+    if store.exists('knn', key) and not (exact and store.read_meta('knn', key).get('incremental')):
+        try:
+            arrays, _ = store.load_arrays('knn', key)
+            if (np.array_equal(arrays['raw_user_ids'], raw_users)
+                    and np.array_equal(arrays['raw_item_ids'], raw_items)):
+                return _restore_knn(params, trainset, arrays)
+            logger.warning('knn artifact %s: id mapping mismatch, refitting', key)
+        except Exception:
+            logger.exception('knn artifact %s is unreadable, refitting', key)
+
+    model = KNNBaseline(**params)
+    model.fit(trainset)
+    store.save_arrays('knn', key, {
+        'sim': model.sim,
+        'bu': model.bu,
+        'bi': model.bi,
+        'raw_user_ids': raw_users,
+        'raw_item_ids': raw_items,
+    }, {'params': params, 'data_hash': data_hash})
+    return model
+
+
+# Артефакт name с теми же params, построенный по начальному отрезку texts (meta n_texts):
+# (ключ, число текстов) самого длинного такого отрезка или None. Тексты, дописанные в конец,
+# не требуют пересчитывать то, что посчитано по началу
+def find_prefix_artifact(store, name, texts, params):
+    texts = pd.Series(texts)
+    found = None
+    for key in store.keys(name):
+        meta = store.read_meta(name, key)
+        n_texts = meta.get('n_texts')
+        if n_texts is None or n_texts > len(texts) or (found and n_texts <= found[1]):
+            continue
+        if meta.get('params') == params and \
+                frame_hash(texts.iloc[:n_texts].to_frame('text')) == meta['data_hash']:
+            found = (key, n_texts)
+    return found
+
+
+# Doc2Vec из хранилища (mmap), иначе обучение на build_documents() и сохранение.
+# texts — тексты документов в порядке тегов, по ним считается ключ. Курсы, дописанные в конец
+# каталога после обучения, модель не переобучают: берётся модель, обученная на начале
+# каталога (model.corpus_count строк), векторы новых строк — coldstart.load_or_embed_added_courses
+def load_or_train_doc2vec(texts, build_documents, params, store=None):
+    from gensim.models import Doc2Vec
+
+    store = store or ArtifactStore()
+    texts = pd.Series(texts)
+    data_hash = frame_hash(texts.to_frame('text'))
+    key = artifact_key(data_hash, params)
+    model_file = 'doc2vec.model'
+
+    load_key = key
+    if not store.exists('doc2vec', key):
+        found = find_prefix_artifact(store, 'doc2vec', texts, params)
+        if found is not None:
+            load_key = found[0]
+            logger.info('doc2vec: %d courses appended after training, reusing artifact %s',
+                        len(texts) - found[1], load_key)
+    if store.exists('doc2vec', load_key):
+        try:
+            return Doc2Vec.load(str(store.path('doc2vec', load_key) / model_file), mmap='r')
+        except Exception:
+            logger.exception('doc2vec artifact %s is unreadable, retraining', load_key)
+
+    # doc2vec_model.model из репозитория не используется: по нему нельзя проверить, на каких
+    # текстах он обучен. Подготовка документов и обучение меряются отдельно (docs/sec в meta)
+    speed = {}
+    started = time.perf_counter()
+    documents = build_documents()
+    speed['preprocess_docs_per_sec'] = len(texts) / max(time.perf_counter() - started, 1e-9)
+    started = time.perf_counter()
+    model = Doc2Vec(**params)
+    model.build_vocab(documents)
+    model.train(documents, total_examples=model.corpus_count, epochs=model.epochs)
+    speed['train_docs_per_sec'] = len(texts) * model.epochs / max(time.perf_counter() - started, 1e-9)
+    logger.info('doc2vec: preprocess %.0f docs/sec, train %.0f docs/sec (docs x epochs)',
+                speed['preprocess_docs_per_sec'], speed['train_docs_per_sec'])
+
+    store.write('doc2vec', key, lambda path: model.save(str(path / model_file)),
+                dict({'params': params, 'data_hash': data_hash, 'n_texts': len(texts)}, **speed))
+    return model
@@ -0,0 +1,156 @@
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from artifacts import ArtifactStore, artifact_key, frame_hash
+from recommender import (CF_WEIGHT, CONTENT_WEIGHT, COURSES_PATH, DOC2VEC_PARAMS, N_CANDIDATES,
+                         RATINGS_PATH, HybridRecommender, add_description, cf_params,
+                         load_cf_model, load_doc2vec_model, read_data)
+
+TOPK_ARTIFACT = 'topk'
+DEFAULT_TOP_K = 20
+
+
+# Ключ хранилища: данные + конфигурация моделей. top_k в ключ не входит — он в meta,
+# чтобы страница находила хранилище, не зная, с каким K его считали.
+def topk_key(df_ratings, df_courses, n_candidates=N_CANDIDATES):
+    data_hash = frame_hash(df_ratings, ['user_id', 'course_id', 'rate']) + \
+        frame_hash(df_courses, ['course_id', 'description'])
+    return artifact_key(data_hash, dict(
+        cf_params(), doc2vec=DOC2VEC_PARAMS, n_candidates=n_candidates,
+        weights=[CF_WEIGHT, CONTENT_WEIGHT],
+    ))
+
+
+# Офлайн top-K: отсортированные user_ids и матрицы фиксированной ширины
+# (позиции курсов в df_courses, -1 — пусто; score float32)
+class TopKStore:
+    def __init__(self, user_ids, course_rows, scores, meta=None):
+        self.user_ids = user_ids
+        self.course_rows = course_rows
+        self.scores = scores
+        self.meta = meta or {}
+        self.k = course_rows.shape[1]
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    # (позиции курсов, score) или None, если пользователя нет или K не хватает
+    def get(self, user_id, top_k):
+        if top_k > self.k:
+            return None
+        pos = np.searchsorted(self.user_ids, user_id)
+        if pos >= len(self.user_ids) or self.user_ids[pos] != user_id:
+            return None
+        rows = np.asarray(self.course_rows[pos, :top_k])
+        valid = rows >= 0
+        return rows[valid], np.asarray(self.scores[pos, :top_k])[valid]
+
+    def save(self, store, key):
+        store.save_arrays(TOPK_ARTIFACT, key, {
+            'user_ids': self.user_ids,
+            'course_rows': self.course_rows,
+            'scores': self.scores,
+        }, self.meta)
+
+    @classmethod
+    def load(cls, store, key):
+        arrays, meta = store.load_arrays(TOPK_ARTIFACT, key, mmap_mode='r')
+        return cls(arrays['user_ids'], arrays['course_rows'], arrays['scores'], meta)
+
+
+def load_topk_store(df_ratings, df_courses, store=None):
+    store = store or ArtifactStore()
+    key = topk_key(df_ratings, df_courses)
+    if not store.exists(TOPK_ARTIFACT, key):
+        return None
+    return TopKStore.load(store, key)
+
+
+_worker_recommender = None
+
+
+# Каждый воркер поднимает свой рекомендатель; модели читаются из артефактов через mmap
+def _init_worker(ratings_path, courses_path):
+    global _worker_recommender
+    df_ratings, df_courses = read_data(ratings_path, courses_path)
+    add_description(df_courses)
+    _worker_recommender = HybridRecommender(
+        cf_model=load_cf_model(df_ratings),
+        doc2vec_model=load_doc2vec_model(df_courses),
+        df_courses=df_courses,
+        df_ratings=df_ratings
+    )
+
+
+def _score_chunk(args):
+    user_ids, top_k = args
+    rec = _worker_recommender
+    rows = np.full((len(user_ids), top_k), -1, dtype=np.int32)
+    scores = np.zeros((len(user_ids), top_k), dtype=np.float32)
+    for i, user_id in enumerate(user_ids):
+        course_ids, user_scores = rec.recommend_ids(user_id, top_k)
+        n = len(course_ids)
+        rows[i, :n] = rec.course_index.get_indexer(course_ids)
+        scores[i, :n] = user_scores
+    return rows, scores
+
+
+def run_batch(top_k=DEFAULT_TOP_K, workers=None, chunk_size=256,
+              ratings_path=RATINGS_PATH, courses_path=COURSES_PATH, store=None):
+    started = time.perf_counter()
+    store = store or ArtifactStore()
+    df_ratings, df_courses = read_data(ratings_path, courses_path)
+    add_description(df_courses)
+    # Модели обучаются (если нужно) в родителе один раз, воркеры только читают артефакты
+    load_doc2vec_model(df_courses)
+    load_cf_model(df_ratings)
+
+    user_ids = np.unique(df_ratings['user_id'].to_numpy())
+    n_chunks = max(1, math.ceil(len(user_ids) / chunk_size))
+    chunks = [(chunk, top_k) for chunk in np.array_split(user_ids, n_chunks)]
+    workers = workers or os.cpu_count()
+
+    scoring_started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(ratings_path, courses_path)) as pool:
+        results = list(pool.map(_score_chunk, chunks))
+    scoring_time = time.perf_counter() - scoring_started
+
+    course_rows = np.concatenate([rows for rows, _ in results])
+    scores = np.concatenate([s for _, s in results])
+    wall_time = time.perf_counter() - started
+    stats = {
+        'users': int(len(user_ids)),
+        'top_k': top_k,
+        'workers': workers,
+        'scoring_time_sec': round(scoring_time, 3),
+        'wall_time_sec': round(wall_time, 3),
+        'users_per_sec': round(len(user_ids) / scoring_time, 1) if scoring_time > 0 else None,
+    }
+    topk = TopKStore(user_ids, course_rows, scores, stats)
+    topk.save(store, topk_key(df_ratings, df_courses))
+    return topk, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Офлайн-расчёт гибридного top-K для всех пользователей')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--ratings', default=str(RATINGS_PATH))
+    parser.add_argument('--courses', default=str(COURSES_PATH))
+    args = parser.parse_args()
+
+    _, stats = run_batch(args.top_k, args.workers, args.chunk_size, args.ratings, args.courses)
+    print(f"users: {stats['users']}, workers: {stats['workers']}, top_k: {stats['top_k']}")
+    print(f"scoring: {stats['scoring_time_sec']:.2f}s ({stats['users_per_sec']} users/sec), "
+          f"wall time: {stats['wall_time_sec']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
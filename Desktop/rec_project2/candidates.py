@@ -0,0 +1,89 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from scoring import user_profile
+
+
+# Дешёвый пул кандидатов без прохода KNN по каталогу:
+# ближайшие к профилю пользователя курсы + популярное в его категориях + новинки.
+# Всё, что зависит только от каталога, считается один раз при создании.
+class CandidatePool:
+    def __init__(self, df_courses, embeddings, vector_index, n_profile=50, n_popular=10,
+                 n_recent=20):
+        self.embeddings = embeddings
+        self.vector_index = vector_index
+        self.n_profile = n_profile
+        self.n_popular = n_popular
+        self.n_recent = n_recent
+
+        if 'num_subscribers' in df_courses:
+            popularity = pd.to_numeric(df_courses['num_subscribers'], errors='coerce')
+            popularity = popularity.fillna(0).to_numpy()
+        else:
+            popularity = np.zeros(len(df_courses))
+        if 'category' in df_courses:
+            self.category_codes, categories = pd.factorize(df_courses['category'].astype(object).fillna(''))
+        else:
+            self.category_codes, categories = np.zeros(len(df_courses), dtype=np.int64), ['']
+
+        # Популярные курсы каждой категории (по num_subscribers) и всего каталога
+        by_popularity = np.argsort(-popularity, kind='stable')
+        self.global_popular = by_popularity[:n_popular]
+        codes_sorted = self.category_codes[by_popularity]
+        grouped = by_popularity[np.argsort(codes_sorted, kind='stable')]
+        bounds = np.cumsum(np.bincount(codes_sorted, minlength=len(categories)))[:-1]
+        self.category_popular = [rows[:n_popular] for rows in np.split(grouped, bounds)]
+
+        # Самые свежие курсы по published_time (без даты — в конце)
+        if 'published_time' in df_courses:
+            published = pd.to_datetime(df_courses['published_time'], errors='coerce')
+            order = np.argsort(-published.fillna(pd.Timestamp.min).astype('int64').to_numpy(),
+                               kind='stable')
+        else:
+            order = np.arange(len(df_courses))
+        self.recent = order
+
+    # Позиции курсов-кандидатов в df_courses, без уже оценённых пользователем.
+    # profile — готовый профиль (profiles.py); без него — среднее по истории.
+    def get(self, history_rows, profile=None):
+        history_rows = np.asarray(history_rows, dtype=np.int64)
+        parts = [self.recent[:self.n_recent + len(history_rows)]]
+
+        if profile is None:
+            profile = user_profile(self.embeddings, history_rows)
+        if profile is not None:
+            rows, _ = self.vector_index.query(profile, self.n_profile + len(history_rows))
+            parts.append(rows[rows >= 0])
+
+        codes = np.unique(self.category_codes[history_rows]) if len(history_rows) else []
+        if len(codes):
+            parts.extend(self.category_popular[code] for code in codes)
+        else:
+            parts.append(self.global_popular)
+
+        pool = np.unique(np.concatenate(parts).astype(np.int64))
+        return pool[~np.isin(pool, history_rows)]
+
+
+# Сравнение режимов отбора кандидатов на общем временном срезе (evaluation.py)
+def compare_candidate_modes(modes=('cf', 'item', 'content'), k=10, test_ratio=0.2):
+    from evaluation import HybridModel, evaluate
+
+    results = evaluate([HybridModel(mode) for mode in modes], k=k, test_ratio=test_ratio,
+                       split='global')
+    return results[['Model', f'Precision@{k}', f'Recall@{k}', f'NDCG@{k}',
+                    'latency_ms_p50', 'latency_ms_p95', 'latency_ms_p99']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение режимов отбора кандидатов')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--test-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+    print(compare_candidate_modes(k=args.k, test_ratio=args.test_ratio).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
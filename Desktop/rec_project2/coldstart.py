@@ -0,0 +1,209 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from artifacts import ArtifactStore, artifact_key, find_prefix_artifact, frame_hash
+from scoring import build_embedding_matrix
+
+ADDED_COURSES_ARTIFACT = 'added_course_vectors'
+# Вклад популярности (подписчики), качества (рейтинг) и числа отзывов в score
+POPULARITY_WEIGHTS = {'subscribers': 0.4, 'rating': 0.4, 'reviews': 0.2}
+# Рейтинг курса сглаживается к среднему по каталогу как при таком числе отзывов:
+# 4.9 по пяти отзывам не обгоняет 4.7 по тысяче
+RATING_PRIOR_REVIEWS = 50
+
+
+def _column(df_courses, name):
+    if name not in df_courses:
+        return np.zeros(len(df_courses))
+    return pd.to_numeric(df_courses[name], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+
+def _minmax(values):
+    span = values.max() - values.min() if len(values) else 0
+    return (values - values.min()) / span if span > 0 else np.zeros_like(values)
+
+
+# Ранжирование каталога для пользователей без истории: num_subscribers, сглаженный
+# avg_rating и num_reviews из каталога, без обращения к моделям. Порядок по всему
+# каталогу и внутри каждой категории считается один раз
+class PopularityRanking:
+    def __init__(self, df_courses, weights=POPULARITY_WEIGHTS, prior_reviews=RATING_PRIOR_REVIEWS):
+        subscribers = np.log1p(_column(df_courses, 'num_subscribers'))
+        reviews = _column(df_courses, 'num_reviews')
+        rating = _column(df_courses, 'avg_rating')
+        rated = reviews > 0
+        mean_rating = np.average(rating[rated], weights=reviews[rated]) if rated.any() else 0.0
+        rating = (rating * reviews + mean_rating * prior_reviews) / (reviews + prior_reviews)
+        self.scores = (weights['subscribers'] * _minmax(subscribers)
+                       + weights['rating'] * _minmax(rating)
+                       + weights['reviews'] * _minmax(np.log1p(reviews))).astype(np.float32)
+        self.order = np.argsort(-self.scores, kind='stable')
+        if 'category' in df_courses:
+            categories = df_courses['category'].astype(str).to_numpy()[self.order]
+            self.category_order = {category: self.order[categories == category]
+                                   for category in pd.unique(categories)}
+        else:
+            self.category_order = {}
+
+    @property
+    def categories(self):
+        return sorted(self.category_order)
+
+    # Позиции курсов в df_courses и их score; неизвестная категория — пустой результат.
+    # mask — допустимые строки (фильтры атрибутов, filters.py)
+    def top(self, top_k=10, category=None, exclude_rows=None, mask=None):
+        order = self.order if category is None else self.category_order.get(category, self.order[:0])
+        if mask is not None:
+            order = order[mask[order]]
+        if exclude_rows is not None and len(exclude_rows):
+            order = order[~np.isin(order, exclude_rows)]
+        rows = order[:top_k]
+        return rows, self.scores[rows]
+
+
+# Популярное в виде кадра рекомендаций (колонки df_courses и score) — без рекомендателя,
+# пока модели ещё загружаются (см. warmup.py)
+def popular_frame(ranking, df_courses, top_k=10, category=None, mask=None):
+    rows, scores = ranking.top(top_k, category, mask=mask)
+    return df_courses.iloc[rows].assign(score=scores).reset_index(drop=True)
+
+
+# Векторы новых курсов в пространстве Doc2Vec без переобучения (L2-нормированные,
+# как строки build_embedding_matrix); токены описаний — через кэш text_pipeline
+def embed_courses(doc2vec_model, descriptions, cache=None):
+    from text_pipeline import infer_vectors
+
+    vectors = infer_vectors(doc2vec_model, list(descriptions), cache)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+# Векторы курсов, дописанных в каталог после обучения Doc2Vec. infer_vector случаен, поэтому
+# векторы считаются один раз и хранятся артефактом (ключ — тексты и векторы модели); при
+# следующем дописывании считаются только строки, которых ещё нет в артефакте
+def load_or_embed_added_courses(doc2vec_model, descriptions, store=None, cache=None):
+    store = store or ArtifactStore()
+    texts = pd.Series(descriptions).reset_index(drop=True)
+    params = {'model': frame_hash(pd.DataFrame(doc2vec_model.dv.vectors))}
+    data_hash = frame_hash(texts.to_frame('text'))
+    key = artifact_key(data_hash, params)
+    if store.exists(ADDED_COURSES_ARTIFACT, key):
+        return np.array(store.load_arrays(ADDED_COURSES_ARTIFACT, key)[0]['vectors'])
+
+    known = np.zeros((0, doc2vec_model.vector_size), dtype=np.float32)
+    found = find_prefix_artifact(store, ADDED_COURSES_ARTIFACT, texts, params)
+    if found is not None:
+        known = store.load_arrays(ADDED_COURSES_ARTIFACT, found[0])[0]['vectors']
+    vectors = np.concatenate([known, embed_courses(doc2vec_model, texts.iloc[len(known):], cache)])
+    store.save_arrays(ADDED_COURSES_ARTIFACT, key, {'vectors': vectors},
+                      {'params': params, 'data_hash': data_hash, 'n_texts': len(texts)})
+    return vectors
+
+
+# Векторы всего каталога (строки df_courses): обученные строки модели и векторы курсов,
+# дописанных после обучения (model.corpus_count — число строк, на которых она обучена)
+def course_embeddings(doc2vec_model, df_courses, store=None, cache=None):
+    embeddings = build_embedding_matrix(doc2vec_model, len(df_courses))
+    n_trained = doc2vec_model.corpus_count
+    if len(df_courses) > n_trained:
+        embeddings[n_trained:] = load_or_embed_added_courses(
+            doc2vec_model, df_courses['description'].iloc[n_trained:], store, cache)
+    return embeddings
+
+
+# Приём новых курсов: строки дописываются в CSV каталога, модель Doc2Vec не переобучается,
+# векторы новых курсов считаются и сохраняются сразу (следующий старт их только читает)
+def ingest_courses(new_path, courses_path=None, store=None):
+    from dataset import COURSES_PATH, load_courses
+    from recommender import load_doc2vec_model
+
+    courses_path = courses_path or COURSES_PATH
+    store = store or ArtifactStore()
+    columns = pd.read_csv(courses_path, nrows=0).columns
+    known_ids = set(load_courses(courses_path, columns=['course_id'], store=store)['course_id'])
+    df_new = pd.read_csv(new_path)
+    df_new = df_new[~df_new['course_id'].isin(known_ids)].drop_duplicates('course_id')
+    if df_new.empty:
+        return 0
+    df_new.reindex(columns=columns).to_csv(courses_path, mode='a', header=False, index=False)
+    df_courses = load_courses(courses_path, store=store)
+    course_embeddings(load_doc2vec_model(df_courses, store=store), df_courses, store)
+    return len(df_new)
+
+
+# Холодный путь против полного для неизвестного пользователя и добавление курсов
+# через infer_vector против переобучения Doc2Vec
+def bench(n_requests=200, n_new_courses=100):
+    from gensim.models import Doc2Vec
+    from recommender import (DOC2VEC_PARAMS, HybridRecommender, build_documents, load_doc2vec_model,
+                             load_knn_model, read_data)
+
+    df_ratings, df_courses = read_data()
+    recommender = HybridRecommender(load_knn_model(df_ratings), load_doc2vec_model(df_courses),
+                                    df_courses, df_ratings)
+    new_user = df_ratings['user_id'].max() + 1
+    rows = []
+    for name, func in [('popular_ids', lambda: recommender.popular_ids(10)),
+                       ('full KNN path (recommend_ids)', lambda: recommender.recommend_ids(new_user)),
+                       ('recommend() end to end', lambda: recommender.recommend(new_user))]:
+        started = time.perf_counter()
+        for _ in range(n_requests):
+            func()
+        rows.append((f'unknown user: {name}', (time.perf_counter() - started) / n_requests * 1000))
+
+    new_courses = df_courses.sample(n_new_courses, replace=True, random_state=0).assign(
+        course_id=lambda df: df_courses['course_id'].max() + 1 + np.arange(len(df)),
+        num_subscribers=0, num_reviews=0)
+    new_courses['description'] = new_courses['description'] + ' new edition'
+    from text_pipeline import TokenCache
+
+    cache = TokenCache()
+    cache.rows(new_courses['description'].tolist())
+    started = time.perf_counter()
+    recommender.add_courses(new_courses, cache)
+    rows.append((f'add {n_new_courses} courses (infer_vector)', (time.perf_counter() - started) * 1000))
+
+    started = time.perf_counter()
+    documents = list(build_documents(recommender.df_courses))
+    model = Doc2Vec(**DOC2VEC_PARAMS)
+    model.build_vocab(documents)
+    model.train(documents, total_examples=model.corpus_count, epochs=model.epochs)
+    rows.append(('retrain Doc2Vec on the catalog', (time.perf_counter() - started) * 1000))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Холодный старт: популярное и новые курсы')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    top_parser = subparsers.add_parser('top', help='ранжирование для нового пользователя')
+    top_parser.add_argument('--k', type=int, default=10)
+    top_parser.add_argument('--category', default=None)
+    bench_parser = subparsers.add_parser('bench', help='холодный путь против полного')
+    bench_parser.add_argument('--requests', type=int, default=200)
+    bench_parser.add_argument('--new-courses', type=int, default=100)
+    add_parser = subparsers.add_parser('add', help='дописать новые курсы из CSV в каталог')
+    add_parser.add_argument('new_courses')
+    add_parser.add_argument('--courses', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'top':
+        from dataset import load_courses
+
+        df_courses = load_courses()
+        rows, scores = PopularityRanking(df_courses).top(args.k, args.category)
+        result = df_courses.iloc[rows][['course_id', 'title', 'category', 'num_subscribers',
+                                        'avg_rating', 'num_reviews']].assign(score=scores)
+        print(result.to_string(index=False))
+    elif args.command == 'add':
+        print(f'добавлено курсов: {ingest_courses(args.new_courses, args.courses)}')
+    else:
+        for name, ms in bench(args.requests, args.new_courses):
+            print(f'{name:<45} {ms:>10.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
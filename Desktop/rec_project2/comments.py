@@ -0,0 +1,179 @@
+import argparse
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from artifacts import BASE_DIR, ArtifactStore, artifact_key, frame_hash
+from recommender import COURSES_PATH, DOC2VEC_PARAMS, add_description, load_doc2vec_model, read_data
+from text_pipeline import preprocess_text
+
+COMMENTS_PATH = BASE_DIR / 'users.csv'
+COMMENTS_ARTIFACT = 'comments'
+DEFAULT_BATCH_SIZE = 512
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+_infer_state = {}
+
+
+def _infer_batch(texts):
+    model = _infer_state['model']
+    out = np.zeros((len(texts), model.vector_size), dtype=np.float32)
+    for pos, text in enumerate(texts):
+        tokens = preprocess_text(text) if isinstance(text, str) else []
+        if tokens:
+            out[pos] = model.infer_vector(tokens)
+    return out
+
+
+# infer_vector для всех комментариев батчами; батчи считаются в форкнутых процессах,
+# модель наследуется без копирования. Пустой комментарий — нулевой вектор.
+def infer_comment_vectors(doc2vec_model, texts, batch_size=DEFAULT_BATCH_SIZE, n_jobs=-1):
+    texts = list(texts)
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    if not batches:
+        return np.zeros((0, doc2vec_model.vector_size), dtype=np.float32)
+    _infer_state['model'] = doc2vec_model
+    try:
+        if n_jobs != 1 and len(batches) > 1 and 'fork' in mp.get_all_start_methods():
+            with ProcessPoolExecutor(max_workers=n_jobs if n_jobs > 0 else None,
+                                     mp_context=mp.get_context('fork')) as pool:
+                results = list(pool.map(_infer_batch, batches))
+        else:
+            results = [_infer_batch(batch) for batch in batches]
+    finally:
+        _infer_state.clear()
+    return np.concatenate(results)
+
+
+# Векторы отзывов: нормированное среднее векторов комментариев пользователя и курса
+# (строки курсов выровнены по df_courses, без отзывов — нули)
+class CommentVectors:
+    def __init__(self, user_ids, user_vectors, course_vectors):
+        self.user_ids = user_ids
+        self.user_vectors = user_vectors
+        self.course_vectors = course_vectors
+        self.user_to_row = {uid: row for row, uid in enumerate(np.asarray(user_ids).tolist())}
+
+    @classmethod
+    def build(cls, df_comments, course_index, comment_vectors):
+        comment_vectors = _normalize_rows(np.asarray(comment_vectors, dtype=np.float32).copy())
+        user_ids, user_rows = np.unique(df_comments['user_id'].to_numpy(), return_inverse=True)
+        user_vectors = np.zeros((len(user_ids), comment_vectors.shape[1]), dtype=np.float32)
+        np.add.at(user_vectors, user_rows, comment_vectors)
+
+        course_rows = course_index.get_indexer(df_comments['course_id'])
+        known = course_rows >= 0
+        course_vectors = np.zeros((len(course_index), comment_vectors.shape[1]), dtype=np.float32)
+        np.add.at(course_vectors, course_rows[known], comment_vectors[known])
+        return cls(user_ids, _normalize_rows(user_vectors), _normalize_rows(course_vectors))
+
+    # Новые курсы в конце df_courses: отзывов у них ещё нет
+    def add_courses(self, n_courses):
+        self.course_vectors = np.concatenate([
+            self.course_vectors, np.zeros((n_courses, self.course_vectors.shape[1]), dtype=np.float32)])
+
+    # Косинус отзывов пользователя к отзывам на кандидатов (-1 или нет отзывов — 0)
+    def scores(self, user_id, candidate_rows):
+        candidate_rows = np.asarray(candidate_rows)
+        scores = np.zeros(len(candidate_rows), dtype=np.float32)
+        row = self.user_to_row.get(user_id)
+        if row is None:
+            return scores
+        known = candidate_rows >= 0
+        scores[known] = self.course_vectors[candidate_rows[known]] @ self.user_vectors[row]
+        return scores
+
+    # То же для нескольких пользователей: candidate_rows — матрица (пользователи x кандидаты)
+    def score_matrix(self, user_ids, candidate_rows):
+        candidate_rows = np.asarray(candidate_rows)
+        user_vectors = np.zeros((len(user_ids), self.user_vectors.shape[1]), dtype=np.float32)
+        for pos, user_id in enumerate(user_ids):
+            row = self.user_to_row.get(user_id)
+            if row is not None:
+                user_vectors[pos] = self.user_vectors[row]
+        scores = np.einsum('ucd,ud->uc', self.course_vectors[np.maximum(candidate_rows, 0)],
+                           user_vectors)
+        scores[candidate_rows < 0] = 0
+        return scores
+
+    def save(self, store, key, meta):
+        store.save_arrays(COMMENTS_ARTIFACT, key, {
+            'user_ids': self.user_ids,
+            'user_vectors': self.user_vectors,
+            'course_vectors': self.course_vectors,
+        }, meta)
+
+    @classmethod
+    def load(cls, store, key):
+        arrays, _ = store.load_arrays(COMMENTS_ARTIFACT, key, mmap_mode='r')
+        return cls(arrays['user_ids'], arrays['user_vectors'], arrays['course_vectors'])
+
+
+# Ключ: отзывы + каталог с описаниями + параметры Doc2Vec (векторы зависят от модели)
+def comments_key(df_comments, df_courses):
+    data_hash = frame_hash(df_comments, ['user_id', 'course_id', 'comment']) + \
+        frame_hash(df_courses, ['course_id', 'description'])
+    return artifact_key(data_hash, {'doc2vec': DOC2VEC_PARAMS})
+
+
+def read_comments(comments_path=COMMENTS_PATH):
+    df_comments = pd.read_csv(comments_path)
+    if 'userId' in df_comments.columns:
+        df_comments = df_comments.rename(columns={'userId': 'user_id'})
+    return df_comments
+
+
+# Готовые векторы отзывов или None, если офлайн-стадия ещё не запускалась
+def load_comment_vectors(df_courses, comments_path=COMMENTS_PATH, store=None):
+    store = store or ArtifactStore()
+    key = comments_key(read_comments(comments_path), df_courses)
+    if not store.exists(COMMENTS_ARTIFACT, key):
+        return None
+    return CommentVectors.load(store, key)
+
+
+def build_comment_vectors(comments_path=COMMENTS_PATH, courses_path=COURSES_PATH,
+                          batch_size=DEFAULT_BATCH_SIZE, n_jobs=-1, store=None):
+    store = store or ArtifactStore()
+    df_comments = read_comments(comments_path)
+    df_courses = add_description(read_data(courses_path=courses_path)[1])
+    doc2vec_model = load_doc2vec_model(df_courses)
+
+    started = time.perf_counter()
+    vectors = infer_comment_vectors(doc2vec_model, df_comments['comment'], batch_size, n_jobs)
+    infer_time = time.perf_counter() - started
+    comment_vectors = CommentVectors.build(df_comments, pd.Index(df_courses['course_id']), vectors)
+    stats = {
+        'comments': len(df_comments),
+        'users': len(comment_vectors.user_ids),
+        'infer_time_sec': round(infer_time, 3),
+        'comments_per_sec': round(len(df_comments) / infer_time, 1) if infer_time > 0 else None,
+    }
+    comment_vectors.save(store, comments_key(df_comments, df_courses), stats)
+    return comment_vectors, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Офлайн-расчёт векторов отзывов (users.csv)')
+    parser.add_argument('--comments', default=str(COMMENTS_PATH))
+    parser.add_argument('--courses', default=str(COURSES_PATH))
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    args = parser.parse_args()
+
+    _, stats = build_comment_vectors(args.comments, args.courses, args.batch_size, args.n_jobs)
+    print(f"comments: {stats['comments']}, users: {stats['users']}")
+    print(f"infer: {stats['infer_time_sec']:.2f}s ({stats['comments_per_sec']} comments/sec)")
+
+
+if __name__ == '__main__':
+    main()
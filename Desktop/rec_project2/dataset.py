@@ -0,0 +1,373 @@
+import argparse
+import os
+import platform
+import multiprocessing as mp
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from artifacts import BASE_DIR, ArtifactStore, artifact_key
+
+RATINGS_PATH = BASE_DIR / 'df_ratings.csv'
+COURSES_PATH = BASE_DIR / 'info2022_final.csv'
+
+DATASET_ARTIFACT = 'dataset'
+# Меняется при изменении правил конвертации — старые таблицы перестают находиться
+DATASET_FORMAT = 1
+CHUNK_SIZE = 1_000_000
+
+ID_COLUMNS = ['user_id', 'course_id']
+CATEGORICAL_COLUMNS = ['category', 'subcategory', 'topic']
+DATE_COLUMNS = ['date', 'published_time', 'last_update_date']
+RENAMES = {'userId': 'user_id', 'Course ID': 'course_id', 'Course title': 'title', 'rating': 'rate'}
+
+# Колоночный слой данных: CSV один раз конвертируется в набор .npy по колонке
+# (ArtifactStore, ключ — путь, размер и mtime файла), страницы читают через mmap
+# только нужные колонки. Типы: id — int32, rate — uint8 (целые оценки) или float32,
+# category/subcategory/topic — category, даты — datetime64[s], остальные числа — 32 бита,
+# строки — utf-8 буфер + смещения. У каталога заранее посчитаны description и токены.
+# Скорость и память на синтетике нужного объёма: python dataset.py bench --rows 10000000
+# (10M оценок, seed 0, best of 1; python 3.11.7, numpy 2.4.6, pandas 3.0.6, 1 CPU;
+# пиковый RSS простаивающего форка — 108.6 MB):
+#   read_csv              6.55s   кадр 400.5 MB   пиковый RSS 734.8 MB
+#   конвертация (раз)    10.14s                   пиковый RSS 848.3 MB
+#   колоночная загрузка   0.004s  кадр 162.1 MB   пиковый RSS 116.0 MB
+#   только user_id+rate           кадр  47.7 MB
+
+
+def _int_array(values):
+    values = np.asarray(values)
+    if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and
+                            values.max() <= np.iinfo(np.int32).max):
+        return values.astype(np.int32)
+    return values.astype(np.int64)
+
+
+def _rate_array(values):
+    values = np.asarray(values, dtype=np.float64)
+    if np.all((values == np.round(values)) & (values >= 0) & (values <= 255)):
+        return values.astype(np.uint8)
+    return values.astype(np.float32)
+
+
+def _string_arrays(values):
+    values = pd.Series(values, dtype=object)
+    missing = values.isna().to_numpy()
+    encoded = [b'' if skip else str(value).encode() for value, skip in zip(values, missing)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return data, offsets, missing
+
+
+def _decode_strings(data, offsets):
+    buffer = np.asarray(data).tobytes()
+    return [buffer[start:end].decode() for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+# Колонка -> (вид, массивы). Вид хранится в meta и определяет обратное преобразование
+def _encode_column(name, values):
+    if name in ID_COLUMNS:
+        return 'numeric', {name: _int_array(values)}
+    if name == 'rate':
+        return 'numeric', {name: _rate_array(values)}
+    if name in DATE_COLUMNS:
+        dates = pd.to_datetime(pd.Series(values), errors='coerce')
+        return 'datetime', {name: dates.to_numpy(dtype='datetime64[s]')}
+    values = pd.Series(values)
+    if pd.api.types.is_bool_dtype(values):
+        return 'numeric', {name: values.to_numpy(dtype=bool)}
+    if pd.api.types.is_integer_dtype(values):
+        return 'numeric', {name: _int_array(values.to_numpy())}
+    if pd.api.types.is_float_dtype(values):
+        return 'numeric', {name: values.to_numpy(dtype=np.float32)}
+    if name in CATEGORICAL_COLUMNS:
+        codes, categories = pd.factorize(values)
+        code_dtype = np.int8 if len(categories) < 127 else np.int16 if len(categories) < 32767 else np.int32
+        data, offsets, _ = _string_arrays(categories)
+        return 'category', {f'{name}.codes': codes.astype(code_dtype),
+                            f'{name}.data': data, f'{name}.offsets': offsets}
+    data, offsets, missing = _string_arrays(values)
+    arrays = {f'{name}.data': data, f'{name}.offsets': offsets}
+    if missing.any():
+        arrays[f'{name}.missing'] = missing
+    return 'string', arrays
+
+
+def _read_csv(path):
+    df = pd.read_csv(path)
+    return df.rename(columns={old: new for old, new in RENAMES.items() if old in df.columns
+                              and new not in df.columns})
+
+
+# Оценки читаются кусками: в памяти одновременно кусок CSV и уже сжатые колонки
+def _convert_ratings(path):
+    parts = {}
+    for chunk in pd.read_csv(path, chunksize=CHUNK_SIZE):
+        chunk = chunk.rename(columns={old: new for old, new in RENAMES.items()
+                                      if old in chunk.columns and new not in chunk.columns})
+        for name in chunk.columns:
+            if name in DATE_COLUMNS:
+                values = pd.to_datetime(chunk[name], format='ISO8601', errors='coerce').to_numpy(dtype='datetime64[s]')
+            elif name in ID_COLUMNS or name == 'rate':
+                values = chunk[name].to_numpy()
+            else:
+                values = chunk[name].to_numpy(dtype=object)
+            parts.setdefault(name, []).append(values)
+    return {name: np.concatenate(values) for name, values in parts.items()}
+
+
+# Каталог небольшой: читается целиком, description и токены считаются здесь один раз
+def _convert_courses(path, store):
+    from recommender import add_description
+    from text_pipeline import TokenCache
+
+    df = add_description(_read_csv(path))
+    tokens = TokenCache(store).tokens(df['description'])
+    vocab, token_ids = np.unique(np.array([t for doc in tokens for t in doc], dtype=str),
+                                 return_inverse=True)
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum([len(doc) for doc in tokens], out=offsets[1:])
+    vocab_data, vocab_offsets, _ = _string_arrays(vocab)
+    extra = {'tokens.ids': token_ids.astype(np.int32), 'tokens.offsets': offsets,
+             'tokens.vocab.data': vocab_data, 'tokens.vocab.offsets': vocab_offsets}
+    return {name: df[name] for name in df.columns}, extra
+
+
+# Ключ таблицы по файлу-источнику: O(1), содержимое не читается
+def source_key(path, kind):
+    path = Path(path).resolve()
+    stat = path.stat()
+    return artifact_key(f'{path}:{stat.st_size}:{stat.st_mtime_ns}',
+                        {'kind': kind, 'format': DATASET_FORMAT})
+
+
+def convert(path, kind, store=None):
+    store = store or ArtifactStore()
+    key = source_key(path, kind)
+    started = time.perf_counter()
+    if kind == 'ratings':
+        columns, arrays = _convert_ratings(path), {}
+    else:
+        columns, arrays = _convert_courses(path, store)
+    kinds = {}
+    for name, values in columns.items():
+        kinds[name], column_arrays = _encode_column(name, values)
+        arrays.update(column_arrays)
+    n_rows = len(next(iter(columns.values()))) if columns else 0
+    store.save_arrays(DATASET_ARTIFACT, key, arrays, {
+        'source': str(path), 'kind': kind, 'rows': n_rows, 'columns': kinds,
+        'convert_time_sec': round(time.perf_counter() - started, 3),
+    })
+    return ColumnarTable(store, key)
+
+
+# Таблица на диске: открытие читает только meta.json, колонка — при первом обращении (mmap)
+class ColumnarTable:
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+        self.path = store.path(DATASET_ARTIFACT, key)
+        self.meta = store.read_meta(DATASET_ARTIFACT, key)
+        self.kinds = self.meta['columns']
+        self.columns = list(self.kinds)
+        self.n_rows = self.meta['rows']
+
+    def __len__(self):
+        return self.n_rows
+
+    def _array(self, name):
+        return np.load(self.path / f'{name}.npy', mmap_mode='r')
+
+    # rows — срез строк (None — все)
+    def column(self, name, rows=None):
+        kind = self.kinds[name]
+        if kind in ('numeric', 'datetime'):
+            values = self._array(name)
+            return pd.Series(values if rows is None else values[rows], name=name, copy=False)
+        if kind == 'category':
+            codes = self._array(f'{name}.codes')
+            categories = pd.Index(_decode_strings(self._array(f'{name}.data'),
+                                                  self._array(f'{name}.offsets')), dtype='str')
+            codes = np.asarray(codes if rows is None else codes[rows])
+            return pd.Series(pd.Categorical.from_codes(codes, categories), name=name)
+        offsets = self._array(f'{name}.offsets')
+        if rows is not None:
+            offsets = offsets[rows.start:rows.stop + 1]
+        values = pd.Series(_decode_strings(self._array(f'{name}.data'), offsets), name=name,
+                           dtype='str')
+        if (self.path / f'{name}.missing.npy').exists():
+            missing = self._array(f'{name}.missing')
+            values[np.asarray(missing if rows is None else missing[rows])] = np.nan
+        return values
+
+    def to_frame(self, columns=None, rows=None):
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame({name: self.column(name, rows) for name in columns}, copy=False)
+
+    def head(self, n=5):
+        return self.to_frame(rows=slice(0, min(n, self.n_rows)))
+
+    # Токены description по курсам (порядок строк каталога)
+    def tokens(self):
+        vocab = np.array(_decode_strings(self._array('tokens.vocab.data'),
+                                         self._array('tokens.vocab.offsets')), dtype=object)
+        ids = self._array('tokens.ids')
+        offsets = self._array('tokens.offsets')
+        return [vocab[ids[start:end]].tolist()
+                for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+# Таблица для CSV: готовая, если файл не менялся, иначе конвертация
+def open_table(path, kind, store=None):
+    store = store or ArtifactStore()
+    key = source_key(path, kind)
+    if store.exists(DATASET_ARTIFACT, key):
+        return ColumnarTable(store, key)
+    return convert(path, kind, store)
+
+
+def ratings_table(path=RATINGS_PATH, store=None):
+    return open_table(path, 'ratings', store)
+
+
+def courses_table(path=COURSES_PATH, store=None):
+    return open_table(path, 'courses', store)
+
+
+def load_ratings(path=RATINGS_PATH, columns=None, store=None):
+    return ratings_table(path, store).to_frame(columns)
+
+
+def load_courses(path=COURSES_PATH, columns=None, store=None):
+    return courses_table(path, store).to_frame(columns)
+
+
+def load_course_tokens(path=COURSES_PATH, store=None):
+    return courses_table(path, store).tokens()
+
+
+# Приведение новых оценок (микро-батч) к типам таблицы, чтобы хэши кадров совпадали
+def compact_ratings(df):
+    df = df.rename(columns={old: new for old, new in RENAMES.items() if old in df.columns
+                            and new not in df.columns})
+    return pd.DataFrame({name: _encode_column(name, df[name].to_numpy())[1][name]
+                         for name in df.columns if name in ID_COLUMNS + ['rate', 'date']})
+
+
+def _frame_memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 2 ** 20
+
+
+def _timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def _child_peak(conn, func, args):
+    func(*args)
+    conn.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    conn.close()
+
+
+# Пиковый RSS функции: запуск в отдельном процессе, его собственный maxrss (Linux — КБ).
+# Форк наследует память родителя — база для сравнения: _peak_rss_mb(int)
+def _peak_rss_mb(func, *args):
+    context = mp.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_child_peak, args=(sender, func, args))
+    process.start()
+    peak = receiver.recv()
+    process.join()
+    return peak / 1024
+
+
+# Синтетические оценки нужного объёма в CSV того же формата, что df_ratings.csv
+def write_synthetic_ratings(path, n_ratings, n_users=1_000_000, n_courses=50_000, seed=0):
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_ratings, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, n_ratings - start)
+        pd.DataFrame({
+            'user_id': rng.integers(0, n_users, size),
+            'course_id': rng.integers(0, n_courses, size),
+            'rate': rng.integers(1, 6, size).astype(float),
+            'date': (np.datetime64('2020-01-01') + rng.integers(0, 1000, size)).astype(str),
+        }).to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+
+# Время — лучшее из repeat запусков, пиковый RSS — в отдельном процессе на каждую стадию
+def bench(n_ratings, seed=0, repeat=3):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ratings.csv')
+        write_synthetic_ratings(path, n_ratings, seed=seed)
+        store = ArtifactStore(tmp)
+        # Пики — до замеров времени в этом процессе: иначе форк унаследует память read_csv
+        peaks = {'baseline_peak_mb': _peak_rss_mb(int),
+                 'csv_peak_mb': _peak_rss_mb(pd.read_csv, path),
+                 'convert_peak_mb': _peak_rss_mb(convert, path, 'ratings', store),
+                 'columnar_peak_mb': _peak_rss_mb(load_ratings, path, None, store)}
+
+        def best(func):
+            times = []
+            for _ in range(repeat):
+                result, elapsed = _timed(func)
+                times.append(elapsed)
+            return result, min(times)
+
+        _, convert_time = best(lambda: convert(path, 'ratings', store))
+        csv_df, csv_time = best(lambda: pd.read_csv(path))
+        csv_memory = _frame_memory_mb(csv_df)
+        del csv_df
+        df, load_time = best(lambda: load_ratings(path, store=store))
+        subset = load_ratings(path, ['user_id', 'rate'], store=store)
+        return {
+            'ratings': n_ratings, 'seed': seed, 'repeat': repeat,
+            'csv_load_sec': round(csv_time, 2), 'csv_memory_mb': round(csv_memory, 1),
+            'convert_sec': round(convert_time, 2),
+            'columnar_load_sec': round(load_time, 3), 'columnar_memory_mb': round(_frame_memory_mb(df), 1),
+            'subset_memory_mb': round(_frame_memory_mb(subset), 1),
+            'dtypes': {name: str(dtype) for name, dtype in df.dtypes.items()},
+            **{name: round(peak, 1) for name, peak in peaks.items()},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Колоночный слой данных: конвертация CSV и замеры')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help='конвертировать df_ratings.csv и каталог')
+    convert_parser.add_argument('--ratings', default=str(RATINGS_PATH))
+    convert_parser.add_argument('--courses', default=str(COURSES_PATH))
+    bench_parser = subparsers.add_parser('bench', help='CSV против колоночного формата')
+    bench_parser.add_argument('--rows', '--n-ratings', dest='rows', type=int, default=10_000_000,
+                              help='число синтетических оценок')
+    bench_parser.add_argument('--seed', type=int, default=0)
+    bench_parser.add_argument('--repeat', type=int, default=3, help='время — лучшее из N запусков')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        for path, kind in [(args.ratings, 'ratings'), (args.courses, 'courses')]:
+            table = convert(path, kind)
+            print(f"{kind}: {len(table)} rows, {len(table.columns)} columns, "
+                  f"{table.meta['convert_time_sec']:.2f}s -> {table.path}")
+    else:
+        stats = bench(args.rows, args.seed, args.repeat)
+        print(f"ratings: {stats['ratings']:,} (seed {stats['seed']}, best of {stats['repeat']}); "
+              f"python {platform.python_version()}, numpy {np.__version__}, pandas {pd.__version__}, "
+              f"{os.cpu_count()} CPU")
+        print(f"peak RSS of an idle forked process: {stats['baseline_peak_mb']:.1f} MB")
+        print(f"CSV read_csv:      {stats['csv_load_sec']:.2f}s, frame {stats['csv_memory_mb']:.1f} MB, "
+              f"peak RSS {stats['csv_peak_mb']:.1f} MB")
+        print(f"convert (once):    {stats['convert_sec']:.2f}s, peak RSS {stats['convert_peak_mb']:.1f} MB")
+        print(f"columnar load:     {stats['columnar_load_sec']:.3f}s, frame {stats['columnar_memory_mb']:.1f} MB, "
+              f"peak RSS {stats['columnar_peak_mb']:.1f} MB")
+        print(f"user_id+rate only: frame {stats['subset_memory_mb']:.1f} MB")
+        print('dtypes:', stats['dtypes'])
+
+
+if __name__ == '__main__':
+    main()
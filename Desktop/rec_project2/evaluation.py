@@ -0,0 +1,392 @@
+import argparse
+import multiprocessing as mp
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from artifacts import BASE_DIR
+from scoring import UserHistoryIndex, content_scores, top_k_indices
+
+# Doc2Vec для оценки: один поток и фиксированный seed, чтобы таблицы метрик воспроизводились
+DOC2VEC_EVAL_PARAMS = {'workers': 1, 'seed': 0}
+
+
+def _load_doc2vec(df_courses):
+    from recommender import DOC2VEC_PARAMS, load_doc2vec_model
+
+    return load_doc2vec_model(df_courses, params=dict(DOC2VEC_PARAMS, **DOC2VEC_EVAL_PARAMS))
+
+
+# Детерминированное временное разбиение по колонке date.
+# by='user' — как train_test_split из ноутбуков: у каждого пользователя последние
+# test_ratio его оценок уходят в тест, но первая всегда остаётся в обучении (иначе
+# пользователи с одной оценкой целиком уходят в тест); by='global' — общий срез по дате.
+# По умолчанию global: почти у всех пользователей df_ratings.csv одна оценка, и в
+# разбиении by='user' тест почти пуст
+def temporal_split(df_ratings, test_ratio=0.2, by='global'):
+    df = df_ratings.reset_index(drop=True)
+    if by == 'global':
+        df = df.sort_values('date', kind='stable')
+        cut = int(len(df) * (1 - test_ratio))
+        return df.iloc[:cut], df.iloc[cut:]
+    df = df.sort_values(['user_id', 'date'], kind='stable')
+    rank = df.groupby('user_id').cumcount()
+    size = df.groupby('user_id')['user_id'].transform('size')
+    test_mask = (rank >= (size * (1 - test_ratio)).astype(int)) & (rank > 0)
+    return df[~test_mask], df[test_mask]
+
+
+def regression_metrics(y_true, y_pred):
+    err = np.asarray(y_pred, dtype=np.float64) - np.asarray(y_true, dtype=np.float64)
+    return {'RMSE': float(np.sqrt(np.mean(err ** 2))), 'MAE': float(np.mean(np.abs(err)))}
+
+
+# Precision/Recall/NDCG@k по матрице рекомендаций (пользователи × k, -1 — пусто)
+# и тестовым парам (user_pos, course_id); всё без циклов по пользователям
+def ranking_metrics(rec_ids, rel_users, rel_items, k):
+    rec_ids = np.asarray(rec_ids)[:, :k]
+    n_users = len(rec_ids)
+    width = int(max(rec_ids.max(initial=0), np.max(rel_items, initial=0))) + 1
+    rec_keys = np.arange(n_users)[:, None] * width + rec_ids
+    rel_keys = np.asarray(rel_users, dtype=np.int64) * width + np.asarray(rel_items)
+    hits = np.isin(rec_keys, rel_keys) & (rec_ids >= 0)
+
+    n_rel = np.bincount(rel_users, minlength=n_users)
+    n_hits = hits.sum(axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (hits * discounts[:hits.shape[1]]).sum(axis=1)
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])[np.minimum(n_rel, k)]
+    has_rel = n_rel > 0
+    return {
+        f'Precision@{k}': float(np.mean(n_hits[has_rel] / k)),
+        f'Recall@{k}': float(np.mean(n_hits[has_rel] / n_rel[has_rel])),
+        f'NDCG@{k}': float(np.mean(dcg[has_rel] / ideal[has_rel])),
+    }
+
+
+# Адаптеры моделей: fit(train, df_courses), predict_pairs(users, items) и/или recommend(user, k)
+class SurpriseModel:
+    def __init__(self, name, factory, rank=False):
+        self.name = name
+        self.factory = factory
+        self.rank = rank
+
+    def fit(self, train, df_courses):
+        from surprise import Dataset, Reader
+
+        data = Dataset.load_from_df(train[['user_id', 'course_id', 'rate']], Reader(rating_scale=(1, 5)))
+        self.algo = self.factory()
+        self.algo.fit(data.build_full_trainset())
+        self.course_ids = df_courses['course_id'].to_numpy()
+        return self
+
+    def predict_pairs(self, users, items):
+        return np.array([self.algo.predict(u, i).est for u, i in zip(users, items)])
+
+    def recommend(self, user_id, k):
+        scores = self.predict_pairs([user_id] * len(self.course_ids), self.course_ids)
+        return self.course_ids[top_k_indices(scores, k)]
+
+
+# BiasedMF (mf.py): оценки и ранжирование всего каталога одним произведением
+class MFModel:
+    name = 'BiasedMF (ALS)'
+    rank = True
+
+    def fit(self, train, df_courses):
+        from mf import BiasedMF
+
+        self.model = BiasedMF.fit(train)
+        self.course_ids = df_courses['course_id'].to_numpy()
+        self.inner_items = self.model.to_inner_items(self.course_ids)
+        return self
+
+    def predict_pairs(self, users, items):
+        inner_items = self.model.to_inner_items(items)
+        return np.array([self.model.estimate(u, [i])[0] for u, i in zip(users, inner_items)])
+
+    def recommend(self, user_id, k):
+        return self.course_ids[top_k_indices(self.model.estimate(user_id, self.inner_items), k)]
+
+
+class UserCFModel:
+    name = 'UserBasedCF'
+    rank = False
+
+    def fit(self, train, df_courses):
+        from user_cf import UserBasedCF
+
+        self.model = UserBasedCF().fit(train[['user_id', 'course_id']], train['rate'])
+        return self
+
+    def predict_pairs(self, users, items):
+        return self.model.predict_pairs(users, items)
+
+
+# Популярность в обучающей выборке (без уже оценённых)
+class PopularityModel:
+    name = 'Baseline'
+    rank = True
+
+    def fit(self, train, df_courses):
+        counts = train['course_id'].value_counts()
+        self.popular = counts.index.to_numpy()
+        self.history = train.groupby('user_id')['course_id'].apply(set)
+        return self
+
+    def recommend(self, user_id, k):
+        seen = self.history.get(user_id, set())
+        return np.array([c for c in self.popular[:k + len(seen)] if c not in seen][:k])
+
+
+# Только контент: близость профиля Doc2Vec ко всем курсам (без уже оценённых).
+# half_life_days=None — среднее по истории, иначе профиль с затуханием (profiles.py)
+class Doc2VecModel:
+    rank = True
+
+    def __init__(self, half_life_days=None, name=None):
+        self.half_life_days = half_life_days
+        self.name = name or ('Doc2Vec' if half_life_days is None else 'Doc2Vec (time-decay)')
+
+    def fit(self, train, df_courses):
+        from profiles import UserProfileStore
+        from coldstart import course_embeddings
+
+        self.course_ids = df_courses['course_id'].to_numpy()
+        self.embeddings = course_embeddings(_load_doc2vec(df_courses), df_courses)
+        course_index = pd.Index(self.course_ids)
+        self.history = UserHistoryIndex(train, course_index)
+        self.profiles = None
+        if self.half_life_days is not None:
+            self.profiles = UserProfileStore.build(train, self.embeddings, course_index,
+                                                   half_life_days=self.half_life_days)
+        self.all_rows = np.arange(len(self.course_ids))
+        return self
+
+    def recommend(self, user_id, k):
+        history = self.history.get(user_id)
+        if self.profiles is None:
+            scores = content_scores(self.embeddings, history, self.all_rows)
+        else:
+            scores = self.profiles.scores(user_id, self.embeddings, self.all_rows)
+        scores[history] = -np.inf
+        return self.course_ids[top_k_indices(scores, k)]
+
+
+# Гибрид из приложения; оценки рейтинга — его CF-часть (KNNBaseline или BiasedMF)
+class HybridModel:
+    rank = True
+
+    def __init__(self, candidate_mode='cf', name=None, cf='knn'):
+        self.candidate_mode = candidate_mode
+        self.cf = cf
+        cf_name = 'KNNBaseline' if cf == 'knn' else 'BiasedMF'
+        self.name = name or f'Hybrid ({cf_name}+Doc2Vec, {candidate_mode})'
+
+    def fit(self, train, df_courses):
+        from surprise import Dataset, KNNBaseline, Reader
+
+        from item_cf import ItemNeighbors
+        from mf import BiasedMF
+        from recommender import KNN_PARAMS, HybridRecommender
+
+        if self.cf == 'mf':
+            cf_model = BiasedMF.fit(train)
+        else:
+            data = Dataset.load_from_df(train[['user_id', 'course_id', 'rate']],
+                                        Reader(rating_scale=(1, 5)))
+            cf_model = KNNBaseline(verbose=False, **KNN_PARAMS)
+            cf_model.fit(data.build_full_trainset())
+        self.recommender = HybridRecommender(
+            cf_model=cf_model,
+            doc2vec_model=_load_doc2vec(df_courses),
+            df_courses=df_courses,
+            df_ratings=train,
+            item_neighbors=ItemNeighbors.fit(train, pd.Index(df_courses['course_id']), n_jobs=1),
+            candidate_mode=self.candidate_mode
+        )
+        return self
+
+    def predict_pairs(self, users, items):
+        model = self.recommender.cf_model
+        if self.cf == 'mf':
+            inner_items = model.to_inner_items(items)
+            return np.array([model.estimate(u, [i])[0] for u, i in zip(users, inner_items)])
+        return np.array([model.predict(u, i).est for u, i in zip(users, items)])
+
+    def recommend(self, user_id, k):
+        return self.recommender.recommend_ids(user_id, k)[0]
+
+
+def default_models():
+    from surprise import SVD, BaselineOnly, KNNBaseline, KNNBasic, KNNWithMeans
+
+    from profiles import PROFILE_PARAMS
+    from recommender import KNN_PARAMS
+
+    return [
+        SurpriseModel('SVD', lambda: SVD(random_state=0), rank=True),
+        SurpriseModel('KNNBaseline', lambda: KNNBaseline(verbose=False, **KNN_PARAMS), rank=True),
+        SurpriseModel('KNNBasic', lambda: KNNBasic(verbose=False)),
+        SurpriseModel('KNNWithMeans', lambda: KNNWithMeans(verbose=False)),
+        SurpriseModel('BaselineOnly', lambda: BaselineOnly(verbose=False)),
+        UserCFModel(),
+        PopularityModel(),
+        Doc2VecModel(),
+        Doc2VecModel(PROFILE_PARAMS['half_life_days']),
+        MFModel(),
+        HybridModel('cf', 'Hybrid (KNNBaseline+Doc2Vec)'),
+        HybridModel('cf', 'Hybrid (BiasedMF+Doc2Vec)', cf='mf'),
+        HybridModel('item'),
+        HybridModel('content'),
+    ]
+
+
+_eval_state = {}
+
+
+# Предсказания для тестовых пар пользователя и его рекомендации
+def _run_user(model, user_id, items, k):
+    pred = rec = None
+    if hasattr(model, 'predict_pairs'):
+        pred = model.predict_pairs([user_id] * len(items), items)
+    if model.rank:
+        rec = model.recommend(user_id, k)
+    return pred, rec
+
+
+# Оценка блока пользователей: предсказания для их тестовых пар, рекомендации и задержки.
+# Пик памяти меряется отдельным проходом: под tracemalloc каждая аллокация дороже и задержки завышены
+def _evaluate_users(user_positions):
+    model = _eval_state['model']
+    users, groups, k = _eval_state['users'], _eval_state['groups'], _eval_state['k']
+    tracemalloc.start()
+    for pos in user_positions:
+        _run_user(model, users[pos], groups[pos], k)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    preds, recs, latencies = {}, {}, []
+    for pos in user_positions:
+        started = time.perf_counter()
+        pred, rec = _run_user(model, users[pos], groups[pos], k)
+        latencies.append(time.perf_counter() - started)
+        if pred is not None:
+            preds[pos] = pred
+        if rec is not None:
+            recs[pos] = rec
+    return preds, recs, latencies, peak
+
+
+def evaluate_model(model, train, test, df_courses, k=10, n_jobs=1, chunk_size=64):
+    tracemalloc.start()
+    started = time.perf_counter()
+    model.fit(train, df_courses)
+    fit_time = time.perf_counter() - started
+    _, fit_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    users, rel_users = np.unique(test['user_id'].to_numpy(), return_inverse=True)
+    rel_items = test['course_id'].to_numpy()
+    order = np.argsort(rel_users, kind='stable')
+    bounds = np.cumsum(np.bincount(rel_users, minlength=len(users)))[:-1]
+    groups = np.split(rel_items[order], bounds)
+    _eval_state.update(model=model, users=users, groups=groups, k=k)
+
+    chunks = np.array_split(np.arange(len(users)), max(1, int(np.ceil(len(users) / chunk_size))))
+    # Пользователи считаются параллельно в форкнутых процессах, модель наследуется без копирования
+    if n_jobs != 1 and 'fork' in mp.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=n_jobs if n_jobs > 0 else None,
+                                 mp_context=mp.get_context('fork')) as pool:
+            results = list(pool.map(_evaluate_users, chunks))
+    else:
+        results = [_evaluate_users(chunk) for chunk in chunks]
+    _eval_state.clear()
+
+    preds, recs, latencies, peaks = {}, {}, [], [fit_peak]
+    for chunk_preds, chunk_recs, chunk_latencies, peak in results:
+        preds.update(chunk_preds)
+        recs.update(chunk_recs)
+        latencies.extend(chunk_latencies)
+        peaks.append(peak)
+
+    row = {'Model': model.name}
+    if preds:
+        y_pred = np.concatenate([preds[pos] for pos in range(len(users))])
+        y_true = test['rate'].to_numpy()[order]
+        row.update(regression_metrics(y_true, y_pred))
+    if recs:
+        rec_ids = np.full((len(users), k), -1, dtype=np.int64)
+        for pos, ids in recs.items():
+            rec_ids[pos, :len(ids)] = ids[:k]
+        row.update(ranking_metrics(rec_ids, rel_users, rel_items, k))
+    latencies = 1000 * np.asarray(latencies)
+    row.update({
+        'fit_time_s': fit_time,
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p95': float(np.percentile(latencies, 95)),
+        'latency_ms_p99': float(np.percentile(latencies, 99)),
+        'peak_mem_mb': max(peaks) / 2 ** 20,
+    })
+    return row
+
+
+def evaluate(models=None, k=10, test_ratio=0.2, split='global', n_jobs=1, ratings_path=None,
+             courses_path=None):
+    from recommender import COURSES_PATH, RATINGS_PATH, add_description, read_data
+
+    df_ratings, df_courses = read_data(ratings_path or RATINGS_PATH, courses_path or COURSES_PATH)
+    add_description(df_courses)
+    train, test = temporal_split(df_ratings, test_ratio, split)
+    models = models if models is not None else default_models()
+    return pd.DataFrame([evaluate_model(m, train, test, df_courses, k, n_jobs) for m in models])
+
+
+PERF_COLUMNS = ['fit_time_s', 'latency_ms_p50', 'latency_ms_p95', 'latency_ms_p99', 'peak_mem_mb']
+
+
+# Таблицы, которые показывает metrics.py
+def write_tables(results, k=10, out_dir=BASE_DIR):
+    rating = ['Model', 'RMSE', 'MAE']
+    ranking = ['Model', f'Precision@{k}', f'Recall@{k}', f'NDCG@{k}']
+    both = rating + ranking[1:]
+    has_rmse = results['RMSE'].notna() if 'RMSE' in results else False
+    hybrid = results['Model'].str.startswith('Hybrid')
+    content_models = results['Model'].isin(['Baseline', 'Doc2Vec', 'Doc2Vec (time-decay)'])
+
+    tables = {
+        'metrics_table.csv': results[has_rmse & ~hybrid][rating + PERF_COLUMNS],
+        'content_metrics_table.csv': results[content_models][ranking + PERF_COLUMNS],
+        'hybrid_metrics.csv': results[hybrid][both + PERF_COLUMNS],
+        'compare_table.csv': results[hybrid | (results['Model'] == 'KNNBaseline')
+                                     | (results['Model'] == 'Doc2Vec')][both + PERF_COLUMNS],
+    }
+    for name, table in tables.items():
+        table.to_csv(out_dir / name, index=False)
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Офлайн-оценка моделей и пересборка таблиц метрик')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--test-ratio', type=float, default=0.2)
+    parser.add_argument('--split', choices=['user', 'global'], default='global')
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--ratings', default=None)
+    parser.add_argument('--courses', default=None)
+    parser.add_argument('--no-write', action='store_true', help='только вывести, CSV не перезаписывать')
+    args = parser.parse_args()
+
+    results = evaluate(k=args.k, test_ratio=args.test_ratio, split=args.split, n_jobs=args.n_jobs,
+                       ratings_path=args.ratings, courses_path=args.courses)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(results.round(4).to_string(index=False))
+    if not args.no_write:
+        write_tables(results, args.k)
+
+
+if __name__ == '__main__':
+    main()
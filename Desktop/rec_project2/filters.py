@@ -0,0 +1,268 @@
+import argparse
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Колонки каталога с индексами: равенство — битовые карты, диапазоны — отсортированные массивы.
+# language в текущем каталоге нет — индекс строится, только если колонка появится
+EQUALITY_COLUMNS = ['is_paid', 'category', 'language']
+RANGE_COLUMNS = ['price', 'content_length_min']
+# Маски последних фильтров: одинаковые фильтры приходят от многих пользователей подряд
+MASK_CACHE_SIZE = 64
+# Разделитель списков в параметрах запроса сервиса: в названиях категорий возможны запятые
+LIST_SEPARATOR = '|'
+
+
+def _value_key(value):
+    return str(value)
+
+
+def _bound(value):
+    return None if value is None or value == '' else float(value)
+
+
+# Ограничения на атрибуты курсов; None — без ограничения. Хэшируется по key —
+# годится в ключ кэша рекомендаций и для группировки запросов в сервисе
+class CourseFilter:
+    def __init__(self, is_paid=None, min_price=None, max_price=None, min_length=None, max_length=None,
+                 categories=None, languages=None):
+        self.is_paid = None if is_paid is None else bool(is_paid)
+        self.price = (_bound(min_price), _bound(max_price))
+        self.length = (_bound(min_length), _bound(max_length))
+        self.categories = tuple(sorted(map(_value_key, categories))) if categories else None
+        self.languages = tuple(sorted(map(_value_key, languages))) if languages else None
+
+    @property
+    def key(self):
+        return (self.is_paid, self.price, self.length, self.categories, self.languages)
+
+    def __bool__(self):
+        return any(value not in (None, (None, None)) for value in self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, CourseFilter) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f'CourseFilter{self.key}'
+
+    # Ограничения равенства и диапазонов в терминах колонок каталога
+    def equality(self):
+        constraints = {}
+        if self.is_paid is not None:
+            constraints['is_paid'] = (_value_key(self.is_paid),)
+        if self.categories is not None:
+            constraints['category'] = self.categories
+        if self.languages is not None:
+            constraints['language'] = self.languages
+        return constraints
+
+    def ranges(self):
+        return {column: bounds for column, bounds in zip(RANGE_COLUMNS, (self.price, self.length))
+                if bounds != (None, None)}
+
+    # Параметры запроса сервиса (/recommend, /popular) и обратно
+    def to_query(self):
+        params = {'paid': None if self.is_paid is None else int(self.is_paid),
+                  'min_price': self.price[0], 'max_price': self.price[1],
+                  'min_minutes': self.length[0], 'max_minutes': self.length[1],
+                  'categories': LIST_SEPARATOR.join(self.categories) if self.categories else None,
+                  'languages': LIST_SEPARATOR.join(self.languages) if self.languages else None}
+        return {name: value for name, value in params.items() if value is not None}
+
+    @classmethod
+    def from_query(cls, query):
+        paid = query.get('paid')
+        if paid not in (None, '', '0', '1', 0, 1, True, False):
+            raise ValueError(f'invalid paid: {paid!r}')
+
+        def values(name):
+            value = query.get(name)
+            if isinstance(value, (list, tuple)):
+                return value
+            return [item for item in value.split(LIST_SEPARATOR) if item] if value else None
+
+        return cls(is_paid=None if paid in (None, '') else paid in ('1', 1, True),
+                   min_price=query.get('min_price'), max_price=query.get('max_price'),
+                   min_length=query.get('min_minutes'), max_length=query.get('max_minutes'),
+                   categories=values('categories'), languages=values('languages'))
+
+
+# Индексы атрибутов каталога, строятся один раз: битовая карта (np.packbits) на каждое
+# значение is_paid/category/language и порядок курсов по price/content_length_min для
+# диапазонов через searchsorted. mask(filter) — булева маска по строкам df_courses
+class AttributeIndex:
+    def __init__(self, df_courses, cache_size=MASK_CACHE_SIZE):
+        self.n_courses = len(df_courses)
+        self.bitmaps = {}
+        for column in EQUALITY_COLUMNS:
+            if column not in df_courses:
+                continue
+            codes, values = pd.factorize(df_courses[column].astype(str), use_na_sentinel=False)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.cumsum(np.bincount(codes, minlength=len(values)))[:-1]
+            bitmaps = {}
+            for value, rows in zip(values, np.split(order, bounds)):
+                bits = np.zeros(self.n_courses, dtype=bool)
+                bits[rows] = True
+                bitmaps[_value_key(value)] = np.packbits(bits)
+            self.bitmaps[column] = bitmaps
+        # Пропуски в числовых колонках не попадают ни в один диапазон
+        self.sorted = {}
+        for column in RANGE_COLUMNS:
+            if column not in df_courses:
+                continue
+            values = pd.to_numeric(df_courses[column], errors='coerce').to_numpy(dtype=np.float64)
+            rows = np.flatnonzero(~np.isnan(values))
+            order = rows[np.argsort(values[rows], kind='stable')]
+            self.sorted[column] = (order, values[order])
+        self.cache_size = cache_size
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def values(self, column):
+        return sorted(self.bitmaps.get(column, {}))
+
+    def value_range(self, column):
+        _, values = self.sorted.get(column, (None, np.zeros(0)))
+        return (float(values[0]), float(values[-1])) if len(values) else None
+
+    # Строки с lo <= значение <= hi: два searchsorted и срез, без прохода по каталогу
+    def range_rows(self, column, lo=None, hi=None):
+        order, values = self.sorted[column]
+        start = 0 if lo is None else np.searchsorted(values, lo, side='left')
+        stop = len(values) if hi is None else np.searchsorted(values, hi, side='right')
+        return order[start:stop]
+
+    def _bits(self, column, values):
+        bitmaps = self.bitmaps[column]
+        bits = np.zeros((self.n_courses + 7) // 8, dtype=np.uint8)
+        for value in values:
+            if value in bitmaps:
+                bits |= bitmaps[value]
+        return bits
+
+    def _build_mask(self, course_filter):
+        for column in list(course_filter.equality()) + list(course_filter.ranges()):
+            if column not in self.bitmaps and column not in self.sorted:
+                raise ValueError(f'no attribute index for column {column!r}')
+        bits = None
+        for column, values in course_filter.equality().items():
+            column_bits = self._bits(column, values)
+            bits = column_bits if bits is None else bits & column_bits
+        if bits is None:
+            mask = np.ones(self.n_courses, dtype=bool)
+        else:
+            mask = np.unpackbits(bits, count=self.n_courses).astype(bool)
+        for column, (lo, hi) in course_filter.ranges().items():
+            in_range = np.zeros(self.n_courses, dtype=bool)
+            in_range[self.range_rows(column, lo, hi)] = True
+            mask &= in_range
+        mask.flags.writeable = False
+        return mask
+
+    # Маска допустимых строк df_courses; None — фильтра нет. Неизвестная колонка — ValueError
+    def mask(self, course_filter):
+        if not course_filter:
+            return None
+        key = course_filter.key
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        mask = self._build_mask(course_filter)
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > self.cache_size:
+                self._masks.popitem(last=False)
+        return mask
+
+
+# Синтетический каталог с распределениями атрибутов как у info2022_final.csv
+def synthetic_catalog(n_courses, seed=0):
+    from dataset import load_courses
+
+    rng = np.random.default_rng(seed)
+    df = load_courses(columns=['is_paid', 'price', 'content_length_min', 'category'])
+    sample = df.iloc[rng.integers(0, len(df), n_courses)].reset_index(drop=True)
+    sample['price'] = sample['price'] * rng.uniform(0.5, 1.5, n_courses)
+    sample['content_length_min'] = sample['content_length_min'] * rng.uniform(0.5, 1.5, n_courses)
+    return sample
+
+
+# Маска через индекс (первый и повторный запрос) против прохода pandas по колонкам и
+# стоимость оценки допустимых курсов (произведение факторов 32-мерной MF) от селективности
+def bench(n_courses, n_factors=32, repeat=20):
+    df = synthetic_catalog(n_courses)
+    started = time.perf_counter()
+    index = AttributeIndex(df)
+    build_ms = (time.perf_counter() - started) * 1000
+    category = df['category'].astype(str).value_counts().index[-1]
+    filters = {
+        'no filter': CourseFilter(),
+        'free': CourseFilter(is_paid=False),
+        'under 120 min': CourseFilter(max_length=120),
+        f'category={category}': CourseFilter(categories=[category]),
+        f'free, {category}, under 120 min': CourseFilter(is_paid=False, categories=[category], max_length=120),
+    }
+    rng = np.random.default_rng(1)
+    item_factors = rng.normal(0, 0.1, (n_courses, n_factors)).astype(np.float32)
+    user_factor = rng.normal(0, 0.1, n_factors).astype(np.float32)
+
+    def measure(func):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        return (time.perf_counter() - started) / repeat * 1000, result
+
+    rows = []
+    for name, course_filter in filters.items():
+        started = time.perf_counter()
+        mask = index.mask(course_filter)
+        cold_ms = (time.perf_counter() - started) * 1000
+        cached_ms, _ = measure(lambda: index.mask(course_filter))
+
+        def pandas_scan():
+            keep = np.ones(n_courses, dtype=bool)
+            if course_filter.is_paid is not None:
+                keep &= (df['is_paid'] == course_filter.is_paid).to_numpy()
+            if course_filter.categories:
+                keep &= df['category'].astype(str).isin(course_filter.categories).to_numpy()
+            if course_filter.length[1] is not None:
+                keep &= (df['content_length_min'] <= course_filter.length[1]).to_numpy()
+            return keep
+
+        scan_ms, scanned = measure(pandas_scan)
+        if mask is None:
+            matches = n_courses
+            score_ms, _ = measure(lambda: item_factors @ user_factor)
+        else:
+            allowed = np.flatnonzero(mask)
+            matches = len(allowed)
+            score_ms, _ = measure(lambda: item_factors[allowed] @ user_factor)
+        rows.append({'filter': name, 'matches': matches,
+                     'index_cold_ms': round(cold_ms, 3), 'index_cached_ms': round(cached_ms, 4),
+                     'pandas_scan_ms': round(scan_ms, 3), 'score_allowed_ms': round(score_ms, 3),
+                     'same_rows': mask is None or bool(np.array_equal(mask, scanned))})
+    return build_ms, pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Индексы атрибутов курсов для фильтров рекомендаций')
+    parser.add_argument('--courses', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    build_ms, result = bench(args.courses, repeat=args.repeat)
+    print(f'index build for {args.courses} courses: {build_ms:.0f} ms')
+    print(result.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+import argparse
+import logging
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from aggregates import aggregates_key, build_aggregates, load_or_build_aggregates
+from artifacts import ArtifactStore, knn_key, latest_ratings, load_or_fit_knn
+from dataset import compact_ratings, load_ratings
+from scoring import KNNBaselineScorer
+
+logger = logging.getLogger(__name__)
+
+# Через сколько микро-батчей делать полный fit, чтобы убрать накопленный дрейф
+DEFAULT_REFIT_EVERY = 20
+RATING_COLUMNS = ['user_id', 'course_id', 'rate']
+
+
+def _params_from_model(model):
+    return {'k': model.k, 'min_k': model.min_k, 'sim_options': model.sim_options,
+            'bsl_options': model.bsl_options}
+
+
+# KNNBaseline (user_based, pearson_baseline, ALS-базовые), которую можно дообучать
+# микро-батчами новых оценок. Обновляется только то, что затронуто батчем:
+# базовые bu/bi затронутых пользователей и курсов (те же шаги ALS, что в surprise,
+# но по их оценкам), строки similarity затронутых пользователей и CSR оценок.
+# Базовые незатронутых и similarity остальных пар до полного fit не пересчитываются — это
+# и есть дрейф, который убирает refit (автоматически раз в refit_every батчей).
+class IncrementalKNNBaseline:
+    def __init__(self, params, refit_every=DEFAULT_REFIT_EVERY):
+        sim_options = params.get('sim_options', {})
+        bsl_options = params.get('bsl_options', {})
+        if (sim_options.get('name') != 'pearson_baseline' or not sim_options.get('user_based', True)
+                or bsl_options.get('method', 'als') != 'als'):
+            raise ValueError('Инкрементальное обновление поддерживает только user_based '
+                             'pearson_baseline с ALS-базовыми')
+        self.params = params
+        self.refit_every = refit_every
+        self.k = params.get('k', 40)
+        self.min_k = params.get('min_k', 1)
+        self.n_epochs = bsl_options.get('n_epochs', 10)
+        self.reg_u = bsl_options.get('reg_u', 15)
+        self.reg_i = bsl_options.get('reg_i', 10)
+        self.shrinkage = sim_options.get('shrinkage', 100)
+        self.min_support = max(2, sim_options.get('min_support', 1))
+        self.updates_since_refit = 0
+        self._scorer = None
+
+    @classmethod
+    def from_model(cls, model, df_ratings, refit_every=DEFAULT_REFIT_EVERY):
+        inc = cls(_params_from_model(model), refit_every)
+        inc._load_model(model, df_ratings)
+        return inc
+
+    # Полный fit (или точный артефакт из хранилища) по всем оценкам
+    def fit(self, df_ratings, store=None, exact=False):
+        store = store or ArtifactStore()
+        df_ratings = latest_ratings(df_ratings)
+        model = load_or_fit_knn(df_ratings[RATING_COLUMNS], self.params, store, exact=exact)
+        self._load_model(model, df_ratings)
+        key = knn_key(df_ratings, self.params)
+        self.updates_since_refit = store.read_meta('knn', key).get('incremental', 0) \
+            if store.exists('knn', key) else 0
+        return self
+
+    def refit(self, store=None):
+        return self.fit(self.ratings_frame(), store, exact=True)
+
+    def _load_model(self, model, df_ratings):
+        trainset = model.trainset
+        self.global_mean = trainset.global_mean
+        self.rating_scale = trainset.rating_scale
+        self.raw2inner_users = dict(trainset._raw2inner_id_users)
+        self.raw2inner_items = dict(trainset._raw2inner_id_items)
+        # Плоские массивы оценок в порядке trainset.ir; новые дописываются в конец
+        self.items = np.repeat(np.arange(trainset.n_items),
+                               [len(trainset.ir[i]) for i in range(trainset.n_items)])
+        self.users = np.fromiter((u for i in range(trainset.n_items) for u, _ in trainset.ir[i]),
+                                 dtype=np.int64, count=len(self.items))
+        self.ratings = np.fromiter((r for i in range(trainset.n_items) for _, r in trainset.ir[i]),
+                                   dtype=np.float64, count=len(self.items))
+        self.bu = np.array(model.bu, dtype=np.float64)
+        self.bi = np.array(model.bi, dtype=np.float64)
+        # similarity в буфере с запасом: новые пользователи не требуют копирования U×U каждый раз
+        self._sim_buf = np.array(model.sim, dtype=np.float64)
+        self.sim = self._sim_buf
+        self._frames = [df_ratings[RATING_COLUMNS]]
+        self._scorer = None
+
+    @property
+    def n_users(self):
+        return len(self.bu)
+
+    @property
+    def n_items(self):
+        return len(self.bi)
+
+    # Все оценки модели: повторная оценка пары заменяет прежнюю, как в update,
+    # иначе refit обучился бы на обеих
+    def ratings_frame(self):
+        if len(self._frames) > 1:
+            self._frames = [pd.concat(self._frames, ignore_index=True)
+                            .drop_duplicates(['user_id', 'course_id'], keep='last', ignore_index=True)]
+        return self._frames[0]
+
+    def _assign_ids(self, raw_ids, raw2inner):
+        # Новые id — в порядке первого появления, как в surprise.Trainset
+        for raw in pd.unique(raw_ids):
+            if raw not in raw2inner:
+                raw2inner[raw] = len(raw2inner)
+        return np.fromiter((raw2inner[raw] for raw in raw_ids), dtype=np.int64, count=len(raw_ids))
+
+    def _grow_sim(self, n_users):
+        if n_users > len(self._sim_buf):
+            capacity = max(n_users, 2 * len(self._sim_buf))
+            buf = np.zeros((capacity, capacity), dtype=np.float64)
+            n = self.sim.shape[0]
+            buf[:n, :n] = self.sim
+            self._sim_buf = buf
+        self.sim = self._sim_buf[:n_users, :n_users]
+
+    # Шаги ALS из surprise.baseline_als, но только для затронутых пользователей и курсов
+    def _update_baselines(self, users, items):
+        item_entries = np.isin(self.items, items)
+        user_entries = np.isin(self.users, users)
+        item_counts = np.bincount(self.items[item_entries], minlength=self.n_items)[items]
+        user_counts = np.bincount(self.users[user_entries], minlength=self.n_users)[users]
+        for _ in range(self.n_epochs):
+            i_u, i_i = self.users[item_entries], self.items[item_entries]
+            dev_i = np.bincount(i_i, weights=self.ratings[item_entries] - self.global_mean - self.bu[i_u],
+                                minlength=self.n_items)[items]
+            self.bi[items] = dev_i / (self.reg_i + item_counts)
+            u_u, u_i = self.users[user_entries], self.items[user_entries]
+            dev_u = np.bincount(u_u, weights=self.ratings[user_entries] - self.global_mean - self.bi[u_i],
+                                minlength=self.n_users)[users]
+            self.bu[users] = dev_u / (self.reg_u + user_counts)
+
+    # Строки pearson_baseline (со shrinkage) для затронутых пользователей: суммы по общим
+    # курсам считаются разреженными произведениями только по курсам этих пользователей
+    def _update_sim_rows(self, users):
+        user_items = np.unique(self.items[np.isin(self.users, users)])
+        entries = np.isin(self.items, user_items)
+        u, i = self.users[entries], self.items[entries]
+        diff = self.ratings[entries] - (self.global_mean + self.bu[u] + self.bi[i])
+        shape = (self.n_users, self.n_items)
+        D = sparse.csr_matrix((diff, (u, i)), shape=shape)
+        D2 = sparse.csr_matrix((diff ** 2, (u, i)), shape=shape)
+        B = sparse.csr_matrix((np.ones(len(u)), (u, i)), shape=shape)
+
+        freq = (B[users] @ B.T).toarray()
+        prods = (D[users] @ D.T).toarray()
+        sq_u = (D2[users] @ B.T).toarray()
+        sq_v = (B[users] @ D2.T).toarray()
+        denom = np.sqrt(sq_u * sq_v)
+        valid = (freq >= self.min_support) & (denom > 0)
+        rows = np.zeros_like(prods)
+        rows[valid] = prods[valid] / denom[valid] * \
+            (freq[valid] - 1) / (freq[valid] - 1 + self.shrinkage)
+
+        self.sim[users, :] = rows
+        self.sim[:, users] = rows.T
+        self.sim[users, users] = 1
+
+    def update(self, df_new, store=None):
+        started = time.perf_counter()
+        df_new = df_new[RATING_COLUMNS]
+        self._frames.append(df_new)
+        self.updates_since_refit += 1
+        self._scorer = None
+        if self.refit_every and self.updates_since_refit >= self.refit_every:
+            self.refit(store)
+            return {'ratings': len(df_new), 'full_refit': True,
+                    'time_s': time.perf_counter() - started}
+
+        n_users_before, n_items_before = self.n_users, self.n_items
+        users = self._assign_ids(df_new['user_id'].to_numpy(), self.raw2inner_users)
+        items = self._assign_ids(df_new['course_id'].to_numpy(), self.raw2inner_items)
+        ratings = df_new['rate'].to_numpy(dtype=np.float64)
+        self.bu = np.concatenate([self.bu, np.zeros(len(self.raw2inner_users) - n_users_before)])
+        self.bi = np.concatenate([self.bi, np.zeros(len(self.raw2inner_items) - n_items_before)])
+        self._grow_sim(self.n_users)
+
+        # Повторная оценка той же пары заменяет старую, внутри батча побеждает последняя
+        pair = users * self.n_items + items
+        last = ~pd.Series(pair).duplicated(keep='last').to_numpy()
+        users, items, ratings, pair = users[last], items[last], ratings[last], pair[last]
+        existing = pd.Index(self.users * self.n_items + self.items).get_indexer(pair)
+        seen = existing >= 0
+        self.ratings[existing[seen]] = ratings[seen]
+        self.users = np.concatenate([self.users, users[~seen]])
+        self.items = np.concatenate([self.items, items[~seen]])
+        self.ratings = np.concatenate([self.ratings, ratings[~seen]])
+        # Среднее — как у trainset, иначе восстановленный из артефакта KNN разойдётся с нами
+        self.global_mean = float(np.mean(self.ratings))
+
+        affected_users = np.unique(users)
+        affected_items = np.unique(items)
+        self._update_baselines(affected_users, affected_items)
+        self._update_sim_rows(affected_users)
+        return {
+            'ratings': len(df_new),
+            'full_refit': False,
+            'new_users': self.n_users - n_users_before,
+            'new_items': self.n_items - n_items_before,
+            'affected_users': len(affected_users),
+            'affected_items': len(affected_items),
+            'time_s': time.perf_counter() - started,
+        }
+
+    def scorer(self):
+        if self._scorer is None:
+            self._scorer = KNNBaselineScorer.from_arrays(
+                self.users, self.items, self.ratings, self.bu, self.bi, self.sim,
+                self.raw2inner_users, self.raw2inner_items, self.k, self.min_k,
+                self.global_mean, self.rating_scale)
+        return self._scorer
+
+    # Артефакт KNN под ключом текущих данных: load_knn_model найдёт его без полного fit.
+    # meta.incremental — сколько батчей с последнего точного fit.
+    def save(self, store=None):
+        store = store or ArtifactStore()
+        inner2raw = lambda raw2inner: np.array(list(raw2inner))
+        df_ratings = self.ratings_frame()
+        store.save_arrays('knn', knn_key(df_ratings, self.params), {
+            'sim': self.sim,
+            'bu': self.bu,
+            'bi': self.bi,
+            'raw_user_ids': inner2raw(self.raw2inner_users),
+            'raw_item_ids': inner2raw(self.raw2inner_items),
+        }, {'params': self.params, 'incremental': self.updates_since_refit})
+
+
+# Приём новых строк оценок: обновить модель, дописать строки в CSV и сохранить артефакт
+def ingest(new_path, ratings_path=None, params=None, refit_every=DEFAULT_REFIT_EVERY, store=None):
+    from recommender import KNN_PARAMS, RATINGS_PATH
+
+    ratings_path = ratings_path or RATINGS_PATH
+    store = store or ArtifactStore()
+    # Новые оценки приводятся к типам колоночной таблицы: ключ артефакта KNN считается по
+    # тем же типам, что и у страниц, читающих df_ratings.csv через dataset.py
+    df_ratings = load_ratings(ratings_path, store=store)
+    df_new = compact_ratings(pd.read_csv(new_path))[list(df_ratings.columns)]
+    inc = IncrementalKNNBaseline(params or KNN_PARAMS, refit_every).fit(df_ratings, store)
+    stats = inc.update(df_new, store)
+    inc.save(store)
+    keys = ['user_id', 'course_id']
+    rerated = df_new[keys].duplicated().any() or \
+        pd.MultiIndex.from_frame(df_new[keys]).isin(pd.MultiIndex.from_frame(df_ratings[keys])).any()
+    if rerated:
+        # Повторные оценки заменяют строки файла: он переписывается без дублей (в том же порядке,
+        # что ratings_frame, — ключ KNN совпадёт), агрегаты пересобираются по новому файлу
+        latest_ratings(pd.concat([df_ratings, df_new], ignore_index=True)).to_csv(ratings_path, index=False)
+        build_aggregates(ratings_path, store=store)
+        return stats
+    # Агрегаты страницы «Обзор» дописываются и сохраняются под ключом уже дополненного файла
+    aggregates = load_or_build_aggregates(ratings_path, store=store).add_ratings(df_new)
+    df_new.to_csv(ratings_path, mode='a', header=False, index=False)
+    aggregates.save(store, aggregates_key(ratings_path), {'source': str(ratings_path)})
+    return stats
+
+
+# Синтетические оценки с латентной структурой и датами (у данных репозитория ~1 оценка
+# на пользователя, similarity там почти пустая)
+def synthetic_ratings(n_users=1000, n_items=200, n_ratings=30_000, seed=0):
+    rng = np.random.default_rng(seed)
+    user_f = rng.normal(size=(n_users, 5))
+    item_f = rng.normal(size=(n_items, 5))
+    users = rng.integers(0, n_users, n_ratings)
+    items = rng.integers(0, n_items, n_ratings)
+    raw = 3 + 0.5 * np.einsum('ij,ij->i', user_f[users], item_f[items]) + rng.normal(0, 0.5, n_ratings)
+    df = pd.DataFrame({'user_id': users, 'course_id': items + 10_000,
+                       'rate': np.clip(np.round(raw), 1, 5),
+                       'date': pd.date_range('2022-01-01', periods=n_ratings, freq='min')})
+    return df.drop_duplicates(['user_id', 'course_id'])
+
+
+# Дрейф после n_batches инкрементальных обновлений относительно полного fit на тех же данных
+def drift_check(df_ratings, params, n_batches=10, new_ratio=0.1, n_users=200, seed=0):
+    df_ratings = df_ratings.sort_values('date', kind='stable').reset_index(drop=True)
+    cut = int(len(df_ratings) * (1 - new_ratio))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ArtifactStore(tmp)
+        inc = IncrementalKNNBaseline(params, refit_every=None).fit(df_ratings.iloc[:cut], store)
+        bounds = np.linspace(cut, len(df_ratings), n_batches + 1).astype(int)
+        update_times = [inc.update(df_ratings.iloc[start:end])['time_s']
+                        for start, end in zip(bounds[:-1], bounds[1:])]
+
+        # Эталон — полный fit, где повторная оценка пары заменяет прежнюю
+        started = time.perf_counter()
+        latest = df_ratings.drop_duplicates(['user_id', 'course_id'], keep='last')
+        full = KNNBaselineScorer(load_or_fit_knn(latest[RATING_COLUMNS], params, store, exact=True))
+        refit_time = time.perf_counter() - started
+
+    rng = np.random.default_rng(seed)
+    all_users = df_ratings['user_id'].unique()
+    touched = df_ratings.iloc[cut:]['user_id'].unique()
+    items = df_ratings['course_id'].unique()
+    result = {'batches': n_batches, 'update_ms_mean': 1000 * float(np.mean(update_times)),
+              'full_refit_s': refit_time}
+    scorer = inc.scorer()
+    for name, users in [('all', all_users), ('updated', touched)]:
+        sample = rng.choice(users, min(n_users, len(users)), replace=False)
+        diff = np.concatenate([
+            scorer.estimate(u, scorer.to_inner_items(items)) - full.estimate(u, full.to_inner_items(items))
+            for u in sample])
+        result[f'{name}_mae'] = float(np.mean(np.abs(diff)))
+        result[f'{name}_max_abs'] = float(np.max(np.abs(diff)))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Инкрементальное обновление KNNBaseline')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_ingest = sub.add_parser('ingest', help='принять CSV с новыми оценками')
+    p_ingest.add_argument('new_ratings')
+    p_ingest.add_argument('--ratings', default=None)
+    p_ingest.add_argument('--refit-every', type=int, default=DEFAULT_REFIT_EVERY)
+    p_refit = sub.add_parser('refit', help='полный fit по текущему df_ratings.csv')
+    p_refit.add_argument('--ratings', default=None)
+    p_check = sub.add_parser('check', help='дрейф инкрементальных обновлений против полного fit')
+    p_check.add_argument('--ratings', default=None, help='по умолчанию синтетика')
+    p_check.add_argument('--batches', type=int, default=10)
+    p_check.add_argument('--new-ratio', type=float, default=0.1)
+    p_check.add_argument('--tolerance', type=float, default=0.05, help='допустимый MAE предсказаний')
+    args = parser.parse_args()
+
+    from recommender import KNN_PARAMS, RATINGS_PATH
+
+    if args.command == 'ingest':
+        print(ingest(args.new_ratings, args.ratings, refit_every=args.refit_every))
+    elif args.command == 'refit':
+        df_ratings = load_ratings(args.ratings or RATINGS_PATH)
+        load_or_fit_knn(df_ratings[RATING_COLUMNS], KNN_PARAMS, exact=True)
+    else:
+        df_ratings = load_ratings(args.ratings) if args.ratings else synthetic_ratings()
+        result = drift_check(df_ratings, KNN_PARAMS, args.batches, args.new_ratio)
+        for name, value in result.items():
+            print(f'{name}: {value:.4f}' if isinstance(value, float) else f'{name}: {value}')
+        if result['all_mae'] > args.tolerance:
+            print(f'FAIL: MAE {result["all_mae"]:.4f} > {args.tolerance}')
+            sys.exit(1)
+        print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from artifacts import ArtifactStore, artifact_key, frame_hash, latest_ratings
+from scoring import top_k_indices
+
+ITEM_NEIGHBORS_ARTIFACT = 'item_neighbors'
+ITEM_NEIGHBORS_PARAMS = {'n_neighbors': 50, 'chunk_size': 2000}
+
+
+# Списки top-N похожих курсов для каждого курса (строки выровнены по df_courses):
+# neighbor_idx int32 (-1 — пусто) и neighbor_sim float32 фиксированной ширины.
+class ItemNeighbors:
+    def __init__(self, neighbor_idx, neighbor_sim):
+        self.neighbor_idx = neighbor_idx
+        self.neighbor_sim = neighbor_sim
+
+    @classmethod
+    def fit(cls, df_ratings, course_index, n_neighbors=50, chunk_size=2000, n_jobs=-1):
+        # Повторная оценка пары заменяет прежнюю, а не суммируется с ней
+        df_ratings = latest_ratings(df_ratings)
+        rows = course_index.get_indexer(df_ratings['course_id'])
+        known = rows >= 0
+        _, user_codes = np.unique(df_ratings['user_id'].to_numpy()[known], return_inverse=True)
+        rates = df_ratings['rate'].to_numpy(dtype=np.float64)[known]
+        rows = rows[known]
+
+        # Центрирование по среднему курса, как в ItemBased из rec_prof.ipynb
+        n_courses = len(course_index)
+        item_sum = np.bincount(rows, weights=rates, minlength=n_courses)
+        item_cnt = np.bincount(rows, minlength=n_courses)
+        item_mean = np.divide(item_sum, item_cnt, out=np.zeros(n_courses), where=item_cnt > 0)
+        R = sp.csr_matrix(
+            ((rates - item_mean[rows]).astype(np.float32), (rows, user_codes)),
+            shape=(n_courses, int(user_codes.max()) + 1 if len(user_codes) else 0)
+        )
+        R.sum_duplicates()
+
+        # user_cf тянет sklearn — импортируется только при построении соседей, не при чтении артефакта
+        from user_cf import chunked_top_k_similarity
+
+        S = chunked_top_k_similarity(R, n_neighbors, chunk_size, n_jobs)
+        neighbor_idx = np.full((n_courses, n_neighbors), -1, dtype=np.int32)
+        neighbor_sim = np.zeros((n_courses, n_neighbors), dtype=np.float32)
+        counts = np.diff(S.indptr)
+        entry_row = np.repeat(np.arange(n_courses), counts)
+        entry_pos = np.arange(S.nnz) - S.indptr[entry_row]
+        neighbor_idx[entry_row, entry_pos] = S.indices
+        neighbor_sim[entry_row, entry_pos] = S.data
+        return cls(neighbor_idx, neighbor_sim)
+
+    # Новые курсы в конце df_courses: соседей у них нет, пока соседи не пересчитаны
+    def add_courses(self, n_courses):
+        width = self.neighbor_idx.shape[1]
+        self.neighbor_idx = np.concatenate([self.neighbor_idx, np.full((n_courses, width), -1, dtype=np.int32)])
+        self.neighbor_sim = np.concatenate([self.neighbor_sim, np.zeros((n_courses, width), dtype=np.float32)])
+
+    # Кандидаты «потому что вы оценили X»: слияние списков соседей курсов из истории.
+    # Стоимость O(len(history) * N), от размера каталога не зависит.
+    def candidates(self, history_rows, n, weights=None):
+        history_rows = np.asarray(history_rows, dtype=np.int64)
+        if len(history_rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        idx = self.neighbor_idx[history_rows].ravel()
+        sims = self.neighbor_sim[history_rows]
+        if weights is not None:
+            sims = sims * np.asarray(weights, dtype=np.float32)[:, None]
+        sims = sims.ravel()
+
+        valid = (idx >= 0) & (sims > 0) & ~np.isin(idx, history_rows)
+        rows, inverse = np.unique(idx[valid], return_inverse=True)
+        scores = np.bincount(inverse, weights=sims[valid], minlength=len(rows))
+        top = top_k_indices(scores, n)
+        return rows[top].astype(np.int64), scores[top].astype(np.float32)
+
+    def save(self, store, key, meta):
+        store.save_arrays(ITEM_NEIGHBORS_ARTIFACT, key, {
+            'neighbor_idx': self.neighbor_idx,
+            'neighbor_sim': self.neighbor_sim,
+        }, meta)
+
+    @classmethod
+    def load(cls, store, key):
+        arrays, _ = store.load_arrays(ITEM_NEIGHBORS_ARTIFACT, key, mmap_mode='r')
+        return cls(arrays['neighbor_idx'], arrays['neighbor_sim'])
+
+
+# Соседи курсов из хранилища артефактов или расчёт и сохранение
+def load_or_fit_item_neighbors(df_ratings, df_courses, params=ITEM_NEIGHBORS_PARAMS, store=None,
+                               n_jobs=-1):
+    store = store or ArtifactStore()
+    data_hash = frame_hash(latest_ratings(df_ratings), ['user_id', 'course_id', 'rate']) + \
+        frame_hash(df_courses, ['course_id'])
+    key = artifact_key(data_hash, params)
+    if store.exists(ITEM_NEIGHBORS_ARTIFACT, key):
+        return ItemNeighbors.load(store, key)
+
+    neighbors = ItemNeighbors.fit(df_ratings, pd.Index(df_courses['course_id']),
+                                  n_jobs=n_jobs, **params)
+    neighbors.save(store, key, {'params': params, 'data_hash': data_hash})
+    return neighbors
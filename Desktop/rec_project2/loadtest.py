@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import urllib.parse
+
+import numpy as np
+
+from recommender import RATINGS_PATH, read_data
+from service import DEFAULT_PORT
+
+DEFAULT_CONCURRENCY = [1, 8, 32, 128]
+
+
+# Одно keep-alive соединение: запросы к /recommend подряд, задержка каждого — в latencies
+async def _worker(host, port, user_ids, top_k, mode, deadline, latencies, errors, rng):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            query = {'user_id': rng.choice(user_ids), 'k': top_k}
+            if mode:
+                query['mode'] = mode
+            request = (f'GET /recommend?{urllib.parse.urlencode(query)} HTTP/1.1\r\n'
+                       f'Host: {host}\r\n\r\n').encode()
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            body = await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(json.loads(body).get('error'))
+    finally:
+        writer.close()
+
+
+async def run_level(host, port, user_ids, concurrency, duration, top_k=10, mode=None, seed=0):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(host, port, user_ids, top_k, mode, deadline, latencies, errors,
+                random.Random(seed + worker))
+        for worker in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) * 1000
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2) if len(latencies) else None,
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест сервиса рекомендаций (service.py)')
+    parser.add_argument('--url', default=f'http://127.0.0.1:{DEFAULT_PORT}')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--duration', type=float, default=10.0, help='секунд на каждый уровень')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--mode', default=None)
+    parser.add_argument('--ratings', default=str(RATINGS_PATH),
+                        help='пользователи для запросов берутся из оценок')
+    args = parser.parse_args()
+
+    url = urllib.parse.urlsplit(args.url)
+    user_ids = read_data(ratings_path=args.ratings)[0]['user_id'].unique().tolist()
+    print(f"{'conc':>5} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for concurrency in args.concurrency:
+        row = asyncio.run(run_level(url.hostname, url.port or 80, user_ids, concurrency,
+                                    args.duration, args.k, args.mode))
+        print(f"{row['concurrency']:>5} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,16 @@
+from warmup import start_background_loading
 import streamlit as st
 import pandas as pd
 
+# Модели и артефакты начинают грузиться в фоне сразу при старте, до выбора страницы
+start_background_loading()
+
 pages = [
     st.Page('bla_bla.py', title = 'О проекте 🫡'), 
     st.Page('about_table.py', title = 'Обзор 🔍'),
     st.Page('metrics.py', title = 'Метрики ⚖️'),
-    st.Page('streamlit_proj.py', title = 'Модель💃')
+    st.Page('streamlit_proj.py', title = 'Модель💃'),
+    st.Page('profiling_page.py', title = 'Профилирование ⏱️')
 
 ]
 pg_h = st.navigation(pages)
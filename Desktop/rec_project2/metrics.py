@@ -13,16 +13,19 @@ st.subheader('Метрики регрессии')
 st.dataframe(df_collab.style.highlight_min(axis=0, subset=['RMSE', 'MAE']), 
              use_container_width=True)
 
-st.write("""На основе представленных метрик видно, что модель SVD показала наилучшие результаты среди всех протестированных подходов:
-- Лучший RMSE (0.706) — значительно точнее предсказывает оценки по сравнению с другими методами
-- Конкурентный MAE (0.524) — уступает только UserBasedCF, но с небольшим отрывом
-- Стабильность — демонстрирует сбалансированную точность по обеим метрикам""")
+# Лучшие модели берутся из таблицы: её пересобирает evaluation.py
+best_rmse = df_collab.loc[df_collab['RMSE'].idxmin()]
+best_mae = df_collab.loc[df_collab['MAE'].idxmin()]
+st.write(f"""На временном разбиении (последние 20% оценок по дате — тест):
+- Лучший RMSE ({best_rmse['RMSE']:.3f}) — у {best_rmse['Model']}
+- Лучший MAE ({best_mae['MAE']:.3f}) — у {best_mae['Model']}
+- Разница между моделями небольшая: почти у всех пользователей в данных одна оценка""")
 
 st.header('2. Контентная фильтрация')
 st.subheader('Метрики ранжирования')
 st.dataframe(df_content.style.highlight_max(axis=0, subset=['Precision@10', 'Recall@10']),  use_container_width=True)
 
-st.write("""Несмотря на нулевые метрики в тестах, Doc2Vec был выбран потому что:
+st.write("""Несмотря на низкие метрики в тестах, Doc2Vec был выбран потому что:
 - Справляется с новыми курсами (cold-start) — там, где коллаборативная фильтрация бессильна
 - Анализирует контент — учитывает описание и темы, а не только оценки
 - Дополняет SVD — даёт рекомендации, когда недостаточно данных о пользователе""")
@@ -0,0 +1,322 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from artifacts import ArtifactStore, artifact_key, frame_hash
+from scoring import top_k_indices
+
+MF_ARTIFACT = 'mf'
+# n_factors/n_epochs/reg — как у SVD из surprise по смыслу; reg умножается на число
+# оценок строки (ALS-WR), поэтому меньше, чем шаговый reg_all у SGD
+MF_PARAMS = {'n_factors': 32, 'n_epochs': 15, 'reg': 0.05, 'init_std': 0.1, 'seed': 0}
+RATING_SCALE = (1, 5)
+# Сколько строк другой стороны за раз превращается во внешние произведения f x f
+SOLVE_BLOCK = 16384
+
+
+# Один шаг ALS для одной стороны: для каждой строки (пользователя или курса) решается
+# (X^T X + reg * n I) w = X^T r, где X — факторы другой стороны с единичным столбцом
+# (последняя компонента w — смещение). X^T X всех строк — разреженная матрица оценок,
+# умноженная на внешние произведения x x^T другой стороны (блоками по SOLVE_BLOCK);
+# системы решаются одним батчевым np.linalg.solve (LAPACK)
+def _solve_side(rows, cols, targets, fixed, n_rows, reg, block=SOLVE_BLOCK):
+    from scipy.sparse import csr_matrix
+
+    n_dims = fixed.shape[1] + 1
+    features = np.hstack([fixed.astype(np.float64), np.ones((len(fixed), 1))])
+    order = np.argsort(cols, kind='stable')
+    rows, cols, targets = rows[order], cols[order], targets[order]
+    lhs = np.zeros((n_rows, n_dims * n_dims))
+    rhs = np.zeros((n_rows, n_dims))
+    for start in range(0, len(features), block):
+        lo, hi = np.searchsorted(cols, [start, start + block])
+        if lo == hi:
+            continue
+        x = features[start:start + block]
+        shape = (n_rows, len(x))
+        index = (rows[lo:hi], cols[lo:hi] - start)
+        lhs += csr_matrix((np.ones(hi - lo), index), shape=shape) @ \
+            (x[:, :, None] * x[:, None, :]).reshape(len(x), -1)
+        rhs += csr_matrix((targets[lo:hi], index), shape=shape) @ x
+    lhs = lhs.reshape(n_rows, n_dims, n_dims)
+    counts = np.bincount(rows, minlength=n_rows)
+    lhs += (reg * np.maximum(counts, 1))[:, None, None] * np.eye(n_dims)
+    solution = np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0]
+    return solution[:, :-1], solution[:, -1]
+
+
+def _assign_ids(raw_ids, raw2inner):
+    for raw_id in pd.unique(raw_ids):
+        if raw_id not in raw2inner:
+            raw2inner[raw_id] = len(raw2inner)
+    return np.array([raw2inner[raw_id] for raw_id in raw_ids.tolist()], dtype=np.int64)
+
+
+# Смещённая матричная факторизация: r_ui = mu + b_u + b_i + p_u . q_i, обучение ALS.
+# Факторы хранятся во float32; весь каталог для пользователя — одно произведение
+# матрицы на вектор, для батча пользователей — одно матричное произведение (BLAS).
+# Интерфейс скорера совпадает с KNNBaselineScorer: HybridRecommender принимает
+# модель как cf_model без обёртки
+class BiasedMF:
+    def __init__(self, global_mean, user_factors, item_factors, user_bias, item_bias,
+                 raw_user_ids, raw_item_ids, users, items, ratings, params=MF_PARAMS,
+                 rating_scale=RATING_SCALE):
+        self.global_mean = float(global_mean)
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.user_bias = user_bias
+        self.item_bias = item_bias
+        self.raw2inner_users = {uid: inner for inner, uid in enumerate(np.asarray(raw_user_ids).tolist())}
+        self.raw2inner_items = {iid: inner for inner, iid in enumerate(np.asarray(raw_item_ids).tolist())}
+        # Обучающие оценки во внутренних id — для дообучения новыми оценками
+        self.users = users
+        self.items = items
+        self.ratings = ratings
+        self.params = params
+        self.rating_scale = rating_scale
+
+    @classmethod
+    def fit(cls, df_ratings, params=MF_PARAMS, rating_scale=RATING_SCALE):
+        raw2inner_users, raw2inner_items = {}, {}
+        users = _assign_ids(df_ratings['user_id'].to_numpy(), raw2inner_users)
+        items = _assign_ids(df_ratings['course_id'].to_numpy(), raw2inner_items)
+        ratings = df_ratings['rate'].to_numpy(dtype=np.float64)
+        global_mean = ratings.mean() if len(ratings) else np.mean(rating_scale)
+
+        rng = np.random.default_rng(params['seed'])
+        n_users, n_items = len(raw2inner_users), len(raw2inner_items)
+        user_factors = rng.normal(0, params['init_std'], (n_users, params['n_factors']))
+        item_factors = rng.normal(0, params['init_std'], (n_items, params['n_factors']))
+        user_bias, item_bias = np.zeros(n_users), np.zeros(n_items)
+        residual = ratings - global_mean
+        for _ in range(params['n_epochs']):
+            user_factors, user_bias = _solve_side(users, items, residual - item_bias[items],
+                                                  item_factors, n_users, params['reg'])
+            item_factors, item_bias = _solve_side(items, users, residual - user_bias[users],
+                                                  user_factors, n_items, params['reg'])
+        return cls(global_mean, user_factors.astype(np.float32), item_factors.astype(np.float32),
+                   user_bias.astype(np.float32), item_bias.astype(np.float32),
+                   list(raw2inner_users), list(raw2inner_items), users.astype(np.int32),
+                   items.astype(np.int32), ratings.astype(np.float32), params, rating_scale)
+
+    @property
+    def n_items(self):
+        return len(self.item_bias)
+
+    def to_inner_items(self, item_ids):
+        raw2inner = self.raw2inner_items
+        return np.array([raw2inner.get(iid, -1) for iid in item_ids], dtype=np.int64)
+
+    def knows_user(self, user_id):
+        return user_id in self.raw2inner_users
+
+    # Оценки всех внутренних айтемов; неизвестный пользователь — только смещения курсов
+    def estimate_all(self, user_id):
+        u = self.raw2inner_users.get(user_id)
+        est = self.global_mean + self.item_bias
+        if u is not None:
+            est = est + self.user_bias[u] + self.item_factors @ self.user_factors[u]
+        return np.clip(est, *self.rating_scale)
+
+    # Оценки для внутренних id (-1 — курс неизвестен модели: mu + b_u)
+    def estimate(self, user_id, inner_items):
+        inner_items = np.asarray(inner_items, dtype=np.int64)
+        known = inner_items >= 0
+        out = np.empty(len(inner_items), dtype=np.float64)
+        u = self.raw2inner_users.get(user_id)
+        if len(inner_items) * 4 < self.n_items:
+            items = inner_items[known]
+            est = self.global_mean + self.item_bias[items]
+            if u is not None:
+                est = est + self.user_bias[u] + self.item_factors[items] @ self.user_factors[u]
+            out[known] = np.clip(est, *self.rating_scale)
+        else:
+            out[known] = self.estimate_all(user_id)[inner_items[known]]
+        if not known.all():
+            unknown_est = self.global_mean + (self.user_bias[u] if u is not None else 0.0)
+            out[~known] = np.clip(unknown_est, *self.rating_scale)
+        return out
+
+    # Факторы и смещения пользователей (неизвестный — нули), например для shared_scoring.py
+    def user_vectors(self, user_ids):
+        rows = np.array([self.raw2inner_users.get(user_id, -1) for user_id in user_ids], dtype=np.int64)
+        known = rows >= 0
+        user_factors = np.where(known[:, None], self.user_factors[np.maximum(rows, 0)], 0)
+        user_bias = np.where(known, self.user_bias[np.maximum(rows, 0)], 0)
+        return user_factors.astype(np.float32), user_bias.astype(np.float32)
+
+    # Матрица оценок (пользователи x inner_items) одним произведением
+    def estimate_batch(self, user_ids, inner_items):
+        inner_items = np.asarray(inner_items, dtype=np.int64)
+        user_factors, user_bias = self.user_vectors(user_ids)
+        est = user_factors @ self.item_factors.T + (self.global_mean + self.item_bias)
+        est = np.clip(est + user_bias[:, None], *self.rating_scale)
+        out = np.empty((len(user_bias), len(inner_items)), dtype=np.float64)
+        item_known = inner_items >= 0
+        out[:, item_known] = est[:, inner_items[item_known]]
+        out[:, ~item_known] = np.clip(self.global_mean + user_bias, *self.rating_scale)[:, None]
+        return out
+
+    # Top-K внутренних id по всему каталогу: произведение + argpartition
+    def top_k(self, user_id, k=10):
+        scores = self.estimate_all(user_id)
+        top = top_k_indices(scores, k)
+        return top, scores[top]
+
+    def top_k_batch(self, user_ids, k=10):
+        scores = self.estimate_batch(user_ids, np.arange(self.n_items))
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    # Микро-батч новых оценок: новые id получают нулевые факторы, затем для затронутых
+    # пользователей и курсов — по одному шагу ALS при фиксированной другой стороне
+    def add_ratings(self, df_new):
+        started = time.perf_counter()
+        n_users_before, n_items_before = len(self.user_bias), self.n_items
+        users = _assign_ids(df_new['user_id'].to_numpy(), self.raw2inner_users)
+        items = _assign_ids(df_new['course_id'].to_numpy(), self.raw2inner_items)
+        n_factors = self.user_factors.shape[1]
+        self.user_factors = np.vstack([self.user_factors, np.zeros(
+            (len(self.raw2inner_users) - n_users_before, n_factors), dtype=np.float32)])
+        self.user_bias = np.concatenate([self.user_bias, np.zeros(
+            len(self.raw2inner_users) - n_users_before, dtype=np.float32)])
+        self.item_factors = np.vstack([self.item_factors, np.zeros(
+            (len(self.raw2inner_items) - n_items_before, n_factors), dtype=np.float32)])
+        self.item_bias = np.concatenate([self.item_bias, np.zeros(
+            len(self.raw2inner_items) - n_items_before, dtype=np.float32)])
+        self.users = np.concatenate([self.users, users.astype(np.int32)])
+        self.items = np.concatenate([self.items, items.astype(np.int32)])
+        self.ratings = np.concatenate([self.ratings, df_new['rate'].to_numpy(dtype=np.float32)])
+
+        affected_users, affected_items = np.unique(users), np.unique(items)
+        self._refine('user', affected_users)
+        self._refine('item', affected_items)
+        return {
+            'ratings': len(df_new),
+            'full_refit': False,
+            'new_users': len(self.raw2inner_users) - n_users_before,
+            'new_items': len(self.raw2inner_items) - n_items_before,
+            'affected_users': len(affected_users),
+            'affected_items': len(affected_items),
+            'time_s': time.perf_counter() - started,
+        }
+
+    def _refine(self, side, targets):
+        own, other = (self.users, self.items) if side == 'user' else (self.items, self.users)
+        other_factors = self.item_factors if side == 'user' else self.user_factors
+        other_bias = self.item_bias if side == 'user' else self.user_bias
+        mask = np.isin(own, targets)
+        local = np.searchsorted(targets, own[mask])
+        factors, bias = _solve_side(
+            local, other[mask].astype(np.int64),
+            self.ratings[mask] - self.global_mean - other_bias[other[mask]],
+            other_factors, len(targets), self.params['reg'])
+        if side == 'user':
+            self.user_factors[targets], self.user_bias[targets] = factors, bias
+        else:
+            self.item_factors[targets], self.item_bias[targets] = factors, bias
+
+    def save(self, store, key, meta=None):
+        store.save_arrays(MF_ARTIFACT, key, {
+            'user_factors': self.user_factors, 'item_factors': self.item_factors,
+            'user_bias': self.user_bias, 'item_bias': self.item_bias,
+            'raw_user_ids': np.array(list(self.raw2inner_users)),
+            'raw_item_ids': np.array(list(self.raw2inner_items)),
+            'users': self.users, 'items': self.items, 'ratings': self.ratings,
+        }, dict(meta or {}, params=self.params, global_mean=self.global_mean,
+                rating_scale=list(self.rating_scale)))
+
+    # Факторы читаются через mmap; add_ratings заменяет массивы копиями
+    @classmethod
+    def load(cls, store, key):
+        arrays, meta = store.load_arrays(MF_ARTIFACT, key, mmap_mode='r')
+        return cls(meta['global_mean'], params=meta['params'],
+                   rating_scale=tuple(meta['rating_scale']), **arrays)
+
+
+def mf_key(df_ratings, params=MF_PARAMS):
+    return artifact_key(frame_hash(df_ratings, ['user_id', 'course_id', 'rate']),
+                        {'model': 'biased_mf', 'params': params})
+
+
+# BiasedMF из хранилища, если оценки и гиперпараметры не менялись, иначе fit и сохранение
+def load_or_fit_mf(df_ratings, params=MF_PARAMS, store=None):
+    store = store or ArtifactStore()
+    key = mf_key(df_ratings, params)
+    if store.exists(MF_ARTIFACT, key):
+        return BiasedMF.load(store, key)
+    model = BiasedMF.fit(df_ratings, params)
+    model.save(store, key, {'n_ratings': len(df_ratings)})
+    return model
+
+
+# KNNBaseline (весь каталог по соседям) против BiasedMF: обучение и скоринг каталога
+def bench(n_ratings, n_users, n_courses, batch_size=256, n_queries=200):
+    from dataset import load_ratings, write_synthetic_ratings
+    from scoring import KNNBaselineScorer
+    from recommender import KNN_PARAMS
+    from artifacts import load_or_fit_knn
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ratings.csv')
+        write_synthetic_ratings(path, n_ratings, n_users=n_users, n_courses=n_courses)
+        store = ArtifactStore(tmp)
+        df_ratings = load_ratings(path, ['user_id', 'course_id', 'rate'], store=store)
+        rows = []
+
+        started = time.perf_counter()
+        mf = BiasedMF.fit(df_ratings)
+        rows.append(('BiasedMF', 'fit_s', time.perf_counter() - started))
+        started = time.perf_counter()
+        knn = KNNBaselineScorer(load_or_fit_knn(df_ratings, KNN_PARAMS, store))
+        rows.append(('KNNBaseline', 'fit_s', time.perf_counter() - started))
+
+        user_ids = df_ratings['user_id'].drop_duplicates().to_numpy()[:max(n_queries, batch_size)]
+        for name, scorer in [('BiasedMF', mf), ('KNNBaseline', knn)]:
+            items = scorer.to_inner_items(np.arange(n_courses))
+            started = time.perf_counter()
+            for user_id in user_ids[:n_queries]:
+                top_k_indices(scorer.estimate(user_id, items), 10)
+            rows.append((name, 'top10_one_user_ms', (time.perf_counter() - started) / n_queries * 1000))
+            started = time.perf_counter()
+            scores = scorer.estimate_batch(user_ids[:batch_size], items)
+            np.argpartition(-scores, 9, axis=1)[:, :10]
+            rows.append((name, f'top10_batch{batch_size}_ms_per_user',
+                         (time.perf_counter() - started) / batch_size * 1000))
+        return pd.DataFrame(rows, columns=['model', 'metric', 'value']).pivot(
+            index='metric', columns='model', values='value')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Матричная факторизация (ALS) для CF-части')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    fit_parser = subparsers.add_parser('fit', help='обучить на текущих оценках и сохранить')
+    fit_parser.add_argument('--factors', type=int, default=MF_PARAMS['n_factors'])
+    fit_parser.add_argument('--epochs', type=int, default=MF_PARAMS['n_epochs'])
+    bench_parser = subparsers.add_parser('bench', help='BiasedMF против KNNBaseline')
+    bench_parser.add_argument('--ratings', type=int, default=200_000)
+    bench_parser.add_argument('--users', type=int, default=5_000)
+    bench_parser.add_argument('--courses', type=int, default=2_000)
+    args = parser.parse_args()
+
+    if args.command == 'fit':
+        from dataset import load_ratings
+
+        params = dict(MF_PARAMS, n_factors=args.factors, n_epochs=args.epochs)
+        started = time.perf_counter()
+        model = load_or_fit_mf(load_ratings(columns=['user_id', 'course_id', 'rate']), params)
+        print(f'users: {len(model.user_bias)}, courses: {model.n_items}, '
+              f'factors: {model.user_factors.shape[1]}, {time.perf_counter() - started:.2f}s')
+    else:
+        print(bench(args.ratings, args.users, args.courses).round(4).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from artifacts import ArtifactStore, artifact_key, frame_hash, latest_ratings
+from profiling import timer
+
+PROFILES_ARTIFACT = 'profiles'
+# Период полураспада веса оценки и вес оценки r: r - rating_offset (0 — все оценки с плюсом)
+PROFILE_PARAMS = {'half_life_days': 180, 'rating_offset': 0.0}
+
+
+# Секунды от эпохи; нераспознанная дата — NaN
+def _timestamps(dates):
+    dates = pd.to_datetime(pd.Series(dates), errors='coerce')
+    return (dates - pd.Timestamp(0)).dt.total_seconds().to_numpy()
+
+
+# Профили пользователей: строка float32 на пользователя — сумма векторов его курсов с весом
+# (r - rating_offset) * 2^(-(t_ref - t) / half_life), где t_ref — время последней оценки.
+# Новая оценка: сумма домножается на затухание от t_ref до её времени и к ней прибавляется
+# вектор курса — O(dim), независимо от длины истории. Косинус к профилю от общего
+# множителя не зависит, поэтому хранится ненормированная сумма.
+class UserProfileStore:
+    def __init__(self, user_ids, sums, ref_time, half_life_days=PROFILE_PARAMS['half_life_days'],
+                 rating_offset=PROFILE_PARAMS['rating_offset']):
+        self.sums = sums
+        self.ref_time = ref_time
+        self.half_life_days = half_life_days
+        self.rating_offset = rating_offset
+        self.decay_rate = np.log(2) / (half_life_days * 86400)
+        self.user_to_row = {uid: row for row, uid in enumerate(np.asarray(user_ids).tolist())}
+        self.n_users = len(self.user_to_row)
+
+    @classmethod
+    def build(cls, df_ratings, embeddings, course_index, half_life_days=PROFILE_PARAMS['half_life_days'],
+              rating_offset=PROFILE_PARAMS['rating_offset']):
+        # Повторная оценка пары заменяет прежнюю, а не суммируется с ней
+        df_ratings = latest_ratings(df_ratings)
+        rows = course_index.get_indexer(df_ratings['course_id'])
+        known = rows >= 0
+        user_ids, user_rows = np.unique(df_ratings['user_id'].to_numpy()[known], return_inverse=True)
+        if 'date' in df_ratings:
+            times = _timestamps(df_ratings['date'].to_numpy()[known])
+        else:
+            times = np.full(int(known.sum()), np.nan)
+        ref_time = np.full(len(user_ids), -np.inf)
+        np.fmax.at(ref_time, user_rows, times)
+        # Оценки без даты считаются сделанными в момент последней оценки пользователя
+        ref_time[~np.isfinite(ref_time)] = 0.0
+        times = np.where(np.isnan(times), ref_time[user_rows], times)
+        decay_rate = np.log(2) / (half_life_days * 86400)
+        weights = (df_ratings['rate'].to_numpy()[known] - rating_offset) * \
+            np.exp(-decay_rate * (ref_time[user_rows] - times))
+        W = sparse.csr_matrix((weights, (user_rows, rows[known])),
+                              shape=(len(user_ids), len(embeddings)))
+        sums = np.asarray(W @ embeddings, dtype=np.float32)
+        return cls(user_ids, sums, ref_time, half_life_days, rating_offset)
+
+    def __len__(self):
+        return self.n_users
+
+    def _row(self, user_id):
+        row = self.user_to_row.get(user_id)
+        if row is None:
+            row = self.n_users
+            if row == len(self.sums):
+                capacity = max(16, 2 * len(self.sums))
+                sums = np.zeros((capacity, self.sums.shape[1]), dtype=np.float32)
+                sums[:row] = self.sums[:row]
+                ref_time = np.full(capacity, -np.inf)
+                ref_time[:row] = self.ref_time[:row]
+                self.sums, self.ref_time = sums, ref_time
+            self.user_to_row[user_id] = row
+            self.n_users += 1
+        return row
+
+    # Одна новая оценка за O(dim); оценка из прошлого затухает относительно t_ref
+    def update(self, user_id, course_vector, rate, timestamp):
+        row = self._row(user_id)
+        weight = rate - self.rating_offset
+        if timestamp >= self.ref_time[row]:
+            if np.isfinite(self.ref_time[row]):
+                self.sums[row] *= np.exp(-self.decay_rate * (timestamp - self.ref_time[row]))
+            self.ref_time[row] = timestamp
+        else:
+            weight *= np.exp(-self.decay_rate * (self.ref_time[row] - timestamp))
+        self.sums[row] += weight * course_vector
+
+    # Микро-батч оценок. Повторная оценка пары (по df_ratings — прежним оценкам — или внутри
+    # батча) заменяет прежнюю: строки таких пользователей пересобираются по их оценкам без
+    # дублей, как в build; остальные обновляются за O(dim) на оценку
+    def add_ratings(self, df_new, embeddings, course_index, df_ratings=None):
+        keys = ['user_id', 'course_id']
+        rerated = df_new[keys].duplicated(keep=False).to_numpy()
+        if df_ratings is not None:
+            rerated = rerated | pd.MultiIndex.from_frame(df_new[keys]).isin(pd.MultiIndex.from_frame(df_ratings[keys]))
+        rebuild_users = pd.unique(df_new.loc[rerated, 'user_id'])
+        if len(rebuild_users):
+            history = df_ratings[df_ratings['user_id'].isin(rebuild_users)] if df_ratings is not None else None
+            self._rebuild_users(pd.concat([history, df_new[df_new['user_id'].isin(rebuild_users)]],
+                                          ignore_index=True), embeddings, course_index)
+            df_new = df_new[~df_new['user_id'].isin(rebuild_users)]
+
+        rows = course_index.get_indexer(df_new['course_id'])
+        times = _timestamps(df_new['date']) if 'date' in df_new else np.full(len(df_new), np.nan)
+        for user_id, row, rate, timestamp in zip(df_new['user_id'], rows, df_new['rate'], times):
+            if row < 0:
+                continue
+            if np.isnan(timestamp):
+                ref = self.ref_time[self.user_to_row[user_id]] if user_id in self.user_to_row else 0.0
+                timestamp = ref if np.isfinite(ref) else 0.0
+            self.update(user_id, embeddings[row], rate, timestamp)
+
+    def _rebuild_users(self, df_users, embeddings, course_index):
+        built = UserProfileStore.build(df_users, embeddings, course_index, self.half_life_days,
+                                       self.rating_offset)
+        for user_id in pd.unique(df_users['user_id']):
+            row = self._row(user_id)
+            built_row = built.user_to_row.get(user_id)
+            if built_row is None:
+                self.sums[row] = 0
+                self.ref_time[row] = -np.inf
+            else:
+                self.sums[row] = built.sums[built_row]
+                self.ref_time[row] = built.ref_time[built_row]
+
+    # Нормированный профиль или None (нет истории или нулевой вектор)
+    def profile(self, user_id):
+        row = self.user_to_row.get(user_id)
+        if row is None:
+            return None
+        vector = np.asarray(self.sums[row])
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    # Нормированные профили набора пользователей построчно (нули — профиля нет)
+    def profile_matrix(self, user_ids):
+        matrix = np.zeros((len(user_ids), self.sums.shape[1]), dtype=np.float32)
+        for pos, user_id in enumerate(user_ids):
+            profile = self.profile(user_id)
+            if profile is not None:
+                matrix[pos] = profile
+        return matrix
+
+    # Косинус профиля к кандидатам (-1 — курса нет в каталоге, score 0)
+    def scores(self, user_id, embeddings, candidate_rows):
+        candidate_rows = np.asarray(candidate_rows)
+        scores = np.zeros(len(candidate_rows), dtype=np.float32)
+        with timer.stage('content.profile'):
+            profile = self.profile(user_id)
+        if profile is None:
+            return scores
+        known = candidate_rows >= 0
+        with timer.stage('content.gather'):
+            vectors = embeddings[candidate_rows[known]]
+        with timer.stage('content.cosine'):
+            scores[known] = vectors @ profile
+        return scores
+
+    def save(self, store, key, meta):
+        user_ids = np.array(list(self.user_to_row))
+        store.save_arrays(PROFILES_ARTIFACT, key, {
+            'user_ids': user_ids,
+            'sums': self.sums[:self.n_users],
+            'ref_time': self.ref_time[:self.n_users],
+        }, dict(meta, half_life_days=self.half_life_days, rating_offset=self.rating_offset))
+
+    # mmap_mode='c': страницы читаются с диска, а update меняет только копию в памяти
+    @classmethod
+    def load(cls, store, key, mmap_mode='c'):
+        arrays, meta = store.load_arrays(PROFILES_ARTIFACT, key, mmap_mode=mmap_mode)
+        return cls(arrays['user_ids'], arrays['sums'], arrays['ref_time'],
+                   meta['half_life_days'], meta['rating_offset'])
+
+
+@timer.timed('load.profiles')
+def load_or_build_profiles(df_ratings, df_courses, embeddings, params=PROFILE_PARAMS, store=None):
+    store = store or ArtifactStore()
+    columns = [c for c in ['user_id', 'course_id', 'rate', 'date'] if c in df_ratings]
+    data_hash = frame_hash(latest_ratings(df_ratings), columns) + \
+        frame_hash(df_courses, ['course_id']) + frame_hash(pd.DataFrame(embeddings))
+    key = artifact_key(data_hash, params)
+    if store.exists(PROFILES_ARTIFACT, key):
+        return UserProfileStore.load(store, key)
+
+    profiles = UserProfileStore.build(df_ratings, embeddings, pd.Index(df_courses['course_id']),
+                                      **params)
+    profiles.save(store, key, {'params': params, 'data_hash': data_hash})
+    return profiles
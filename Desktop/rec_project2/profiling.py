@@ -0,0 +1,226 @@
+import argparse
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+PROFILING_ENV = 'REC_PROFILING'
+DEFAULT_WINDOW = 2048
+DEFAULT_MAX_PROFILES = 20
+PROFILE_TOP_FUNCTIONS = 25
+
+
+class _NoopStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+class _Stage:
+    __slots__ = ('samples', 'name', 'started')
+
+    def __init__(self, samples, name):
+        self.samples = samples
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.started)
+        return False
+
+
+# Таймеры стадий и счётчики. Выключенный реестр отдаёт общий пустой контекст —
+# цена стадии — один вызов метода. Для каждой стадии хранится окно последних window
+# длительностей (deque: append из потоков Streamlit безопасен), перцентили считаются
+# по окну в snapshot. Включённый capture_profiles снимает cProfile каждого request().
+class StageTimer:
+    def __init__(self, enabled=False, window=DEFAULT_WINDOW, max_profiles=DEFAULT_MAX_PROFILES):
+        self.enabled = enabled
+        self.capture_profiles = False
+        self.window = window
+        self._samples = {}
+        self.counters = {}
+        self.profiles = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _window(self, name):
+        samples = self._samples.get(name)
+        if samples is None:
+            with self._lock:
+                samples = self._samples.setdefault(name, deque(maxlen=self.window))
+        return samples
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NOOP
+        return _Stage(self._window(name), name)
+
+    # Декоратор: стадия вокруг всей функции (загрузка моделей и т.п.)
+    def timed(self, name):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    # Стадия верхнего уровня; при capture_profiles — ещё и cProfile этого запроса.
+    # Вложенные request() (recommend внутри сервиса) профилируются один раз
+    def request(self, name, label=None):
+        if not self.enabled:
+            return _NOOP
+        if not self.capture_profiles or getattr(self._local, 'profiling', False):
+            return self.stage(name)
+        return _ProfiledRequest(self, name, label)
+
+    def _store_profile(self, name, label, profiler, elapsed):
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        self.profiles.append({
+            'stage': name, 'label': None if label is None else str(label),
+            'time': time.time(), 'elapsed_ms': elapsed * 1000, 'stats': out.getvalue(),
+        })
+
+    def snapshot(self):
+        with self._lock:
+            windows = {name: list(samples) for name, samples in self._samples.items()}
+            counters = dict(self.counters)
+        stages = {}
+        for name, samples in sorted(windows.items()):
+            if not samples:
+                continue
+            ms = np.array(samples) * 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            stages[name] = {
+                'count': len(ms), 'mean_ms': float(ms.mean()), 'p50_ms': float(p50),
+                'p95_ms': float(p95), 'p99_ms': float(p99), 'max_ms': float(ms.max()),
+            }
+        return {'enabled': self.enabled, 'window': self.window, 'stages': stages,
+                'counters': counters, 'profiles': len(self.profiles)}
+
+    def to_json(self, include_profiles=False):
+        data = self.snapshot()
+        if include_profiles:
+            data['profiles'] = list(self.profiles)
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self.counters.clear()
+            self.profiles.clear()
+
+
+class _ProfiledRequest:
+    def __init__(self, timer, name, label):
+        self.timer = timer
+        self.name = name
+        self.label = label
+        self.stage = timer.stage(name)
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self.timer._local.profiling = True
+        self.stage.__enter__()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        self.stage.__exit__(*exc)
+        self.timer._local.profiling = False
+        self.timer._store_profile(self.name, self.label, self.profiler,
+                                  time.perf_counter() - self.stage.started)
+        return False
+
+
+# Общий реестр процесса; по умолчанию выключен, REC_PROFILING=1 включает с запуска
+# (чтобы попали и загрузки моделей)
+timer = StageTimer(enabled=os.environ.get(PROFILING_ENV) == '1')
+
+
+# Цена стадии выключенного и включённого реестра, нс
+def overhead(n=200_000):
+    results = {}
+    for enabled in (False, True):
+        bench_timer = StageTimer(enabled=enabled)
+        started = time.perf_counter()
+        for _ in range(n):
+            with bench_timer.stage('bench'):
+                pass
+        results['enabled' if enabled else 'disabled'] = (time.perf_counter() - started) / n * 1e9
+    started = time.perf_counter()
+    for _ in range(n):
+        pass
+    results['empty_loop'] = (time.perf_counter() - started) / n * 1e9
+    return results
+
+
+# Прогон рекомендаций по пользователям из df_ratings с включённым реестром. Реестр
+# берётся импортом: при запуске файла скриптом это модуль __main__, а recommender
+# пишет в profiling.timer
+def run(n_requests=200, candidate_mode='cf', top_k=10, capture_profiles=False):
+    from profiling import timer
+    from recommender import HybridRecommender, load_doc2vec_model, load_knn_model, read_data
+
+    timer.enabled = True
+    timer.capture_profiles = capture_profiles
+    df_ratings, df_courses = read_data()
+    recommender = HybridRecommender(load_knn_model(df_ratings), load_doc2vec_model(df_courses),
+                                    df_courses, df_ratings)
+    user_ids = df_ratings['user_id'].unique()
+    for pos in range(n_requests):
+        recommender.recommend(user_ids[pos % len(user_ids)], top_k, candidate_mode)
+    return timer.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Задержки по стадиям рекомендаций')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--mode', default='cf')
+    parser.add_argument('--profile', action='store_true', help='cProfile каждого запроса')
+    parser.add_argument('--json', default=None, help='куда сохранить снимок (JSON)')
+    parser.add_argument('--overhead', action='store_true', help='только цена одной стадии')
+    args = parser.parse_args()
+
+    if args.overhead:
+        for name, ns in overhead().items():
+            print(f'{name}: {ns:.0f} ns')
+        return
+    snapshot = run(args.requests, args.mode, capture_profiles=args.profile)
+    from profiling import timer
+    print(f"{'stage':<28} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, row in snapshot['stages'].items():
+        print(f"{name:<28} {row['count']:>6} {row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} {row['p99_ms']:>8.3f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(timer.to_json(include_profiles=args.profile))
+
+
+if __name__ == '__main__':
+    main()
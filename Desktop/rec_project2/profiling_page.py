@@ -0,0 +1,75 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from profiling import timer
+from warmup import STAGE_LABELS, warmup
+
+st.title('⏱️ Профилирование рекомендаций')
+st.write("""Задержки по стадиям гибридной модели: загрузка моделей, отбор кандидатов,
+оценки CF-модели (KNNBaseline или BiasedMF), Doc2Vec и отзывов, смешивание и отрисовка
+карточек. Перцентили считаются по последним запросам этого процесса (страница «Модель»
+и сервис, если он запущен здесь же).""")
+
+# Таймер один на процесс: переключатели действуют на все сессии и на сервис в этом процессе
+col1, col2 = st.columns(2)
+with col1:
+    timer.enabled = st.toggle('Собирать замеры', value=timer.enabled,
+                              help='Включает сбор для всего процесса: для всех открытых сессий')
+with col2:
+    timer.capture_profiles = st.toggle('cProfile каждого запроса', value=timer.capture_profiles,
+                                       disabled=not timer.enabled,
+                                       help='Для всего процесса, как и сбор замеров')
+st.caption('Переключатели общие для процесса: их видят и меняют все пользователи приложения, '
+           'а замеры включают запросы всех сессий')
+
+snapshot = timer.snapshot()
+if not snapshot['stages']:
+    st.info('Замеров пока нет: включите сбор и получите рекомендации на странице «Модель»')
+else:
+    stages = pd.DataFrame.from_dict(snapshot['stages'], orient='index')
+    stages.index.name = 'stage'
+    stages = stages.reset_index()
+    st.subheader('Стадии')
+    st.dataframe(stages.style.format({c: '{:.3f}' for c in stages.columns if c.endswith('_ms')}),
+                 use_container_width=True, hide_index=True)
+
+    fig = px.bar(stages.sort_values('p95_ms'), x='p95_ms', y='stage', orientation='h',
+                 title='p95 по стадиям, мс', labels={'p95_ms': 'p95, мс', 'stage': 'Стадия'},
+                 color_discrete_sequence=['#636EFA'])
+    st.plotly_chart(fig, use_container_width=True)
+
+if snapshot['counters']:
+    st.subheader('Счётчики')
+    st.dataframe(pd.DataFrame(list(snapshot['counters'].items()), columns=['counter', 'value']),
+                 hide_index=True)
+
+if timer.profiles:
+    st.subheader('Профили последних запросов')
+    for profile in reversed(timer.profiles):
+        with st.expander(f"{profile['stage']} {profile['label'] or ''} — {profile['elapsed_ms']:.1f} мс"):
+            st.code(profile['stats'])
+
+# Запуск процесса (warmup.py): первая отрисовка страницы модели и фоновая загрузка моделей
+startup = warmup.snapshot()
+st.subheader('Запуск')
+col1, col2, col3 = st.columns(3)
+col1.metric('Первая отрисовка, мс', f"{startup['first_render_ms']:.0f}" if startup['first_render_ms'] else '—',
+            help='От импорта warmup.py в main.py до конца первой отрисовки страницы «Модель»')
+col2.metric('Модели готовы, мс', f"{startup['models_ready_ms']:.0f}" if startup['models_ready_ms'] else '—')
+col3.metric('Режим', f"{startup['mode']} ({startup['status']})")
+if startup['first_render_with_models'] is False:
+    st.caption('Первая отрисовка прошла до загрузки моделей — с популярными курсами')
+if startup['stages_ms']:
+    st.dataframe(pd.DataFrame([(STAGE_LABELS.get(name, name), ms) for name, ms in startup['stages_ms'].items()],
+                              columns=['Стадия загрузки', 'мс']),
+                 hide_index=True, column_config={'мс': st.column_config.NumberColumn(format='%.1f')})
+st.caption('Время импорта модулей и первой отрисовки в новом процессе: `python warmup.py`')
+
+col1, col2 = st.columns(2)
+with col1:
+    st.download_button('Скачать JSON', timer.to_json(include_profiles=True),
+                       file_name='profiling.json', mime='application/json')
+with col2:
+    if st.button('Сбросить замеры'):
+        timer.reset()
+        st.rerun()
@@ -0,0 +1,474 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from artifacts import artifact_key, frame_hash, load_or_fit_knn, load_or_train_doc2vec
+from candidates import CandidatePool
+from coldstart import PopularityRanking, course_embeddings, embed_courses
+from dataset import COURSES_PATH, RATINGS_PATH, load_courses, load_ratings
+from filters import AttributeIndex
+from incremental import IncrementalKNNBaseline
+from mf import MF_PARAMS, BiasedMF, load_or_fit_mf
+from profiles import UserProfileStore
+from profiling import timer
+from scoring import KNNBaselineScorer, UserHistoryIndex, top_k_indices
+from text_pipeline import CourseCorpus
+from vector_index import build_course_index
+
+
+# Гиперпараметры моделей (входят в ключ артефактов)
+DOC2VEC_PARAMS = {'vector_size': 50, 'min_count': 2, 'epochs': 20, 'workers': 4}
+KNN_PARAMS = {
+    'k': 10,
+    'sim_options': {'name': 'pearson_baseline', 'user_based': True},
+    'bsl_options': {'method': 'als', 'n_epochs': 5, 'reg_u': 15, 'reg_i': 5},
+}
+# CF-часть гибрида: 'knn' — KNNBaseline (surprise), 'mf' — BiasedMF (mf.py)
+CF_MODEL = os.environ.get('REC_CF_MODEL', 'knn')
+# Веса смешивания CF и контента и размер пула кандидатов (подбираются в tuning.py)
+CF_WEIGHT = 0.7
+CONTENT_WEIGHT = 0.3
+# Вес близости отзывов (comments.py); учитывается, только если векторы отзывов переданы
+COMMENT_WEIGHT = 0.1
+N_CANDIDATES = 100
+
+
+# Чтение датасетов без Streamlit через колоночный слой (dataset.py): CSV конвертируется
+# один раз, переименование колонок и description — там же
+def read_data(ratings_path=RATINGS_PATH, courses_path=COURSES_PATH):
+    return load_ratings(ratings_path), load_courses(courses_path)
+
+
+# Текстовое описание курса: все строковые и категориальные колонки в нижнем регистре через пробел.
+# Каталог из dataset.py приходит с готовым description — тогда ничего не делаем
+def add_description(df_courses):
+    if 'description' in df_courses.columns:
+        return df_courses
+    string_cols = df_courses.select_dtypes(include=['object', 'category']).astype(object)
+    string_cols = string_cols.fillna('').apply(lambda col: col.str.lower())
+    df_courses['description'] = string_cols.apply(lambda row: ' '.join(filter(None, row)), axis=1)
+    return df_courses
+
+
+# tokens — готовые токены description по строкам каталога (dataset.load_course_tokens);
+# без них — потоковый корпус поверх кэша токенов (text_pipeline.py)
+def build_documents(df_courses, tokens=None):
+    from gensim.models.doc2vec import TaggedDocument
+
+    if tokens is None:
+        return CourseCorpus(df_courses['description'], df_courses.index)
+    return [
+        TaggedDocument(words=words, tags=[str(idx)])
+        for idx, words in zip(df_courses.index, tokens)
+    ]
+
+
+@timer.timed('load.doc2vec')
+def load_doc2vec_model(df_courses, tokens=None, params=DOC2VEC_PARAMS, store=None):
+    return load_or_train_doc2vec(df_courses['description'],
+                                 lambda: build_documents(df_courses, tokens), params, store)
+
+
+@timer.timed('load.knn')
+def load_knn_model(df_ratings):
+    # Проверяем и переименовываем колонки
+    if 'userId' in df_ratings.columns:
+        df_ratings = df_ratings.rename(columns={'userId': 'user_id'})
+    if 'course_id' not in df_ratings.columns and 'Course ID' in df_ratings.columns:
+        df_ratings = df_ratings.rename(columns={'Course ID': 'course_id'})
+    if 'rate' not in df_ratings.columns and 'rating' in df_ratings.columns:
+        df_ratings = df_ratings.rename(columns={'rating': 'rate'})
+
+    return load_or_fit_knn(df_ratings, KNN_PARAMS)
+
+
+@timer.timed('load.mf')
+def load_mf_model(df_ratings):
+    return load_or_fit_mf(df_ratings[['user_id', 'course_id', 'rate']], MF_PARAMS)
+
+
+# CF-модель по CF_MODEL (REC_CF_MODEL): обе из версионированных артефактов
+def load_cf_model(df_ratings, kind=None):
+    kind = kind or CF_MODEL
+    if kind == 'mf':
+        return load_mf_model(df_ratings)
+    if kind != 'knn':
+        raise ValueError(f'unknown cf model: {kind!r}')
+    return load_knn_model(df_ratings)
+
+
+# Гиперпараметры CF-части для ключей: KNN_PARAMS или MF_PARAMS
+def cf_params(kind=None):
+    kind = kind or CF_MODEL
+    return {'knn': KNN_PARAMS} if kind == 'knn' else {'cf': kind, 'mf': MF_PARAMS}
+
+
+# Версия данных и моделей для ключей кэша рекомендаций: меняется вместе с оценками,
+# каталогом или гиперпараметрами, как и ключи артефактов
+def model_version(df_ratings, df_courses, cf_kind=None):
+    data_hash = frame_hash(df_ratings, ['user_id', 'course_id', 'rate']) + \
+        frame_hash(df_courses, ['course_id'])
+    return artifact_key(data_hash, dict(cf_params(cf_kind), doc2vec=DOC2VEC_PARAMS))
+
+
+# Класс рекомендателя
+class HybridRecommender:
+    def __init__(self, cf_model, doc2vec_model, df_courses, df_ratings, n_candidates=N_CANDIDATES,
+                 topk_store=None, item_neighbors=None, candidate_mode='cf', vector_index=None,
+                 cf_weight=CF_WEIGHT, content_weight=CONTENT_WEIGHT, result_cache=None,
+                 version=None, profiles=None, comment_vectors=None, comment_weight=COMMENT_WEIGHT):
+        self.cf_model = cf_model
+        # BiasedMF сам является скорером; KNNBaseline оборачивается в KNNBaselineScorer
+        self.cf_kind = 'mf' if isinstance(cf_model, BiasedMF) else 'knn'
+        self.doc2vec_model = doc2vec_model
+        self.df_courses = df_courses
+        self.df_ratings = df_ratings
+        self.n_candidates = n_candidates
+        self.cf_weight = cf_weight
+        self.content_weight = content_weight
+        # Предпосчитанный офлайн top-K (см. batch_recommend.py), читается в первую очередь
+        self.topk_store = topk_store
+        # Кэш готовых top-K (result_cache.py) и версия моделей для его ключей
+        self.result_cache = result_cache
+        self.version = version or model_version(df_ratings, df_courses, self.cf_kind)
+        # Дообучение KNN новыми оценками (incremental.py) создаётся при первом add_ratings;
+        # для обновлённых пользователей офлайн top-K устарел
+        self.incremental = None
+        self.updated_users = set()
+        # Источник кандидатов: 'cf' — весь каталог через KNN, 'item' — соседи оценённых курсов,
+        # 'content' — близкие к профилю + популярное в категориях + новинки
+        self.item_neighbors = item_neighbors
+        self.candidate_mode = candidate_mode
+        self.course_id_to_idx = {cid: idx for idx, cid in enumerate(df_courses['course_id'])}
+        # Пакетный скорер CF и внутренние id каталога считаются один раз
+        self.valid_items = df_courses['course_id'].unique()
+        self.cf_scorer = cf_model if self.cf_kind == 'mf' else KNNBaselineScorer(cf_model)
+        self.valid_inner_items = self.cf_scorer.to_inner_items(self.valid_items)
+        self.row_inner_items = self.cf_scorer.to_inner_items(df_courses['course_id'])
+        # История пользователей и нормированные векторы курсов, выровненные по df_courses
+        self.course_index = pd.Index(df_courses['course_id'])
+        self.history_index = UserHistoryIndex(df_ratings, self.course_index)
+        self.embeddings = course_embeddings(doc2vec_model, df_courses)
+        # Профили с затуханием по времени (profiles.py): контентный score — одна строка профиля
+        if profiles is None:
+            profiles = UserProfileStore.build(df_ratings, self.embeddings, self.course_index)
+        self.profiles = profiles
+        # Векторы отзывов пользователей и курсов (comments.py) — необязательный третий сигнал
+        self.comment_vectors = comment_vectors
+        self.comment_weight = comment_weight
+        # Индекс ближайших соседей по векторам курсов (vector_index.py); по умолчанию точный
+        self.vector_index = vector_index or build_course_index(self.embeddings)
+        # Дешёвый пул кандидатов для режима 'content' (candidates.py)
+        self.candidate_pool = CandidatePool(df_courses, self.embeddings, self.vector_index)
+        # Ранжирование для пользователей без истории (coldstart.py), без вызова моделей
+        self.popularity = PopularityRanking(df_courses)
+        # Индексы атрибутов для фильтров (filters.py) и строки df_courses для valid_items
+        self.attribute_index = AttributeIndex(df_courses)
+        self.valid_rows = self.course_index.get_indexer(self.valid_items)
+        # Многопроцессный скоринг BiasedMF по общему сегменту памяти (shared_scoring.py),
+        # подключается через enable_shared_scoring; позиции его top-k — индексы valid_items
+        self.shared_scorer = None
+
+    # Допустимые valid_items для маски фильтров: id курсов, их внутренние id и строки df_courses
+    def _allowed_items(self, mask):
+        if mask is None:
+            return self.valid_items, self.valid_inner_items, self.valid_rows
+        allowed = np.flatnonzero(mask[self.valid_rows])
+        return self.valid_items[allowed], self.valid_inner_items[allowed], self.valid_rows[allowed]
+
+    # mask — допустимые строки df_courses: CF считается только по ним, так что узкий
+    # фильтр делает запрос дешевле, а не дороже
+    def _get_cf_candidates(self, user_id, mask=None):
+        if self.shared_scorer is not None and mask is None:
+            with timer.stage('cf.shared'):
+                user_factors, user_bias = self.cf_model.user_vectors([user_id])
+                idx, scores = self.shared_scorer.top_k(user_factors[0], user_bias[0], self.n_candidates)
+            return self.valid_items[idx], scores.astype(np.float64)
+        items, inner_items, _ = self._allowed_items(mask)
+        if len(items) == 0:
+            return items, np.zeros(0)
+        with timer.stage('cf.estimate'):
+            scores = self.cf_scorer.estimate(user_id, inner_items)
+        with timer.stage('cf.candidates'):
+            top_indices = top_k_indices(scores, self.n_candidates)
+        return items[top_indices], scores[top_indices]
+
+    # Кандидаты из item-item соседей истории; KNN считается только по ним
+    def _get_item_candidates(self, user_id, mask=None):
+        with timer.stage('history_lookup'):
+            history_rows = self.history_index.get(user_id)
+        with timer.stage('item.candidates'):
+            rows, _ = self.item_neighbors.candidates(history_rows, self.n_candidates)
+            if mask is not None:
+                rows = rows[mask[rows]]
+        if len(rows) == 0:
+            return self._get_cf_candidates(user_id, mask)
+        with timer.stage('cf.estimate'):
+            scores = self.cf_scorer.estimate(user_id, self.row_inner_items[rows])
+        return self.df_courses['course_id'].to_numpy()[rows], scores
+
+    # Кандидаты из дешёвых источников; KNN и контент считаются только по пулу
+    def _get_content_candidates(self, user_id, mask=None):
+        with timer.stage('history_lookup'):
+            history_rows = self.history_index.get(user_id)
+        with timer.stage('content.pool'):
+            rows = self.candidate_pool.get(history_rows, self.profiles.profile(user_id))
+            if mask is not None:
+                rows = rows[mask[rows]]
+        # Пул не знает о фильтре: если в нём не осталось допустимых курсов — CF по допустимым
+        if len(rows) == 0 and mask is not None:
+            return self._get_cf_candidates(user_id, mask)
+        with timer.stage('cf.estimate'):
+            scores = self.cf_scorer.estimate(user_id, self.row_inner_items[rows])
+        return self.df_courses['course_id'].to_numpy()[rows], scores
+
+    def _get_candidates(self, user_id, candidate_mode, mask=None):
+        if candidate_mode == 'item' and self.item_neighbors is not None:
+            return self._get_item_candidates(user_id, mask)
+        if candidate_mode == 'content':
+            return self._get_content_candidates(user_id, mask)
+        return self._get_cf_candidates(user_id, mask)
+
+    def _get_content_scores(self, user_id, candidates):
+        candidate_rows = self.course_index.get_indexer(candidates)
+        return self.profiles.scores(user_id, self.embeddings, candidate_rows)
+
+    # Пользователь без оценок: KNN свёлся бы к базовым предсказаниям, профиля нет
+    def is_cold_user(self, user_id):
+        return len(self.history_index.get(user_id)) == 0 and not self.cf_scorer.knows_user(user_id)
+
+    # Популярное и качественное из каталога, при необходимости — внутри категории
+    def popular_ids(self, top_k=10, category=None, course_filter=None):
+        rows, scores = self.popularity.top(top_k, category, mask=self.attribute_index.mask(course_filter))
+        return self.df_courses['course_id'].to_numpy()[rows], scores
+
+    def recommend_popular(self, top_k=10, category=None, course_filter=None):
+        timer.count('recommend.cold_start')
+        return self._to_frame(*self.popular_ids(top_k, category, course_filter))
+
+    # Новые курсы (колонки как в df_courses): векторы через infer_vector, дописываются
+    # в матрицу векторов, индекс и ранжирование популярного; KNN их не знает и даёт
+    # им базовую оценку. Doc2Vec не переобучается
+    def add_courses(self, df_new, token_cache=None):
+        self.disable_shared_scoring()
+        df_new = add_description(df_new.copy())
+        vectors = embed_courses(self.doc2vec_model, df_new['description'], token_cache)
+        rows = np.arange(len(self.df_courses), len(self.df_courses) + len(df_new))
+        self.df_courses = pd.concat([self.df_courses, df_new[self.df_courses.columns.intersection(
+            df_new.columns)]], ignore_index=True)
+        self.course_index = pd.Index(self.df_courses['course_id'])
+        self.course_id_to_idx.update(zip(df_new['course_id'], rows.tolist()))
+        self.history_index.course_index = self.course_index
+        self.embeddings = np.concatenate([self.embeddings, vectors])
+        self.valid_items = self.df_courses['course_id'].unique()
+        self.valid_inner_items = self.cf_scorer.to_inner_items(self.valid_items)
+        self.row_inner_items = self.cf_scorer.to_inner_items(self.df_courses['course_id'])
+        self.vector_index.add(vectors, ids=rows)
+        self.candidate_pool = CandidatePool(self.df_courses, self.embeddings, self.vector_index)
+        self.popularity = PopularityRanking(self.df_courses)
+        self.attribute_index = AttributeIndex(self.df_courses)
+        self.valid_rows = self.course_index.get_indexer(self.valid_items)
+        if self.item_neighbors is not None:
+            self.item_neighbors.add_courses(len(df_new))
+        if self.comment_vectors is not None:
+            self.comment_vectors.add_courses(len(df_new))
+        # Офлайн top-K и кэш не видят новых курсов — новая версия для ключей кэша
+        self.version = model_version(self.df_ratings, self.df_courses, self.cf_kind)
+        return rows
+
+    # Общий сегмент хранит каталог и факторы на момент подключения — после изменения
+    # моделей в процессе скоринг возвращается к собственным массивам
+    def disable_shared_scoring(self):
+        if self.shared_scorer is not None:
+            self.shared_scorer.close()
+            self.shared_scorer = None
+
+    # Курсы, похожие по описанию на данный (аналог recommend(anime_name) из ноутбука)
+    def similar_courses(self, course_id, top_k=10):
+        row = self.course_index.get_indexer([course_id])[0]
+        if row < 0 or not self.embeddings[row].any():
+            return self.df_courses.iloc[:0].assign(score=[])
+        rows, scores = self.vector_index.query(self.embeddings[row], top_k + 1)
+        keep = (rows >= 0) & (rows != row)
+        result = self.df_courses.iloc[rows[keep][:top_k]].copy()
+        result['score'] = scores[keep][:top_k]
+        return result
+
+    # Живой расчёт: id курсов и итоговые score по убыванию. course_filter (filters.py) —
+    # маска допустимых курсов до оценок CF и контента
+    def recommend_ids(self, user_id, top_k=10, candidate_mode=None, course_filter=None):
+        timer.count('recommend.live')
+        with timer.stage('filter'):
+            mask = self.attribute_index.mask(course_filter)
+        candidates, cf_scores = self._get_candidates(user_id, candidate_mode or self.candidate_mode, mask)
+        cb_scores = self._get_content_scores(user_id, candidates)
+        combined_scores = self.cf_weight * cf_scores + self.content_weight * cb_scores
+        if self.comment_vectors is not None and self.comment_weight:
+            with timer.stage('comments'):
+                candidate_rows = self.course_index.get_indexer(candidates)
+                combined_scores = combined_scores + \
+                    self.comment_weight * self.comment_vectors.scores(user_id, candidate_rows)
+        with timer.stage('blend'):
+            top_indices = top_k_indices(combined_scores, top_k)
+        return candidates[top_indices], combined_scores[top_indices]
+
+    # Офлайн top-K посчитан по всему каталогу без фильтров и без слагаемого отзывов, поэтому
+    # годится только для режима 'cf' и пока векторы отзывов не подключены
+    def _uses_topk_store(self, user_id, candidate_mode, course_filter):
+        return (self.topk_store is not None and candidate_mode == 'cf' and not course_filter
+                and not (self.comment_vectors is not None and self.comment_weight)
+                and user_id not in self.updated_users)
+
+    def _ranked_ids(self, user_id, top_k, candidate_mode, course_filter=None):
+        stored = None
+        if self._uses_topk_store(user_id, candidate_mode, course_filter):
+            with timer.stage('topk_store'):
+                stored = self.topk_store.get(user_id, top_k)
+        if stored is not None:
+            timer.count('recommend.topk_store')
+            rows, scores = stored
+            return self.df_courses['course_id'].to_numpy()[rows], scores
+        return self.recommend_ids(user_id, top_k, candidate_mode, course_filter)
+
+    # Оценки пользователя изменились — его закэшированные рекомендации больше не годятся
+    def invalidate_user(self, user_id):
+        if self.result_cache is not None:
+            self.result_cache.invalidate_user(user_id)
+
+    # Микро-батч новых оценок (user_id, course_id, rate[, date]) без полного fit CF-модели:
+    # KNN — через incremental.py, BiasedMF — шагом ALS по затронутым строкам
+    def add_ratings(self, df_new):
+        self.disable_shared_scoring()
+        if self.cf_kind == 'mf':
+            stats = self.cf_model.add_ratings(df_new)
+        else:
+            if self.incremental is None:
+                self.incremental = IncrementalKNNBaseline.from_model(self.cf_model, self.df_ratings)
+            stats = self.incremental.update(df_new)
+            self.cf_scorer = self.incremental.scorer()
+        self.valid_inner_items = self.cf_scorer.to_inner_items(self.valid_items)
+        self.row_inner_items = self.cf_scorer.to_inner_items(self.df_courses['course_id'])
+        self.history_index.add(df_new)
+        self.profiles.add_ratings(df_new, self.embeddings, self.course_index, self.df_ratings)
+        self.df_ratings = pd.concat([self.df_ratings, df_new], ignore_index=True)
+        if stats['full_refit']:
+            # После полного fit меняются оценки всех пользователей — новая версия для кэша
+            self.version = model_version(self.df_ratings, self.df_courses, self.cf_kind)
+        for user_id in pd.unique(df_new['user_id']):
+            self.updated_users.add(user_id)
+            self.invalidate_user(user_id)
+        return stats
+
+    # Конфигурация смешивания для ключа кэша
+    def _cache_config(self, candidate_mode, course_filter=None):
+        comment_weight = self.comment_weight if self.comment_vectors is not None else 0
+        return (candidate_mode, self.cf_weight, self.content_weight, comment_weight,
+                self.n_candidates, course_filter.key if course_filter else None)
+
+    # Живой расчёт режима 'cf' для нескольких пользователей: KNN по всему каталогу — один
+    # вызов estimate_batch, контент и отзывы — матричные операции по кандидатам всех строк
+    def _recommend_ids_batch(self, user_ids, top_k, mask=None):
+        items, inner_items, item_rows = self._allowed_items(mask)
+        if len(items) == 0:
+            return [(items, np.zeros(0)) for _ in user_ids]
+        if self.shared_scorer is not None and mask is None:
+            with timer.stage('batch.cf_shared'):
+                user_factors, user_bias = self.cf_model.user_vectors(user_ids)
+                candidate_idx, cf_scores = self.shared_scorer.top_k_batch(user_factors, user_bias,
+                                                                          self.n_candidates)
+                cf_scores = cf_scores.astype(np.float64)
+        else:
+            with timer.stage('batch.cf_estimate'):
+                cf_all = self.cf_scorer.estimate_batch(user_ids, inner_items)
+            with timer.stage('batch.cf_candidates'):
+                candidate_idx = np.stack([top_k_indices(scores, self.n_candidates) for scores in cf_all])
+                cf_scores = np.take_along_axis(cf_all, candidate_idx, axis=1)
+        with timer.stage('batch.cf_candidates'):
+            candidate_rows = item_rows[candidate_idx]
+        with timer.stage('batch.content'):
+            profiles = self.profiles.profile_matrix(user_ids)
+            cb_scores = np.einsum('ucd,ud->uc', self.embeddings[candidate_rows], profiles)
+        combined_scores = self.cf_weight * cf_scores + self.content_weight * cb_scores
+        if self.comment_vectors is not None and self.comment_weight:
+            with timer.stage('batch.comments'):
+                combined_scores = combined_scores + \
+                    self.comment_weight * self.comment_vectors.score_matrix(user_ids, candidate_rows)
+        with timer.stage('batch.blend'):
+            results = []
+            for idx, scores in zip(candidate_idx, combined_scores):
+                top_indices = top_k_indices(scores, top_k)
+                results.append((items[idx[top_indices]], scores[top_indices]))
+        return results
+
+    # Рекомендации для списка пользователей (микро-батч сервиса, см. service.py):
+    # кэш и офлайн top-K — по каждому, остальные считаются вместе. Список (course_ids, scores)
+    def recommend_ids_many(self, user_ids, top_k=10, candidate_mode=None, course_filter=None):
+        candidate_mode = candidate_mode or self.candidate_mode
+        config = self._cache_config(candidate_mode, course_filter)
+        results = [None] * len(user_ids)
+        pending = []
+        for pos, user_id in enumerate(user_ids):
+            if self.is_cold_user(user_id):
+                timer.count('recommend.cold_start')
+                results[pos] = self.popular_ids(top_k, course_filter=course_filter)
+                continue
+            if self.result_cache is not None:
+                results[pos] = self.result_cache.get(user_id, self.version, config, top_k)
+            if results[pos] is None and self._uses_topk_store(user_id, candidate_mode, course_filter):
+                stored = self.topk_store.get(user_id, top_k)
+                if stored is not None:
+                    rows, scores = stored
+                    results[pos] = (self.df_courses['course_id'].to_numpy()[rows], scores)
+            if results[pos] is None:
+                pending.append(pos)
+        if not pending:
+            return results
+
+        # Считаем сразу на max_top_k, чтобы положить в кэш (как get_or_compute)
+        compute_k = top_k
+        if self.result_cache is not None and top_k <= self.result_cache.max_top_k:
+            compute_k = self.result_cache.max_top_k
+        pending_users = list(dict.fromkeys(user_ids[pos] for pos in pending))
+        if candidate_mode == 'cf':
+            computed = self._recommend_ids_batch(pending_users, compute_k,
+                                                 self.attribute_index.mask(course_filter))
+        else:
+            computed = [self.recommend_ids(user_id, compute_k, candidate_mode, course_filter)
+                        for user_id in pending_users]
+        computed = dict(zip(pending_users, computed))
+        if self.result_cache is not None and compute_k == self.result_cache.max_top_k:
+            for user_id, value in computed.items():
+                self.result_cache.put(user_id, self.version, config, value)
+        for pos in pending:
+            course_ids, scores = computed[user_ids[pos]]
+            results[pos] = (course_ids[:top_k], scores[:top_k])
+        return results
+
+    # Стадии запроса пишутся в profiling.timer (по умолчанию выключен)
+    # course_filter — CourseFilter из filters.py: бесплатные, цена, длительность, категории
+    def recommend(self, user_id, top_k=10, candidate_mode=None, course_filter=None):
+        with timer.request('recommend', label=user_id):
+            return self._recommend(user_id, top_k, candidate_mode, course_filter)
+
+    def _recommend(self, user_id, top_k, candidate_mode, course_filter=None):
+        if self.is_cold_user(user_id):
+            return self.recommend_popular(top_k, course_filter=course_filter)
+        candidate_mode = candidate_mode or self.candidate_mode
+        with timer.stage('rank'):
+            if self.result_cache is not None:
+                course_ids, scores = self.result_cache.get_or_compute(
+                    user_id, self.version, self._cache_config(candidate_mode, course_filter), top_k,
+                    lambda k: self._ranked_ids(user_id, k, candidate_mode, course_filter))
+            else:
+                course_ids, scores = self._ranked_ids(user_id, top_k, candidate_mode, course_filter)
+        return self._to_frame(course_ids, scores)
+
+    def _to_frame(self, course_ids, scores):
+        with timer.stage('merge'):
+            result = pd.DataFrame({
+                'course_id': course_ids,
+                'score': scores
+            }).merge(self.df_courses, on='course_id')
+
+            return result.sort_values('score', ascending=False)
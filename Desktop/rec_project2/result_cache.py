@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_TTL = 600
+DEFAULT_MAX_TOP_K = 20
+
+
+# Кэш готовых рекомендаций перед HybridRecommender.recommend.
+# Ключ — (пользователь, версия моделей, конфигурация смешивания); значение считается один раз
+# на max_top_k и режется под меньший top_k. Размер ограничен max_entries (LRU), записи
+# живут ttl секунд, invalidate_user сбрасывает все записи пользователя.
+# Streamlit обслуживает сессии в потоках, поэтому всё под одной блокировкой.
+class RecommendationCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, max_top_k=DEFAULT_MAX_TOP_K,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_top_k = max_top_k
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and self.clock() - entry[0] > self.ttl:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key, value):
+        self._entries[key] = (self.clock(), value)
+        self._entries.move_to_end(key)
+        self._user_keys.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    # (course_ids, scores) для top_k или None; запросы больше max_top_k — всегда промах
+    def get(self, user_id, version, config, top_k):
+        with self._lock:
+            value = self._lookup((user_id, version, config)) if top_k <= self.max_top_k else None
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        course_ids, scores = value
+        return course_ids[:top_k], scores[:top_k]
+
+    # Значение посчитано на max_top_k (или больше — лишнее отрезается)
+    def put(self, user_id, version, config, value):
+        course_ids, scores = value
+        with self._lock:
+            self._store((user_id, version, config),
+                        (course_ids[:self.max_top_k], scores[:self.max_top_k]))
+
+    # То же одним вызовом; compute(max_top_k) вызывается только при промахе.
+    # Считаем вне блокировки: параллельный промах по тому же ключу просто посчитает дважды
+    def get_or_compute(self, user_id, version, config, top_k, compute):
+        value = self.get(user_id, version, config, top_k)
+        if value is not None:
+            return value
+        if top_k > self.max_top_k:
+            return compute(top_k)
+        value = compute(self.max_top_k)
+        self.put(user_id, version, config, value)
+        course_ids, scores = value
+        return course_ids[:top_k], scores[:top_k]
+
+    # Оценки пользователя изменились — все его записи (любых версий и конфигураций) неверны
+    def invalidate_user(self, user_id):
+        with self._lock:
+            keys = list(self._user_keys.get(user_id, ()))
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
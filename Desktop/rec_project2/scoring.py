@@ -0,0 +1,266 @@
+import numpy as np
+import pandas as pd
+
+
+# Индексы top-k элементов по убыванию score (argpartition вместо полного argsort)
+def top_k_indices(scores, k):
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+# Пакетные предсказания обученной user-based KNNBaseline (surprise) для всего каталога.
+# Повторяет KNNBaseline.estimate + clip из predict, но одним проходом numpy по всем айтемам.
+class KNNBaselineScorer:
+    def __init__(self, model):
+        if not model.sim_options.get('user_based', True):
+            raise ValueError('KNNBaselineScorer поддерживает только user_based=True')
+
+        trainset = model.trainset
+        n_items = trainset.n_items
+        # CSR по айтемам: кто оценил айтем и с какой оценкой (в порядке trainset.ir,
+        # чтобы при равных similarity выбирались те же соседи, что и в heapq.nlargest)
+        counts = np.array([len(trainset.ir[i]) for i in range(n_items)], dtype=np.int64)
+        item_ptr = np.zeros(n_items + 1, dtype=np.int64)
+        np.cumsum(counts, out=item_ptr[1:])
+        entry_user = np.fromiter(
+            (u for i in range(n_items) for u, _ in trainset.ir[i]),
+            dtype=np.int64, count=item_ptr[-1]
+        )
+        entry_rating = np.fromiter(
+            (r for i in range(n_items) for _, r in trainset.ir[i]),
+            dtype=np.float64, count=item_ptr[-1]
+        )
+        self._init(model.k, model.min_k, trainset.global_mean, trainset.rating_scale,
+                   model.bu, model.bi, model.sim, trainset._raw2inner_id_users,
+                   trainset._raw2inner_id_items, item_ptr, entry_user, entry_rating)
+
+    # Скорер из плоских массивов оценок в порядке поступления (см. incremental.py):
+    # стабильная сортировка по айтему даёт тот же порядок, что и trainset.ir
+    @classmethod
+    def from_arrays(cls, users, items, ratings, bu, bi, sim, raw2inner_users, raw2inner_items,
+                    k, min_k, global_mean, rating_scale):
+        order = np.argsort(items, kind='stable')
+        item_ptr = np.zeros(len(bi) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(items, minlength=len(bi)), out=item_ptr[1:])
+        scorer = cls.__new__(cls)
+        scorer._init(k, min_k, global_mean, rating_scale, bu, bi, sim, raw2inner_users,
+                     raw2inner_items, item_ptr, np.asarray(users, dtype=np.int64)[order],
+                     np.asarray(ratings, dtype=np.float64)[order])
+        return scorer
+
+    def _init(self, k, min_k, global_mean, rating_scale, bu, bi, sim, raw2inner_users,
+              raw2inner_items, item_ptr, entry_user, entry_rating):
+        self.k = k
+        self.min_k = min_k
+        self.global_mean = global_mean
+        self.rating_scale = rating_scale
+        self.bu = np.asarray(bu, dtype=np.float64)
+        self.bi = np.asarray(bi, dtype=np.float64)
+        self.sim = np.asarray(sim)
+        self.raw2inner_users = raw2inner_users
+        self.raw2inner_items = raw2inner_items
+        self.n_items = len(self.bi)
+        self.item_ptr = item_ptr
+        self.entry_item = np.repeat(np.arange(self.n_items), np.diff(item_ptr))
+        self.entry_user = entry_user
+        # r_vi - b_vi считается один раз, а не на каждый запрос
+        self.entry_residual = entry_rating - (
+            self.global_mean + self.bu[self.entry_user] + self.bi[self.entry_item]
+        )
+
+    def to_inner_items(self, item_ids):
+        raw2inner = self.raw2inner_items
+        return np.array([raw2inner.get(iid, -1) for iid in item_ids], dtype=np.int64)
+
+    def _inner_user(self, user_id):
+        return self.raw2inner_users.get(user_id)
+
+    def knows_user(self, user_id):
+        return user_id in self.raw2inner_users
+
+    # Оценки для всех внутренних айтемов trainset
+    def estimate_all(self, user_id):
+        return self._estimate_items(self._inner_user(user_id), None)
+
+    # Оценки только для выбранных внутренних айтемов: стоимость пропорциональна
+    # числу их оценок, а не размеру каталога
+    def _estimate_items(self, u, items):
+        if items is None:
+            n_items = self.n_items
+            bi = self.bi
+            ptr = self.item_ptr
+            entries = slice(None)
+        else:
+            n_items = len(items)
+            bi = self.bi[items]
+            counts = self.item_ptr[items + 1] - self.item_ptr[items]
+            ptr = np.zeros(n_items + 1, dtype=np.int64)
+            np.cumsum(counts, out=ptr[1:])
+            entries = np.repeat(self.item_ptr[items] - ptr[:-1], counts) + np.arange(ptr[-1])
+
+        est = self.global_mean + bi
+        if u is None:
+            return np.clip(est, *self.rating_scale)
+        est = est + self.bu[u]
+
+        entry_item = np.repeat(np.arange(n_items), np.diff(ptr))
+        entry_residual = self.entry_residual[entries]
+        sims = self.sim[u, self.entry_user[entries]]
+        # Внутри каждого айтема соседи по убыванию similarity, сортировка стабильная
+        order = np.lexsort((-sims, entry_item))
+        items_sorted = entry_item[order]
+        rank = np.arange(len(order)) - ptr[items_sorted]
+        sims = sims[order]
+        keep = (rank < self.k) & (sims > 0)
+
+        items_sorted = items_sorted[keep]
+        sims = sims[keep]
+        sum_sim = np.bincount(items_sorted, weights=sims, minlength=n_items)
+        sum_ratings = np.bincount(items_sorted, weights=sims * entry_residual[order][keep],
+                                  minlength=n_items)
+        actual_k = np.bincount(items_sorted, minlength=n_items)
+        sum_ratings[actual_k < self.min_k] = 0
+
+        nonzero = sum_sim != 0
+        est[nonzero] += sum_ratings[nonzero] / sum_sim[nonzero]
+        return np.clip(est, *self.rating_scale)
+
+    # Оценки для произвольного набора внутренних id (-1 — айтем неизвестен модели).
+    # Если набор заметно меньше каталога, считается только он.
+    def estimate(self, user_id, inner_items):
+        inner_items = np.asarray(inner_items, dtype=np.int64)
+        u = self._inner_user(user_id)
+        known = inner_items >= 0
+        out = np.empty(len(inner_items), dtype=np.float64)
+        if len(inner_items) * 4 < self.n_items:
+            out[known] = self._estimate_items(u, inner_items[known])
+        else:
+            out[known] = self._estimate_items(u, None)[inner_items[known]]
+        if not known.all():
+            unknown_est = self.global_mean + (self.bu[u] if u is not None else 0.0)
+            out[~known] = np.clip(unknown_est, *self.rating_scale)
+        return out
+
+    # Оценки всех айтемов для нескольких (известных) пользователей одним проходом.
+    # Записи уже сгруппированы по айтему, поэтому внутри строки достаточно одной стабильной
+    # сортировки по ключу item * 4 + (1 - sim): группы не пересекаются, а при равных sim
+    # сохраняется порядок trainset.ir, как в _estimate_items.
+    def _estimate_all_rows(self, users):
+        n_rows = len(users)
+        sims = self.sim[np.ix_(users, self.entry_user)]
+        keys = self.entry_item * 4.0 + (1.0 - sims)
+        order = np.argsort(keys, axis=1, kind='stable')
+        sims = np.take_along_axis(sims, order, axis=1)
+        items = self.entry_item[order]
+        rank = np.arange(order.shape[1])[None, :] - self.item_ptr[items]
+        keep = (rank < self.k) & (sims > 0)
+
+        group = (np.arange(n_rows)[:, None] * self.n_items + items)[keep]
+        sims = sims[keep]
+        residual = self.entry_residual[order][keep]
+        size = n_rows * self.n_items
+        sum_sim = np.bincount(group, weights=sims, minlength=size)
+        sum_ratings = np.bincount(group, weights=sims * residual, minlength=size)
+        actual_k = np.bincount(group, minlength=size)
+        sum_ratings[actual_k < self.min_k] = 0
+
+        est = (self.global_mean + self.bi[None, :] + self.bu[users][:, None]).ravel()
+        nonzero = sum_sim != 0
+        est[nonzero] += sum_ratings[nonzero] / sum_sim[nonzero]
+        return est.reshape(n_rows, self.n_items)
+
+    # Пакетный вариант estimate: матрица пользователи × inner_items. Пользователи идут
+    # блоками так, чтобы промежуточные массивы не превышали max_entries элементов.
+    def estimate_batch(self, user_ids, inner_items, max_entries=2 ** 24):
+        inner_items = np.asarray(inner_items, dtype=np.int64)
+        known = inner_items >= 0
+        users = [self._inner_user(user_id) for user_id in user_ids]
+        bu = np.array([self.bu[u] if u is not None else 0.0 for u in users])
+        out = np.empty((len(users), len(inner_items)), dtype=np.float64)
+        out[:, ~known] = (self.global_mean + bu)[:, None]
+        out[:, known] = (self.global_mean + self.bi[inner_items[known]])[None, :]
+
+        rows = np.array([pos for pos, u in enumerate(users) if u is not None], dtype=np.int64)
+        inner = np.array([users[pos] for pos in rows], dtype=np.int64)
+        step = max(1, max_entries // max(1, len(self.entry_user)))
+        for start in range(0, len(rows), step):
+            block = self._estimate_all_rows(inner[start:start + step])
+            out[np.ix_(rows[start:start + step], np.flatnonzero(known))] = block[:, inner_items[known]]
+        return np.clip(out, *self.rating_scale)
+
+
+# CSR-индекс истории: пользователь -> позиции его курсов в df_courses.
+# Новые оценки (add) лежат в небольшом словаре поверх CSR до следующей пересборки.
+class UserHistoryIndex:
+    def __init__(self, df_ratings, course_index):
+        self.course_index = course_index
+        self.added = {}
+        rows = course_index.get_indexer(df_ratings['course_id'])
+        known = rows >= 0
+        user_ids, user_rows = np.unique(df_ratings['user_id'].to_numpy()[known], return_inverse=True)
+        order = np.argsort(user_rows, kind='stable')
+        self.indices = rows[known][order].astype(np.int32)
+        self.indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(user_rows, minlength=len(user_ids)), out=self.indptr[1:])
+        self.user_to_row = {uid: row for row, uid in enumerate(user_ids.tolist())}
+
+    def _base(self, user_id):
+        row = self.user_to_row.get(user_id)
+        if row is None:
+            return self.indices[:0]
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    def get(self, user_id):
+        added = self.added.get(user_id)
+        return self._base(user_id) if added is None else added
+
+    def add(self, df_new):
+        rows = self.course_index.get_indexer(df_new['course_id'])
+        known = rows >= 0
+        for user_id, user_rows in pd.Series(rows[known]).groupby(
+                df_new['user_id'].to_numpy()[known]):
+            history = self.get(user_id)
+            new_rows = pd.unique(user_rows.to_numpy())
+            new_rows = new_rows[~np.isin(new_rows, history)]
+            self.added[user_id] = np.concatenate([history, new_rows.astype(np.int32)])
+
+
+# Матрица векторов Doc2Vec в порядке df_courses, L2-нормированная, float32.
+# Тег документа — позиция курса в df_courses; курсы без вектора остаются нулевыми.
+def build_embedding_matrix(doc2vec_model, n_courses):
+    dv = doc2vec_model.dv
+    matrix = np.zeros((n_courses, dv.vector_size), dtype=np.float32)
+    for idx in range(n_courses):
+        key = str(idx)
+        if key in dv:
+            matrix[idx] = dv[key]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return np.ascontiguousarray(matrix)
+
+
+# Профиль пользователя: нормированное среднее нормированных векторов истории (None, если пусто)
+def user_profile(embeddings, history_rows):
+    if len(history_rows) == 0:
+        return None
+    user_vector = embeddings[history_rows].mean(axis=0)
+    norm = np.linalg.norm(user_vector)
+    if norm == 0:
+        return None
+    return user_vector / norm
+
+
+# Косинусная близость профиля пользователя к кандидатам
+def content_scores(embeddings, history_rows, candidate_rows):
+    candidate_rows = np.asarray(candidate_rows)
+    scores = np.zeros(len(candidate_rows), dtype=np.float32)
+    profile = user_profile(embeddings, history_rows)
+    if profile is None:
+        return scores
+    known = candidate_rows >= 0
+    scores[known] = embeddings[candidate_rows[known]] @ profile
+    return scores
@@ -0,0 +1,362 @@
+import argparse
+import asyncio
+import json
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from batch_recommend import load_topk_store
+from comments import load_comment_vectors
+from filters import CourseFilter
+from item_cf import load_or_fit_item_neighbors
+from profiling import timer
+from recommender import (COURSES_PATH, RATINGS_PATH, HybridRecommender, add_description,
+                         load_cf_model, load_doc2vec_model, read_data)
+from result_cache import RecommendationCache
+from shared_scoring import enable_from_env
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT_MS = 5
+MAX_TOP_K = 100
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+MAX_BODY = 1 << 20
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Модели поднимаются один раз при старте, как в streamlit_proj.py; офлайн top-K,
+# item-item соседи и векторы отзывов — по возможности
+def load_recommender(ratings_path=RATINGS_PATH, courses_path=COURSES_PATH, use_cache=True):
+    df_ratings, df_courses = read_data(ratings_path, courses_path)
+    add_description(df_courses)
+    recommender = HybridRecommender(
+        cf_model=load_cf_model(df_ratings),
+        doc2vec_model=load_doc2vec_model(df_courses),
+        df_courses=df_courses,
+        df_ratings=df_ratings,
+        topk_store=load_topk_store(df_ratings, df_courses),
+        item_neighbors=load_or_fit_item_neighbors(df_ratings, df_courses),
+        comment_vectors=load_comment_vectors(df_courses),
+        result_cache=RecommendationCache() if use_cache else None,
+    )
+    enable_from_env(recommender)
+    return recommender
+
+
+# Микро-батчинг: одиночные запросы копятся до max_batch или max_wait_ms и уходят в
+# recommend_ids_many одним вызовом. Расчёт идёт в одном потоке — рекомендатель не
+# потокобезопасен, а цикл событий тем временем принимает следующие запросы.
+class MicroBatcher:
+    def __init__(self, recommender, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.recommender = recommender
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue = None
+        self.batches = 0
+        self.requests = 0
+        self.compute_time = 0.0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        return asyncio.create_task(self._run())
+
+    async def submit(self, user_id, top_k, candidate_mode, course_filter=None):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((user_id, top_k, candidate_mode, course_filter, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # То, что уже лежит в очереди, забираем без ожидания
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # В один вызов идут запросы с одинаковыми режимом и фильтром
+            groups = {}
+            for item in batch:
+                groups.setdefault((item[2], item[3]), []).append(item)
+            for (candidate_mode, course_filter), items in groups.items():
+                user_ids = [item[0] for item in items]
+                top_k = max(item[1] for item in items)
+                started = time.perf_counter()
+                try:
+                    results = await loop.run_in_executor(
+                        self.executor, self.recommender.recommend_ids_many, user_ids, top_k,
+                        candidate_mode, course_filter)
+                except Exception as e:
+                    for item in items:
+                        if not item[4].done():
+                            item[4].set_exception(e)
+                    continue
+                self.compute_time += time.perf_counter() - started
+                self.batches += 1
+                self.requests += len(items)
+                for item, (course_ids, scores) in zip(items, results):
+                    if not item[4].done():
+                        item[4].set_result((course_ids[:item[1]], scores[:item[1]]))
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'compute_time_sec': round(self.compute_time, 3),
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+
+class RecommendationService:
+    def __init__(self, recommender, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.recommender = recommender
+        self.batcher = MicroBatcher(recommender, max_batch, max_wait_ms)
+        # user_id из запроса приводится к типу колонки оценок
+        self.user_id_type = type(recommender.df_ratings['user_id'].iloc[0].item()) \
+            if len(recommender.df_ratings) else str
+        self.modes = ['cf', 'content'] + (['item'] if recommender.item_neighbors is not None else [])
+
+    def _user_id(self, value):
+        try:
+            return self.user_id_type(value)
+        except (TypeError, ValueError):
+            raise RequestError(400, f'invalid user_id: {value!r}')
+
+    def _top_k(self, value):
+        try:
+            top_k = int(value)
+        except (TypeError, ValueError):
+            raise RequestError(400, f'invalid k: {value!r}')
+        if not 1 <= top_k <= MAX_TOP_K:
+            raise RequestError(400, f'k must be in [1, {MAX_TOP_K}]')
+        return top_k
+
+    def _mode(self, value):
+        mode = value or self.recommender.candidate_mode
+        if mode not in self.modes:
+            raise RequestError(400, f'unknown mode: {mode!r}')
+        return mode
+
+    # Фильтры атрибутов: paid, min_price/max_price, min_minutes/max_minutes, categories, languages
+    def _filter(self, query):
+        try:
+            course_filter = CourseFilter.from_query(query)
+            self.recommender.attribute_index.mask(course_filter)
+        except ValueError as e:
+            raise RequestError(400, f'invalid filter: {e}')
+        return course_filter or None
+
+    @staticmethod
+    def _items(user_id, course_ids, scores):
+        return {'user_id': user_id, 'items': [
+            {'course_id': course_id, 'score': score}
+            for course_id, score in zip(course_ids.tolist(), scores.tolist())]}
+
+    async def recommend(self, query):
+        if 'user_id' not in query:
+            raise RequestError(400, 'user_id is required')
+        user_id = self._user_id(query['user_id'])
+        course_ids, scores = await self.batcher.submit(
+            user_id, self._top_k(query.get('k', 10)), self._mode(query.get('mode')), self._filter(query))
+        return self._items(user_id, course_ids, scores)
+
+    # Пакетный запрос: пользователи идут через ту же очередь и считаются вместе с остальными
+    async def recommend_bulk(self, body):
+        user_ids = body.get('user_ids') if isinstance(body, dict) else None
+        if not isinstance(user_ids, list):
+            raise RequestError(400, 'user_ids must be a list')
+        user_ids = [self._user_id(user_id) for user_id in user_ids]
+        top_k = self._top_k(body.get('k', 10))
+        mode = self._mode(body.get('mode'))
+        filter_query = body.get('filter') or {}
+        if not isinstance(filter_query, dict):
+            raise RequestError(400, 'filter must be an object')
+        course_filter = self._filter(filter_query)
+        results = await asyncio.gather(*(self.batcher.submit(user_id, top_k, mode, course_filter)
+                                         for user_id in user_ids))
+        return {'results': [self._items(user_id, *result)
+                            for user_id, result in zip(user_ids, results)]}
+
+    # Холодный старт без очереди: готовое ранжирование, модели не вызываются
+    def popular(self, query):
+        course_ids, scores = self.recommender.popular_ids(self._top_k(query.get('k', 10)),
+                                                          query.get('category') or None,
+                                                          self._filter(query))
+        return self._items(None, course_ids, scores)
+
+    def health(self):
+        return {'status': 'ok', 'version': self.recommender.version, 'modes': self.modes,
+                'courses': len(self.recommender.df_courses), 'max_top_k': MAX_TOP_K}
+
+    def stats(self):
+        cache = self.recommender.result_cache
+        return {'batcher': self.batcher.stats(), 'cache': cache.stats() if cache is not None else None,
+                'stages': timer.snapshot()}
+
+    async def route(self, method, path, query, body):
+        if path == '/recommend':
+            if method != 'GET':
+                raise RequestError(405, 'use GET')
+            return await self.recommend(query)
+        if path == '/recommend/bulk':
+            if method != 'POST':
+                raise RequestError(405, 'use POST')
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                raise RequestError(400, 'invalid JSON')
+            return await self.recommend_bulk(payload)
+        if path == '/popular':
+            return self.popular(query)
+        if path == '/health':
+            return self.health()
+        if path == '/stats':
+            return self.stats()
+        raise RequestError(404, f'unknown path: {path}')
+
+    # Минимальный HTTP/1.1 с keep-alive: строка запроса, заголовки, тело по Content-Length
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                if length > MAX_BODY:
+                    status, payload, keep_alive = 413, {'error': 'body too large'}, False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    url = urllib.parse.urlsplit(target)
+                    query = dict(urllib.parse.parse_qsl(url.query))
+                    try:
+                        status, payload = 200, await self.route(method, url.path, query, body)
+                    except RequestError as e:
+                        status, payload = e.status, {'error': str(e)}
+                    except Exception as e:
+                        status, payload = 500, {'error': str(e)}
+
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                writer.write(
+                    f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                    f'Content-Type: application/json; charset=utf-8\r\n'
+                    f'Content-Length: {len(data)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        batcher_task = self.batcher.start()
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        print(f'serving on http://{host}:{port}', flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+
+
+# Клиент сервиса с интерфейсом HybridRecommender.recommend — для Streamlit при REC_SERVICE_URL
+class RemoteRecommender:
+    def __init__(self, base_url, df_courses, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.df_courses = df_courses
+        self.timeout = timeout
+
+    def _get(self, path, **params):
+        url = f'{self.base_url}{path}'
+        if params:
+            url += '?' + urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def health(self):
+        return self._get('/health')
+
+    def stats(self):
+        return self._get('/stats')
+
+    def recommend(self, user_id, top_k=10, candidate_mode=None, course_filter=None):
+        filter_params = course_filter.to_query() if course_filter else {}
+        return self._to_frame(self._get('/recommend', user_id=user_id, k=top_k,
+                                        mode=candidate_mode, **filter_params)['items'])
+
+    def recommend_popular(self, top_k=10, category=None, course_filter=None):
+        filter_params = course_filter.to_query() if course_filter else {}
+        return self._to_frame(self._get('/popular', k=top_k, category=category,
+                                        **filter_params)['items'])
+
+    def _to_frame(self, items):
+        result = pd.DataFrame({
+            'course_id': [item['course_id'] for item in items],
+            'score': [item['score'] for item in items]
+        }).astype({'course_id': self.df_courses['course_id'].dtype}).merge(self.df_courses,
+                                                                          on='course_id')
+        return result.sort_values('score', ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP-сервис рекомендаций с микро-батчингом')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument('--no-cache', action='store_true', help='без кэша готовых рекомендаций')
+    parser.add_argument('--ratings', default=str(RATINGS_PATH))
+    parser.add_argument('--courses', default=str(COURSES_PATH))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    recommender = load_recommender(args.ratings, args.courses, use_cache=not args.no_cache)
+    print(f'models loaded in {time.perf_counter() - started:.2f}s', flush=True)
+    service = RecommendationService(recommender, args.max_batch, args.max_wait_ms)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
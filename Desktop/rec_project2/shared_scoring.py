@@ -0,0 +1,313 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+SCORING_WORKERS_ENV = 'REC_SCORING_WORKERS'
+SEGMENT_PREFIX = 'rec-'
+# Заголовок сегмента: флаг готовности, длина JSON с раскладкой массивов, сам JSON
+HEADER_SIZE = 16
+ALIGNMENT = 64
+ATTACH_TIMEOUT = 30.0
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# Сегмент переживает создавший его процесс и удаляется явно (unlink), поэтому
+# resource_tracker не должен удалять его при выходе ни у создателя, ни у читателей
+def _untrack(shm):
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+
+
+# Именованный сегмент разделяемой памяти с набором numpy-массивов. Массивы — представления
+# поверх буфера сегмента: процессы, подключившиеся по имени, читают их без копирования.
+# Флаг готовности пишется последним — читатель не увидит наполовину заполненный сегмент
+class SharedSegment:
+    def __init__(self, shm, layout, meta):
+        self.shm = shm
+        self.name = shm.name
+        self.meta = meta
+        self.arrays = {}
+        for array_name, (dtype, shape, offset) in layout.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            array.flags.writeable = False
+            self.arrays[array_name] = array
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    @classmethod
+    def create(cls, name, arrays, meta=None):
+        arrays = {array_name: np.ascontiguousarray(array) for array_name, array in arrays.items()}
+        relative, offset = {}, 0
+        for array_name, array in arrays.items():
+            relative[array_name] = (array.dtype.str, list(array.shape), offset)
+            offset = _aligned(offset + array.nbytes)
+        # Смещения в заголовке зависят от начала данных, а оно — от длины заголовка:
+        # пересчитываем, пока начало данных не перестанет сдвигаться (длина только растёт)
+        data_start = _aligned(HEADER_SIZE)
+        while True:
+            layout = {array_name: (dtype, shape, data_start + array_offset)
+                      for array_name, (dtype, shape, array_offset) in relative.items()}
+            header = json.dumps({'layout': layout, 'meta': meta or {}}).encode()
+            if HEADER_SIZE + len(header) <= data_start:
+                break
+            data_start = _aligned(HEADER_SIZE + len(header))
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(data_start + offset, 1))
+        _untrack(shm)
+        for array_name, array in arrays.items():
+            dtype, shape, array_offset = layout[array_name]
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=array_offset)[...] = array
+        shm.buf[HEADER_SIZE:HEADER_SIZE + len(header)] = header
+        np.ndarray(2, dtype=np.uint64, buffer=shm.buf)[:] = [len(header), 1]
+        return cls(shm, layout, meta or {})
+
+    @classmethod
+    def attach(cls, name, timeout=ATTACH_TIMEOUT):
+        shm = shared_memory.SharedMemory(name=name)
+        _untrack(shm)
+        state = np.ndarray(2, dtype=np.uint64, buffer=shm.buf)
+        deadline = time.monotonic() + timeout
+        while state[1] != 1:
+            if time.monotonic() > deadline:
+                shm.close()
+                raise TimeoutError(f'shared segment {name} is not ready')
+            time.sleep(0.01)
+        header = json.loads(bytes(shm.buf[HEADER_SIZE:HEADER_SIZE + int(state[0])]))
+        return cls(shm, header['layout'], header['meta'])
+
+    # Первый процесс хоста публикует массивы, остальные подключаются к его сегменту
+    @classmethod
+    def attach_or_create(cls, name, build_arrays, meta=None):
+        try:
+            return cls.attach(name)
+        except FileNotFoundError:
+            pass
+        try:
+            return cls.create(name, build_arrays(), meta)
+        except FileExistsError:
+            return cls.attach(name)
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+
+    # SharedMemory.unlink снимает сегмент с учёта resource_tracker — вернуть его туда перед удалением
+    def unlink(self):
+        resource_tracker.register(self.shm._name, 'shared_memory')
+        self.shm.unlink()
+
+
+_worker_state = {}
+
+
+def _attach_worker(name):
+    _worker_state['segment'] = SharedSegment.attach(name)
+
+
+# Оценки CF для куска каталога [start, stop) и локальный top-k каждой строки запроса
+def _score_shard(args):
+    start, stop, user_factors, user_bias, k = args
+    segment = _worker_state['segment']
+    arrays, meta = segment.arrays, segment.meta
+    # Порядок сложения как в BiasedMF.estimate_all: mu + b_i + b_u + q_i·p_u
+    scores = meta['global_mean'] + arrays['item_bias'][start:stop] + user_bias[:, None]
+    scores += user_factors @ arrays['item_factors'][start:stop].T
+    np.clip(scores, *meta['rating_scale'], out=scores)
+    k = min(k, stop - start)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top + start, np.take_along_axis(scores, top, axis=1)
+
+
+def _merge_top_k(rows, scores, k):
+    k = min(k, rows.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    return np.take_along_axis(rows, top, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+# Пул процессов, подключённых к сегменту: каталог делится на куски, каждый воркер
+# считает произведение факторов по своему куску и свой top-k, родитель сливает top-k.
+# workers=0 — те же куски в текущем процессе (база для сравнения)
+class ShardedScorer:
+    def __init__(self, segment, workers=None, shards=None):
+        self.segment = segment
+        self.workers = os.cpu_count() if workers is None else workers
+        n_items = len(segment.arrays['item_bias'])
+        n_shards = shards or max(self.workers, 1)
+        self.bounds = np.linspace(0, n_items, n_shards + 1).astype(np.int64)
+        self.pool = None
+        if self.workers > 0:
+            # spawn: форк процесса Streamlit с его потоками небезопасен, а воркерам
+            # ничего, кроме имени сегмента, не нужно
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context('spawn'),
+                                            initializer=_attach_worker, initargs=(segment.name,))
+        else:
+            _worker_state['segment'] = segment
+
+    # Позиции top-k в порядке массивов сегмента и их оценки, для каждой строки факторов
+    def top_k_batch(self, user_factors, user_bias, k):
+        user_factors = np.asarray(user_factors, dtype=np.float32)
+        user_bias = np.asarray(user_bias, dtype=np.float32)
+        tasks = [(int(start), int(stop), user_factors, user_bias, k)
+                 for start, stop in zip(self.bounds[:-1], self.bounds[1:]) if stop > start]
+        if self.pool is None:
+            results = [_score_shard(task) for task in tasks]
+        else:
+            results = list(self.pool.map(_score_shard, tasks))
+        rows = np.concatenate([shard_rows for shard_rows, _ in results], axis=1)
+        scores = np.concatenate([shard_scores for _, shard_scores in results], axis=1)
+        return _merge_top_k(rows, scores, k)
+
+    def top_k(self, user_factor, user_bias, k):
+        rows, scores = self.top_k_batch(np.asarray(user_factor)[None, :], [user_bias], k)
+        return rows[0], scores[0]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def segment_name(version):
+    return f'{SEGMENT_PREFIX}{version}'
+
+
+# Массивы рекомендателя для сегмента: факторы BiasedMF в порядке valid_items (курс,
+# неизвестный модели, — нулевые факторы и смещение, как в estimate), векторы курсов
+# и item-item соседи
+def _recommender_arrays(recommender):
+    model = recommender.cf_model
+    inner = recommender.valid_inner_items
+    known = inner >= 0
+    item_factors = np.zeros((len(inner), model.item_factors.shape[1]), dtype=np.float32)
+    item_factors[known] = model.item_factors[inner[known]]
+    item_bias = np.zeros(len(inner), dtype=np.float32)
+    item_bias[known] = model.item_bias[inner[known]]
+    arrays = {'item_factors': item_factors, 'item_bias': item_bias,
+              'embeddings': recommender.embeddings}
+    if recommender.item_neighbors is not None:
+        arrays['neighbor_idx'] = recommender.item_neighbors.neighbor_idx
+        arrays['neighbor_sim'] = recommender.item_neighbors.neighbor_sim
+    return arrays
+
+
+# Подключает рекомендатель с BiasedMF к общему сегменту версии его моделей и пулу
+# воркеров. Векторы курсов и соседи в процессе заменяются представлениями сегмента —
+# приватные копии освобождаются, все процессы хоста читают одну
+def enable_shared_scoring(recommender, workers=None):
+    if recommender.cf_kind != 'mf':
+        raise ValueError('shared scoring needs the BiasedMF cf model (REC_CF_MODEL=mf)')
+    meta = {'version': recommender.version, 'global_mean': recommender.cf_model.global_mean,
+            'rating_scale': list(recommender.cf_model.rating_scale)}
+    segment = SharedSegment.attach_or_create(segment_name(recommender.version),
+                                             lambda: _recommender_arrays(recommender), meta)
+    arrays = segment.arrays
+    recommender.embeddings = arrays['embeddings']
+    recommender.candidate_pool.embeddings = arrays['embeddings']
+    if recommender.item_neighbors is not None and 'neighbor_idx' in arrays:
+        recommender.item_neighbors.neighbor_idx = arrays['neighbor_idx']
+        recommender.item_neighbors.neighbor_sim = arrays['neighbor_sim']
+    recommender.shared_scorer = ShardedScorer(segment, workers)
+    return recommender.shared_scorer
+
+
+# Число воркеров из REC_SCORING_WORKERS; 0 или пусто — общий сегмент не используется.
+# Для KNNBaseline (REC_CF_MODEL=knn) скоринг остаётся в процессе
+def enable_from_env(recommender):
+    value = os.environ.get(SCORING_WORKERS_ENV, '').strip()
+    workers = int(value) if value else 0
+    if workers <= 0 or recommender.cf_kind != 'mf':
+        return None
+    return enable_shared_scoring(recommender, workers)
+
+
+def _synthetic_segment(name, n_courses, n_factors=32, dim=50, seed=0):
+    rng = np.random.default_rng(seed)
+    arrays = {
+        'item_factors': rng.normal(0, 0.1, (n_courses, n_factors)).astype(np.float32),
+        'item_bias': rng.normal(0, 0.1, n_courses).astype(np.float32),
+        'embeddings': rng.normal(0, 1, (n_courses, dim)).astype(np.float32),
+    }
+    return SharedSegment.create(name, arrays, {'global_mean': 4.0, 'rating_scale': [1, 5]})
+
+
+# Задержка top-k по каталогу в зависимости от числа воркеров: один пользователь и батч
+def bench(sizes, worker_counts, k=100, batch_size=64, repeat=20, n_factors=32):
+    rng = np.random.default_rng(1)
+    rows = []
+    for n_courses in sizes:
+        segment = _synthetic_segment(f'{SEGMENT_PREFIX}bench-{os.getpid()}-{n_courses}', n_courses,
+                                     n_factors)
+        try:
+            user_factors = rng.normal(0, 0.1, (batch_size, n_factors)).astype(np.float32)
+            user_bias = rng.normal(0, 0.1, batch_size).astype(np.float32)
+            expected = None
+            for workers in worker_counts:
+                scorer = ShardedScorer(segment, workers)
+                try:
+                    scorer.top_k_batch(user_factors[:1], user_bias[:1], k)
+                    single, batch = [], []
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        scorer.top_k(user_factors[0], user_bias[0], k)
+                        single.append(time.perf_counter() - started)
+                        started = time.perf_counter()
+                        result = scorer.top_k_batch(user_factors, user_bias, k)
+                        batch.append(time.perf_counter() - started)
+                    if expected is None:
+                        expected = result[0]
+                    rows.append({
+                        'courses': n_courses, 'workers': workers,
+                        'segment_mb': round(segment.nbytes / 2 ** 20, 1),
+                        'one_user_p50_ms': round(np.percentile(single, 50) * 1000, 2),
+                        f'batch{batch_size}_p50_ms': round(np.percentile(batch, 50) * 1000, 2),
+                        'same_top_k': bool(np.array_equal(np.sort(result[0], axis=1),
+                                                          np.sort(expected, axis=1))),
+                    })
+                finally:
+                    scorer.close()
+        finally:
+            segment.close()
+            segment.unlink()
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Общий сегмент моделей и многопроцессный скоринг')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    bench_parser = subparsers.add_parser('bench', help='задержка в зависимости от числа воркеров')
+    bench_parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    bench_parser.add_argument('--workers', type=int, nargs='+',
+                              default=sorted({0, 1, 2, 4, os.cpu_count() or 1}))
+    bench_parser.add_argument('--k', type=int, default=100)
+    bench_parser.add_argument('--repeat', type=int, default=20)
+    unlink_parser = subparsers.add_parser('unlink', help='удалить сегмент (после остановки приложений)')
+    unlink_parser.add_argument('name')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        print(bench(args.sizes, args.workers, args.k, repeat=args.repeat).to_string(index=False))
+    else:
+        segment = SharedSegment.attach(args.name)
+        segment.close()
+        segment.unlink()
+        print(f'unlinked {args.name}')
+
+
+if __name__ == '__main__':
+    main()
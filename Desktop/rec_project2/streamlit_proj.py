@@ -1,31 +1,9 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-from pathlib import Path
-from gensim.models import Doc2Vec
-from gensim.models.doc2vec import TaggedDocument
-from surprise import KNNBaseline, Dataset, Reader
-from sklearn.metrics.pairwise import cosine_similarity
-import matplotlib.pyplot as plt
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-import nltk
-import re
-import string
-from nltk.stem.porter import PorterStemmer
-
-def tokenize(text):
-    return re.findall(r'\b\w+\b', text.lower())
-# nltk.data.path.append("./nltk_data")
-
-# Инициализация
-stop_words = set(["a", "the", "is", "in", "at", "which", "on", "for", "to", "and"])
-stemmer = PorterStemmer()
-# lemmatizer = WordNetLemmatizer()
-
-# stemmer = PorterStemmer()
-# tokens = [stemmer.stem(word) for word in tokens]
+import os
+from coldstart import PopularityRanking, popular_frame
+from filters import AttributeIndex, CourseFilter
+from profiling import timer
+from warmup import SERVICE_URL_ENV, STAGE_LABELS, startup_mode, warmup
 
 # Настройки страницы
 st.set_page_config(
@@ -34,178 +12,56 @@ st.set_page_config(
     layout="wide"
 )
 
-# Загрузка данных
-@st.cache_data
-def load_data():
-    try:
-        df_ratings = pd.read_csv('Desktop/rec_project2/df_ratings.csv')
-        df_courses = pd.read_csv('Desktop/rec_project2/info2022_final.csv')
-        
-        # Проверяем и переименовываем необходимые колонки
-        if 'Course ID' in df_courses.columns:
-            df_courses = df_courses.rename(columns={'Course ID': 'course_id'})
-        if 'Course title' in df_courses.columns:
-            df_courses = df_courses.rename(columns={'Course title': 'title'})
-        
-        return df_ratings, df_courses
-    except FileNotFoundError as e:
-        st.error(f"Ошибка загрузки данных: {str(e)}")
-        st.stop()
-
-df_ratings, df_courses = load_data()
-
-string_cols = df_courses.select_dtypes(include='object')
-string_cols = string_cols.fillna('').apply(lambda col: col.str.lower())
-df_courses['description'] = string_cols.apply(lambda row: ' '.join(filter(None, row)), axis=1)
-
-# Функция предобработки текста
-# def preprocess_text(text):
-#     text = str(text).lower()
-#     text = re.sub(r'[^a-zA-Z\s]', '', text)
-#     # tokens = word_tokenize(text)
-#     tokens = tokenize(text)
-#     tokens = [
-#         lemmatizer.lemmatize(word)
-#         for word in tokens
-#         if word.isalpha() and word not in stop_words and word not in set(string.punctuation)
-#     ]
-#     return tokens
-
-def preprocess_text(text):
-    text = text.lower()
-    text = re.sub(r"[^a-zA-Z0-9]", " ", text)
-    # words = word_tokenize(text)  # ← сначала токенизация
-    words = text.split()
-    tokens = [stemmer.stem(word) for word in words if len(word) > 2]  # ← потом стемминг
-    return tokens
+# Данные, модели и артефакты грузит warmup.py один раз на процесс: в режиме background —
+# в потоке с запуска main.py, и страница не ждёт моделей. Кадры только читаются и общие
+# для всех сессий; тяжёлые библиотеки (gensim, surprise, nltk) сюда не импортируются
+try:
+    df_ratings, df_courses = warmup.data()
+except FileNotFoundError as e:
+    st.error(f"Ошибка загрузки данных: {str(e)}")
+    st.stop()
 
+# Популярное для новых пользователей и для всех, пока модели ещё загружаются
+@st.cache_resource
+def get_popularity(_df_courses):
+    return PopularityRanking(_df_courses)
 
-# Создание или загрузка Doc2Vec модели
+# Индексы атрибутов: границы фильтров в боковой панели и популярное до загрузки моделей
 @st.cache_resource
-def get_doc2vec_model(df_courses):
-    model_path = Path("doc2vec_model.model")
-    
-    if model_path.exists():
-        try:
-            return Doc2Vec.load(str(model_path))
-        except Exception as e:
-            st.warning(f"Ошибка загрузки модели: {str(e)}. Создаем новую модель.")
-    
-    # Создаем новую модель
-    with st.spinner("Создание Doc2Vec модели... Это может занять несколько минут."):
-        # Подготовка данных
-        documents = [
-            TaggedDocument(
-                words=preprocess_text(row['description']),
-                tags=[str(idx)]
-            )
-            for idx, row in df_courses.iterrows()
-        ]
-        
-        # Обучение модели
-        model = Doc2Vec(
-            vector_size=50,
-            min_count=2,
-            epochs=20,
-            workers=4
-        )
-        model.build_vocab(documents)
-        model.train(documents, total_examples=model.corpus_count, epochs=model.epochs)
-        
-        # Сохраняем модель
-        model.save(str(model_path))
-        # st.success("Doc2Vec модель успешно создана и сохранена.")
-        return model
+def get_attribute_index(_df_courses):
+    return AttributeIndex(_df_courses)
 
-# Загрузка KNN модели
+# Если задан REC_SERVICE_URL, рекомендации считает сервис (service.py), а страница
+# только показывает их: модели в этом процессе не загружаются
 @st.cache_resource
-def get_knn_model(df_ratings):
+def get_remote_recommender(service_url, df_courses):
+    from service import RemoteRecommender
+
+    return RemoteRecommender(service_url, df_courses)
+
+service_url = os.environ.get(SERVICE_URL_ENV)
+recommender = None
+if service_url:
+    recommender = get_remote_recommender(service_url, df_courses)
     try:
-        # Проверяем и переименовываем колонки
-        if 'userId' in df_ratings.columns:
-            df_ratings = df_ratings.rename(columns={'userId': 'user_id'})
-        if 'course_id' not in df_ratings.columns and 'Course ID' in df_ratings.columns:
-            df_ratings = df_ratings.rename(columns={'Course ID': 'course_id'})
-        if 'rate' not in df_ratings.columns and 'rating' in df_ratings.columns:
-            df_ratings = df_ratings.rename(columns={'rating': 'rate'})
-        
-        reader = Reader(rating_scale=(1, 5))
-        data = Dataset.load_from_df(df_ratings[['user_id', 'course_id', 'rate']], reader)
-        trainset = data.build_full_trainset()
-        
-        model = KNNBaseline(
-            k=10,
-            sim_options={'name': 'pearson_baseline', 'user_based': True},
-            bsl_options={'method': 'als', 'n_epochs': 5, 'reg_u': 15, 'reg_i': 5}
-        )
-        model.fit(trainset)
-        return model
+        available_modes = recommender.health()['modes']
     except Exception as e:
-        st.error(f"Ошибка инициализации KNN модели: {str(e)}")
+        st.error(f"Сервис рекомендаций недоступен ({service_url}): {str(e)}")
         st.stop()
-
-# Загрузка моделей
-doc2vec_model = get_doc2vec_model(df_courses)
-knn_model = get_knn_model(df_ratings)
-
-# Класс рекомендателя
-class HybridRecommender:
-    def __init__(self, cf_model, doc2vec_model, df_courses, df_ratings, n_candidates=100):
-        self.cf_model = cf_model
-        self.doc2vec_model = doc2vec_model
-        self.df_courses = df_courses
-        self.df_ratings = df_ratings
-        self.n_candidates = n_candidates
-        self.course_id_to_idx = {cid: idx for idx, cid in enumerate(df_courses['course_id'])}
-
-    def _get_cf_candidates(self, user_id):
-        valid_items = self.df_courses['course_id'].unique()
-        scores = [self.cf_model.predict(user_id, item).est for item in valid_items]
-        top_indices = np.argsort(scores)[-self.n_candidates:][::-1]
-        return valid_items[top_indices], np.array(scores)[top_indices]
-
-    def _get_content_scores(self, user_id, candidates):
-        user_history = self.df_ratings[self.df_ratings['user_id'] == user_id]['course_id']
-        if len(user_history) == 0:
-            return np.zeros(len(candidates))
-        
-        user_vector = np.mean([
-            self.doc2vec_model.dv[str(self.course_id_to_idx[cid])]
-            for cid in user_history
-            if cid in self.course_id_to_idx
-        ], axis=0)
-        
-        candidate_vectors = [
-            self.doc2vec_model.dv[str(self.course_id_to_idx[cid])]
-            for cid in candidates
-            if cid in self.course_id_to_idx
-        ]
-        
-        if len(candidate_vectors) == 0:
-            return np.zeros(len(candidates))
-            
-        return cosine_similarity([user_vector], candidate_vectors)[0]
-
-    def recommend(self, user_id, top_k=10):
-        candidates, cf_scores = self._get_cf_candidates(user_id)
-        content_scores = self._get_content_scores(user_id, candidates)
-        combined_scores = 0.7 * cf_scores + 0.3 * content_scores
-        top_indices = np.argsort(combined_scores)[-top_k:][::-1]
-        
-        result = pd.DataFrame({
-            'course_id': candidates[top_indices],
-            'score': combined_scores[top_indices]
-        }).merge(self.df_courses, on='course_id')
-        
-        return result.sort_values('score', ascending=False)
-
-# Инициализация рекомендателя
-recommender = HybridRecommender(
-    cf_model=knn_model,
-    doc2vec_model=doc2vec_model,
-    df_courses=df_courses,
-    df_ratings=df_ratings
-)
+else:
+    if startup_mode() == 'blocking':
+        with st.spinner("Загрузка моделей... Первое обучение может занять несколько минут."):
+            warmup.wait()
+    available_modes = ['cf', 'content']
+    if warmup.ready:
+        recommender = warmup.recommender
+        warmup.refresh_optional()
+        if recommender.item_neighbors is not None:
+            available_modes.append('item')
+    for name, message in warmup.warnings.items():
+        st.warning(f"Не удалось загрузить {STAGE_LABELS.get(name, name)}: {message}")
+    if warmup.status == 'failed':
+        st.error(f"Ошибка инициализации моделей ({warmup.error}). Показаны популярные курсы.")
 
 # Интерфейс Streamlit
 st.title("🎓 Гибридная рекомендательная система курсов")
@@ -213,24 +69,86 @@ st.title("🎓 Гибридная рекомендательная систем
 # Боковая панель
 with st.sidebar:
     st.header("⚙️ Настройки")
-    user_list = df_ratings['user_id'].unique().tolist()
-    selected_user = st.selectbox("Выберите пользователя", user_list)
+    # Новый пользователь — холодный старт: популярное из каталога, можно сузить категорией
+    new_user_label = "Новый пользователь"
+    user_list = [new_user_label] + df_ratings['user_id'].unique().tolist()
+    selected_user = st.selectbox("Выберите пользователя", user_list, index=1 if len(user_list) > 1 else 0)
+    is_new_user = selected_user == new_user_label
+    if is_new_user:
+        all_categories = "Все категории"
+        selected_category = st.selectbox(
+            "Категория", [all_categories] + sorted(df_courses['category'].dropna().astype(str).unique()))
+        selected_category = None if selected_category == all_categories else selected_category
     num_recommendations = st.slider("Количество рекомендаций", 3, 20, 10)
+    mode_labels = {'cf': "Весь каталог (KNN)", 'content': "Контент + популярное + новинки",
+                   'item': "Похожие на оценённые курсы"}
+    candidate_modes = {mode_labels[mode]: mode for mode in available_modes}
+    candidate_mode = candidate_modes[st.radio("Отбор кандидатов", list(candidate_modes))]
+    # Фильтры по атрибутам курсов (filters.py): применяются до оценок моделей
+    attribute_index = get_attribute_index(df_courses)
+    with st.expander("Фильтры"):
+        only_free = st.checkbox("Только бесплатные")
+        max_price = None
+        price_range = attribute_index.value_range('price')
+        if price_range and not only_free and price_range[1] > price_range[0]:
+            selected_price = st.slider("Цена до", price_range[0], price_range[1], price_range[1],
+                                       format="%.0f")
+            max_price = None if selected_price >= price_range[1] else selected_price
+        max_length = None
+        length_range = attribute_index.value_range('content_length_min')
+        if length_range and length_range[1] > length_range[0]:
+            longest = int(length_range[1]) + 1
+            selected_length = st.slider("Длительность до, мин", 0, longest, longest, step=10)
+            max_length = None if selected_length >= longest else selected_length
+        selected_categories = st.multiselect("Категории", attribute_index.values('category'))
+        selected_languages = None
+        if attribute_index.values('language'):
+            selected_languages = st.multiselect("Язык", attribute_index.values('language'))
+    course_filter = CourseFilter(is_paid=False if only_free else None, max_price=max_price,
+                                 max_length=max_length, categories=selected_categories,
+                                 languages=selected_languages)
 
 # Основное содержимое
-st.header(f"Рекомендации для пользователя {selected_user}")
+if is_new_user:
+    st.header("Популярные курсы для нового пользователя")
+else:
+    st.header(f"Рекомендации для пользователя {selected_user}")
+
+# Пока модели грузятся, фрагмент раз в секунду проверяет готовность и перерисовывает страницу
+if recommender is None and warmup.status == 'loading':
+    @st.fragment(run_every=1)
+    def wait_for_models():
+        if warmup.ready:
+            st.rerun()
+        st.info(f"Модели загружаются ({warmup.stage_label}) — пока показаны популярные курсы")
+
+    wait_for_models()
 
 try:
-    recommendations = recommender.recommend(selected_user, top_k=num_recommendations)
+    if recommender is None:
+        timer.count('recommend.warmup_fallback')
+        recommendations = popular_frame(get_popularity(df_courses), df_courses, num_recommendations,
+                                        selected_category if is_new_user else None,
+                                        attribute_index.mask(course_filter))
+    elif is_new_user:
+        recommendations = recommender.recommend_popular(top_k=num_recommendations,
+                                                        category=selected_category,
+                                                        course_filter=course_filter)
+    else:
+        recommendations = recommender.recommend(selected_user, top_k=num_recommendations,
+                                              candidate_mode=candidate_mode,
+                                              course_filter=course_filter)
     
     if recommendations.empty:
-        st.warning("Не найдено рекомендаций для этого пользователя.")
+        st.warning("Не найдено рекомендаций для этого пользователя."
+                   + (" Попробуйте ослабить фильтры." if course_filter else ""))
     else:
-        # Отображение карточек
-        cols = st.columns(3)
-        for idx, row in recommendations.iterrows():
-            with cols[idx % 3]:
-                st.markdown(f"""
+        # Отображение карточек и таблицы (стадия render в profiling.timer)
+        with timer.stage('render'):
+            cols = st.columns(3)
+            for idx, row in recommendations.iterrows():
+                with cols[idx % 3]:
+                    st.markdown(f"""
                 <div style="
                     border-radius: 10px;
                     padding: 15px;
@@ -245,36 +163,53 @@ try:
                 </div>
                 """, unsafe_allow_html=True)
         
-        # Таблица с деталями
-        with st.expander("Подробная информация"):
-            display_columns = ['title', 'score']
-            if 'category' in recommendations.columns:
-                display_columns.append('category')
-            if 'avg_rating' in recommendations.columns:
-                display_columns.append('avg_rating')
-            if 'language' in recommendations.columns:
-                display_columns.append('language')
-            if 'instructor_name' in recommendations.columns:
-                display_columns.append('instructor_name')
-            if 'course_url' in recommendations.columns:
-                display_columns.append('course_url')
-
-
-
-            st.dataframe(
-                recommendations[display_columns],
-                column_config={
-                    "title": "Название курса",
-                    "score": st.column_config.NumberColumn("Оценка", format="%.2f"),
-                    "category": "Категория",
-                    "avg_rating": st.column_config.NumberColumn("Рейтинг", format="%.1f"),
-                    "language": 'Язык',
-                    "instructor_name" : "Инструктор",
-                    "course_url" : "Ccылка на курс",
-                },
-                hide_index=True,
-                use_container_width=True
-            )
+            # Таблица с деталями
+            with st.expander("Подробная информация"):
+                display_columns = ['title', 'score']
+                if 'category' in recommendations.columns:
+                    display_columns.append('category')
+                if 'avg_rating' in recommendations.columns:
+                    display_columns.append('avg_rating')
+                if 'language' in recommendations.columns:
+                    display_columns.append('language')
+                if 'instructor_name' in recommendations.columns:
+                    display_columns.append('instructor_name')
+                if 'course_url' in recommendations.columns:
+                    display_columns.append('course_url')
+
+
+
+                st.dataframe(
+                    recommendations[display_columns],
+                    column_config={
+                        "title": "Название курса",
+                        "score": st.column_config.NumberColumn("Оценка", format="%.2f"),
+                        "category": "Категория",
+                        "avg_rating": st.column_config.NumberColumn("Рейтинг", format="%.1f"),
+                        "language": 'Язык',
+                        "instructor_name" : "Инструктор",
+                        "course_url" : "Ccылка на курс",
+                    },
+                    hide_index=True,
+                    use_container_width=True
+                )
         
 except Exception as e:
     st.error(f"Ошибка при генерации рекомендаций: {str(e)}")
+
+# Счётчики кэша рекомендаций (после запроса, чтобы учесть его); у сервиса — его собственный кэш
+if recommender is None:
+    cache_stats = None
+else:
+    cache_stats = recommender.stats()['cache'] if service_url else recommender.result_cache.stats()
+if cache_stats:
+    with st.sidebar:
+        with st.expander("Кэш рекомендаций"):
+            st.caption(f"Записей: {cache_stats['size']} из {cache_stats['max_entries']}")
+            st.caption(f"Попадания: {cache_stats['hits']}, промахи: {cache_stats['misses']} "
+                       f"(hit rate {cache_stats['hit_rate']:.0%})")
+            st.caption(f"Вытеснено: {cache_stats['evictions']}, истекло: {cache_stats['expirations']}, "
+                       f"сброшено: {cache_stats['invalidations']}")
+
+# Time-to-first-render процесса (см. warmup.py и страницу профилирования)
+warmup.mark_first_render()
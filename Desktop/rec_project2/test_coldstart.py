@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from artifacts import ArtifactStore
+from coldstart import ADDED_COURSES_ARTIFACT, course_embeddings, ingest_courses
+from dataset import COURSES_PATH, load_courses
+from recommender import load_doc2vec_model
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    df = pd.read_csv(COURSES_PATH)
+    courses_path = tmp_path / 'courses.csv'
+    df.iloc[:25].to_csv(courses_path, index=False)
+    for name, rows in [('first.csv', slice(25, 30)), ('second.csv', slice(30, 35))]:
+        df.iloc[rows].to_csv(tmp_path / name, index=False)
+    return courses_path, ArtifactStore(tmp_path / 'artifacts')
+
+
+def _embeddings(courses_path, store):
+    df_courses = load_courses(courses_path, store=store)
+    return course_embeddings(load_doc2vec_model(df_courses, store=store), df_courses, store)
+
+
+# Курсы, дописанные в каталог, не переобучают Doc2Vec: их векторы считаются при приёме,
+# сохраняются и при следующем дописывании не меняются
+def test_ingest_courses_keeps_model_and_vectors(catalog):
+    courses_path, store = catalog
+    trained = _embeddings(courses_path, store)
+
+    assert ingest_courses(courses_path.parent / 'first.csv', courses_path, store) == 5
+    first = _embeddings(courses_path, store)
+    assert len(store.keys('doc2vec')) == 1
+    assert len(store.keys(ADDED_COURSES_ARTIFACT)) == 1
+    np.testing.assert_array_equal(first[:25], trained)
+    assert np.linalg.norm(first[25:], axis=1) == pytest.approx(1, abs=1e-5)
+    np.testing.assert_array_equal(_embeddings(courses_path, store), first)
+
+    assert ingest_courses(courses_path.parent / 'second.csv', courses_path, store) == 5
+    assert ingest_courses(courses_path.parent / 'second.csv', courses_path, store) == 0
+    second = _embeddings(courses_path, store)
+    assert len(store.keys('doc2vec')) == 1
+    assert len(second) == 35
+    np.testing.assert_array_equal(second[:30], first)
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from artifacts import ArtifactStore
+from incremental import IncrementalKNNBaseline, drift_check, synthetic_ratings
+from recommender import KNN_PARAMS
+
+MAE_TOLERANCE = 0.05
+
+
+@pytest.fixture(scope='module')
+def ratings():
+    return synthetic_ratings(n_users=300, n_items=60, n_ratings=6000)
+
+
+# Повторные оценки уже оценённых пар с более поздними датами: попадают в последние батчи
+def _with_rerates(df_ratings, n_rerates=200, seed=1):
+    rng = np.random.default_rng(seed)
+    rerated = df_ratings.iloc[rng.choice(len(df_ratings) // 2, n_rerates, replace=False)].copy()
+    rerated['rate'] = 6 - rerated['rate']
+    rerated['date'] = df_ratings['date'].max() + pd.to_timedelta(np.arange(1, n_rerates + 1), unit='min')
+    return pd.concat([df_ratings, rerated], ignore_index=True)
+
+
+def test_drift_within_tolerance(ratings):
+    result = drift_check(ratings, KNN_PARAMS, n_batches=5)
+    assert result['all_mae'] < MAE_TOLERANCE
+
+
+def test_drift_within_tolerance_with_rerates(ratings):
+    result = drift_check(_with_rerates(ratings), KNN_PARAMS, n_batches=5, new_ratio=0.15)
+    assert result['all_mae'] < MAE_TOLERANCE
+
+
+# refit после повторных оценок учится на последней оценке пары, а не на обеих
+def test_refit_keeps_latest_rating(ratings, tmp_path):
+    df = _with_rerates(ratings)
+    cut = len(ratings)
+    inc = IncrementalKNNBaseline(KNN_PARAMS, refit_every=None).fit(ratings, ArtifactStore(tmp_path))
+    inc.update(df.iloc[cut:])
+
+    frame = inc.ratings_frame()
+    assert not frame.duplicated(['user_id', 'course_id']).any()
+    latest = df.drop_duplicates(['user_id', 'course_id'], keep='last')
+    merged = frame.merge(latest, on=['user_id', 'course_id'], suffixes=('', '_latest'))
+    assert len(merged) == len(latest) == len(frame)
+    assert (merged['rate'] == merged['rate_latest']).all()
+
+    inc.refit(ArtifactStore(tmp_path))
+    assert len(inc.ratings) == len(latest)
+
+
+# Два приёма подряд, во втором — повторная оценка: файл без дублей, артефакт KNN под ключом
+# файла (следующий старт не переобучает модель), второй update не падает на дублях
+def test_ingest_twice_with_rerating(ratings, tmp_path):
+    from artifacts import knn_key
+    from dataset import load_ratings
+    from incremental import ingest
+
+    store = ArtifactStore(tmp_path / 'artifacts')
+    ratings_path = tmp_path / 'ratings.csv'
+    ratings.iloc[:4000].to_csv(ratings_path, index=False)
+    first = ratings.iloc[4000:4100]
+    first.to_csv(tmp_path / 'first.csv', index=False)
+    ingest(tmp_path / 'first.csv', ratings_path, KNN_PARAMS, store=store)
+
+    rerated = ratings.iloc[[0, 4050]].assign(rate=lambda df: 6 - df['rate'],
+                                              date=ratings['date'].max() + pd.Timedelta(days=1))
+    second = pd.concat([rerated, ratings.iloc[4100:4150]])
+    second.to_csv(tmp_path / 'second.csv', index=False)
+    ingest(tmp_path / 'second.csv', ratings_path, KNN_PARAMS, store=store)
+
+    df = load_ratings(ratings_path, store=store)
+    assert len(df) == 4150
+    assert not df.duplicated(['user_id', 'course_id']).any()
+    merged = df.merge(rerated, on=['user_id', 'course_id'], suffixes=('', '_new'))
+    assert (merged['rate'] == merged['rate_new']).all()
+    assert store.exists('knn', knn_key(df, KNN_PARAMS))
+
+    ingest(tmp_path / 'second.csv', ratings_path, KNN_PARAMS, store=store)
+    assert len(load_ratings(ratings_path, store=store)) == 4150
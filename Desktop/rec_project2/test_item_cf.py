@@ -0,0 +1,16 @@
+import numpy as np
+import pandas as pd
+
+from item_cf import ItemNeighbors
+
+
+# Повторная оценка пары заменяет прежнюю: соседи те же, что без первой оценки
+def test_rerated_pair_keeps_last_rating():
+    df = pd.DataFrame({'user_id': [1, 1, 2, 2, 3, 3, 1], 'course_id': [10, 11, 10, 11, 10, 12, 10],
+                       'rate': [5, 3, 4, 2, 1, 4, 1]})
+    course_index = pd.Index([10, 11, 12])
+    with_rerate = ItemNeighbors.fit(df, course_index, n_neighbors=2, n_jobs=1)
+    latest = ItemNeighbors.fit(df.iloc[1:], course_index, n_neighbors=2, n_jobs=1)
+
+    np.testing.assert_array_equal(with_rerate.neighbor_idx, latest.neighbor_idx)
+    np.testing.assert_allclose(with_rerate.neighbor_sim, latest.neighbor_sim)
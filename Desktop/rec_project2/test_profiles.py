@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from profiles import UserProfileStore
+
+N_COURSES = 12
+
+
+@pytest.fixture
+def catalog():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(N_COURSES, 6)).astype(np.float32)
+    return embeddings, pd.Index(np.arange(100, 100 + N_COURSES))
+
+
+def _ratings(rows):
+    return pd.DataFrame(rows, columns=['user_id', 'course_id', 'rate', 'date']).assign(
+        date=lambda df: pd.to_datetime(df['date']))
+
+
+def _assert_same_profiles(store, expected, user_ids):
+    for user_id in user_ids:
+        row, expected_row = store.user_to_row[user_id], expected.user_to_row[user_id]
+        np.testing.assert_allclose(store.sums[row], expected.sums[expected_row], rtol=1e-5, atol=1e-5)
+        assert store.ref_time[row] == expected.ref_time[expected_row]
+
+
+HISTORY = [(1, 100, 5.0, '2022-01-01'), (1, 101, 3.0, '2022-02-01'), (2, 102, 4.0, '2022-03-01')]
+
+
+def test_new_pairs_match_build(catalog):
+    embeddings, course_index = catalog
+    history = _ratings(HISTORY)
+    df_new = _ratings([(1, 103, 2.0, '2022-04-01'), (3, 104, 5.0, '2022-04-02')])
+    store = UserProfileStore.build(history, embeddings, course_index)
+    store.add_ratings(df_new, embeddings, course_index, history)
+    expected = UserProfileStore.build(pd.concat([history, df_new]), embeddings, course_index)
+    _assert_same_profiles(store, expected, [1, 2, 3])
+
+
+# Повторная оценка (против истории и внутри батча) заменяет прежнюю, а не прибавляется к ней
+def test_rerating_matches_build_on_latest_ratings(catalog):
+    embeddings, course_index = catalog
+    history = _ratings(HISTORY)
+    df_new = _ratings([(1, 100, 1.0, '2022-05-01'), (2, 105, 2.0, '2022-05-02'),
+                       (2, 105, 5.0, '2022-05-03'), (3, 104, 4.0, '2022-05-04')])
+    store = UserProfileStore.build(history, embeddings, course_index)
+    store.add_ratings(df_new, embeddings, course_index, history)
+    latest = pd.concat([history, df_new]).drop_duplicates(['user_id', 'course_id'], keep='last')
+    expected = UserProfileStore.build(latest, embeddings, course_index)
+    _assert_same_profiles(store, expected, [1, 2, 3])
+
+
+# Повторная оценка уже в исходных данных: build учитывает только последнюю оценку пары
+def test_build_keeps_last_rating_of_rerated_pair(catalog):
+    embeddings, course_index = catalog
+    history = _ratings(HISTORY + [(1, 100, 1.0, '2022-03-01')])
+    store = UserProfileStore.build(history, embeddings, course_index)
+    expected = UserProfileStore.build(history.iloc[1:], embeddings, course_index)
+    _assert_same_profiles(store, expected, [1, 2])
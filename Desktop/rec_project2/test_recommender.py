@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from artifacts import ArtifactStore, load_or_fit_knn
+from item_cf import ItemNeighbors
+from recommender import KNN_PARAMS, HybridRecommender, add_description, build_documents, read_data
+from text_pipeline import TokenCache
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(tmp_path)
+
+
+@pytest.fixture
+def recommender(store):
+    from gensim.models import Doc2Vec
+
+    df_ratings, df_courses = read_data()
+    add_description(df_courses)
+    documents = list(build_documents(df_courses, TokenCache(store).tokens(df_courses['description'])))
+    doc2vec_model = Doc2Vec(documents, vector_size=8, min_count=1, epochs=2, workers=1, seed=0)
+    item_neighbors = ItemNeighbors.fit(df_ratings, pd.Index(df_courses['course_id']), n_neighbors=5, n_jobs=1)
+    return HybridRecommender(load_or_fit_knn(df_ratings, KNN_PARAMS, store), doc2vec_model, df_courses,
+                             df_ratings, item_neighbors=item_neighbors)
+
+
+# Новый курс из add_courses попадает в историю пользователя: у него нет строки соседей,
+# режим 'item' не должен выходить за границы массивов соседей
+def test_item_mode_after_adding_rated_course(recommender, store):
+    df_courses = recommender.df_courses
+    new_courses = df_courses.iloc[:2].assign(course_id=df_courses['course_id'].max() + 1 + np.arange(2))
+    recommender.add_courses(new_courses, TokenCache(store))
+    assert len(recommender.item_neighbors.neighbor_idx) == len(recommender.df_courses)
+
+    user_id = recommender.df_ratings['user_id'].iloc[0]
+    recommender.add_ratings(pd.DataFrame({'user_id': [user_id], 'course_id': [new_courses['course_id'].iloc[0]],
+                                          'rate': [5.0], 'date': [pd.Timestamp('2023-01-01')]}))
+    ids, scores = recommender.recommend_ids_many([user_id], 10, 'item')[0]
+    assert len(ids) == len(scores) > 0
+    assert recommender.recommend_ids(user_id, 10, 'item')[0].tolist() == ids.tolist()
+
+
+# Курс без категории: из dataset.py category приходит категориальной колонкой с NaN,
+# пул кандидатов относит такой курс к пустой категории
+def test_candidate_pool_with_missing_category(store, tmp_path):
+    from candidates import CandidatePool
+    from dataset import load_courses
+
+    df_courses = read_data()[1].head(5).assign(category=['Development', None, 'Business', None, 'Development'])
+    courses_path = tmp_path / 'courses.csv'
+    df_courses.drop(columns='description', errors='ignore').to_csv(courses_path, index=False)
+    df_courses = load_courses(courses_path, store=store)
+    assert isinstance(df_courses['category'].dtype, pd.CategoricalDtype)
+
+    pool = CandidatePool(df_courses, np.eye(5, dtype=np.float32), np.arange(5), n_popular=5)
+    assert len(pool.category_popular) == 3
+    assert pool.category_codes[1] == pool.category_codes[3]
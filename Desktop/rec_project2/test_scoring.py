@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from artifacts import ArtifactStore, load_or_fit_knn
+from incremental import synthetic_ratings
+from recommender import KNN_PARAMS
+from scoring import KNNBaselineScorer
+
+TOLERANCE = 1e-9
+UNKNOWN_USER = -1
+UNKNOWN_COURSE = -1
+
+
+@pytest.fixture(scope='module')
+def model(tmp_path_factory):
+    df_ratings = synthetic_ratings(n_users=150, n_items=40, n_ratings=2000)
+    store = ArtifactStore(tmp_path_factory.mktemp('artifacts'))
+    return load_or_fit_knn(df_ratings[['user_id', 'course_id', 'rate']], KNN_PARAMS, store)
+
+
+def _surprise_estimates(model, user_ids, course_ids):
+    return np.array([[model.predict(uid, iid).est for iid in course_ids] for uid in user_ids])
+
+
+def _cases(model):
+    trainset = model.trainset
+    users = [trainset.to_raw_uid(u) for u in range(0, trainset.n_users, 10)] + [UNKNOWN_USER]
+    courses = [trainset.to_raw_iid(i) for i in range(trainset.n_items)] + [UNKNOWN_COURSE]
+    return users, courses
+
+
+# Известные и неизвестные пользователи и курсы: те же оценки, что у algo.predict(u, i).est
+def test_estimate_matches_surprise(model):
+    scorer = KNNBaselineScorer(model)
+    users, courses = _cases(model)
+    expected = _surprise_estimates(model, users, courses)
+    inner_items = scorer.to_inner_items(courses)
+    for row, user_id in enumerate(users):
+        np.testing.assert_allclose(scorer.estimate(user_id, inner_items), expected[row],
+                                   rtol=0, atol=TOLERANCE)
+
+
+# Короткий список курсов считается по выбранным курсам, а не по всему каталогу
+def test_estimate_few_items_matches_surprise(model):
+    scorer = KNNBaselineScorer(model)
+    users, courses = _cases(model)
+    few = courses[:3] + [UNKNOWN_COURSE]
+    expected = _surprise_estimates(model, users, few)
+    for row, user_id in enumerate(users):
+        np.testing.assert_allclose(scorer.estimate(user_id, scorer.to_inner_items(few)), expected[row],
+                                   rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('max_entries', [2 ** 24, 1])
+def test_estimate_batch_matches_surprise(model, max_entries):
+    scorer = KNNBaselineScorer(model)
+    users, courses = _cases(model)
+    expected = _surprise_estimates(model, users, courses)
+    result = scorer.estimate_batch(users, scorer.to_inner_items(courses), max_entries=max_entries)
+    np.testing.assert_allclose(result, expected, rtol=0, atol=TOLERANCE)
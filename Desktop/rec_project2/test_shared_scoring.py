@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pytest
+
+from shared_scoring import SharedSegment, ShardedScorer
+
+
+def _arrays(n_courses, n_factors=8, dim=5, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        'item_factors': rng.normal(0, 0.1, (n_courses, n_factors)).astype(np.float32),
+        'item_bias': rng.normal(0, 0.1, n_courses).astype(np.float32),
+        'embeddings': rng.normal(0, 1, (n_courses, dim)).astype(np.float32),
+        'neighbor_idx': rng.integers(-1, n_courses, (n_courses, 3)).astype(np.int32),
+    }
+
+
+@pytest.fixture
+def segment_name(request):
+    return f'rec-test-{os.getpid()}-{request.node.name}'[:200].replace('[', '-').replace(']', '')
+
+
+# Длина заголовка зависит от смещений массивов: на границах 64 байт он не должен
+# наезжать на первый массив ни у создателя, ни у подключившегося процесса
+@pytest.mark.parametrize('n_courses', [1, 7, 100, 785, 786, 999, 1000, 10_000, 99_999, 100_000])
+def test_arrays_survive_create_and_attach(segment_name, n_courses):
+    arrays = _arrays(n_courses)
+    meta = {'global_mean': 3.5, 'rating_scale': [1, 5]}
+    segment = SharedSegment.create(segment_name, arrays, meta)
+    try:
+        attached = SharedSegment.attach(segment_name)
+        for view in (segment, attached):
+            assert view.meta == meta
+            for name, array in arrays.items():
+                assert view.arrays[name].dtype == array.dtype
+                np.testing.assert_array_equal(view.arrays[name], array)
+        attached.close()
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def test_header_never_overlaps_data_across_sizes(segment_name):
+    for n_courses in range(1, 3000, 7):
+        arrays = _arrays(n_courses, n_factors=2, dim=1)
+        segment = SharedSegment.create(segment_name, arrays)
+        try:
+            attached = SharedSegment.attach(segment_name)
+            for view in (segment, attached):
+                for name, array in arrays.items():
+                    np.testing.assert_array_equal(view.arrays[name], array, err_msg=f'{name}, n={n_courses}')
+            attached.close()
+        finally:
+            segment.close()
+            segment.unlink()
+
+
+def test_sharded_top_k_matches_full_scoring(segment_name):
+    arrays = _arrays(1000)
+    segment = SharedSegment.create(segment_name, arrays, {'global_mean': 3.5, 'rating_scale': [1, 5]})
+    try:
+        rng = np.random.default_rng(1)
+        user_factors = rng.normal(0, 0.1, (4, 8)).astype(np.float32)
+        user_bias = rng.normal(0, 0.1, 4).astype(np.float32)
+        scorer = ShardedScorer(segment, workers=0, shards=7)
+        rows, scores = scorer.top_k_batch(user_factors, user_bias, 10)
+        expected = np.clip(3.5 + arrays['item_bias'] + user_bias[:, None]
+                           + user_factors @ arrays['item_factors'].T, 1, 5)
+        for user_rows, user_scores, full in zip(rows, scores, expected):
+            np.testing.assert_allclose(user_scores, np.sort(full)[::-1][:10], rtol=1e-6)
+            np.testing.assert_allclose(full[user_rows], user_scores, rtol=1e-6)
+        scorer.close()
+    finally:
+        segment.close()
+        segment.unlink()
@@ -0,0 +1,39 @@
+from artifacts import ArtifactStore
+from text_pipeline import TOKENS_ARTIFACT, TokenCache, preprocess_text
+
+TEXTS = ['Python for data science', 'Machine learning with scikit-learn', 'Web development bootcamp']
+
+
+# Промах кэша дописывает часть только с новыми текстами, записанные части не трогаются
+def test_save_appends_only_new_texts(tmp_path):
+    store = ArtifactStore(tmp_path)
+    TokenCache(store).rows(TEXTS[:2])
+    first_key, = store.keys(TOKENS_ARTIFACT)
+    first_meta = store.read_meta(TOKENS_ARTIFACT, first_key)
+
+    TokenCache(store).rows(TEXTS)
+    keys = store.keys(TOKENS_ARTIFACT)
+    assert keys[0] == first_key and len(keys) == 2
+    assert store.read_meta(TOKENS_ARTIFACT, first_key) == first_meta
+    assert store.read_meta(TOKENS_ARTIFACT, keys[1])['texts'] == 1
+
+    cache = TokenCache(store)
+    assert cache.tokens(TEXTS) == [preprocess_text(text) for text in TEXTS]
+    cache.rows(TEXTS)
+    assert len(store.keys(TOKENS_ARTIFACT)) == 2
+
+
+# Два процесса с одной базой дописали часть под одним номером: читается цепочка победителя,
+# а часть проигравшего после неё отбрасывается
+def test_conflicting_chunks_keep_consistent_prefix(tmp_path):
+    store = ArtifactStore(tmp_path)
+    TokenCache(store).rows(TEXTS[:1])
+    first, second = TokenCache(store), TokenCache(store)
+    first.rows(['Advanced Python'])
+    second.rows(['Excel for beginners'])
+    first.rows(['Photography masterclass'])
+
+    cache = TokenCache(store)
+    assert len(cache) == 2
+    assert cache.tokens([TEXTS[0], 'Excel for beginners']) == [
+        preprocess_text(TEXTS[0]), preprocess_text('Excel for beginners')]
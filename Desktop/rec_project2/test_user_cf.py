@@ -0,0 +1,17 @@
+import numpy as np
+import pandas as pd
+
+from user_cf import UserBasedCF
+
+
+# Повторная оценка пары заменяет прежнюю: модель та же, что без первой оценки
+def test_rerated_pair_keeps_last_rating():
+    X = pd.DataFrame({'user_id': [1, 1, 2, 2, 3, 3, 1], 'course_id': [10, 11, 10, 11, 10, 12, 10]})
+    y = np.array([5, 3, 4, 2, 1, 4, 1])
+    with_rerate = UserBasedCF().fit(X, y)
+    latest = UserBasedCF().fit(X.iloc[1:], y[1:])
+
+    np.testing.assert_allclose(with_rerate.user_ratings.toarray(), latest.user_ratings.toarray())
+    assert with_rerate.global_mean == latest.global_mean
+    np.testing.assert_allclose(with_rerate.predict_pairs([1, 2, 3], [12, 12, 11]),
+                               latest.predict_pairs([1, 2, 3], [12, 12, 11]))
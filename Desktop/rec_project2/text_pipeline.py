@@ -0,0 +1,256 @@
+import argparse
+import hashlib
+import logging
+import multiprocessing as mp
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from artifacts import ArtifactStore, artifact_key
+
+logger = logging.getLogger(__name__)
+
+TOKENS_ARTIFACT = 'tokens'
+# Меняется при изменении preprocess_text или формата — токены из кэша перестают находиться
+TOKENS_FORMAT = 2
+# Меньше этого числа текстов токенизируем в текущем процессе: форк дороже
+PARALLEL_MIN_TEXTS = 2000
+CHUNK_SIZE = 500
+
+_NON_ALNUM = re.compile(r"[^a-zA-Z0-9]")
+# Общий кэш основ: словарь маленький, поток токенов огромный. Форкнутые процессы
+# получают его копию уже заполненным
+_stems = {}
+_stemmer = None
+
+
+# nltk импортируется при первой токенизации, а не при импорте модуля (~2 с на старте)
+def get_stemmer():
+    global _stemmer
+    if _stemmer is None:
+        from nltk.stem.porter import PorterStemmer
+
+        _stemmer = PorterStemmer()
+    return _stemmer
+
+
+def stem(word):
+    result = _stems.get(word)
+    if result is None:
+        result = _stems[word] = get_stemmer().stem(word)
+    return result
+
+
+def preprocess_text(text):
+    words = _NON_ALNUM.sub(' ', text.lower()).split()
+    return [stem(word) for word in words if len(word) > 2]
+
+
+def _preprocess_chunk(texts):
+    return [preprocess_text(text) for text in texts]
+
+
+# Токенизация списка текстов; большие списки — кусками в форкнутых процессах
+def tokenize_texts(texts, workers=None):
+    texts = list(texts)
+    if workers == 1 or len(texts) < PARALLEL_MIN_TEXTS or 'fork' not in mp.get_all_start_methods():
+        return _preprocess_chunk(texts)
+    chunks = [texts[start:start + CHUNK_SIZE] for start in range(0, len(texts), CHUNK_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('fork')) as pool:
+        return [tokens for chunk in pool.map(_preprocess_chunk, chunks) for tokens in chunk]
+
+
+def text_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+
+# Токены текстов на диске по хэшу текста: повторное обучение и infer_vector для новых
+# курсов не токенизируют уже виденные тексты. Хранится словарь и id токенов подряд
+# (offsets — границы текстов). Кэш лежит частями: save дописывает новую часть только
+# с новыми текстами и словами, уже записанное не переписывается. Каждая часть помнит
+# предыдущую (parent): если два процесса дописали часть с одним номером, читается
+# цепочка до расхождения
+class TokenCache:
+    def __init__(self, store=None):
+        self.store = store or ArtifactStore()
+        self.key = artifact_key('text-tokens', {'format': TOKENS_FORMAT})
+        hashes, lengths, ids, vocab = [], [], [], []
+        self.chunk = None
+        self.n_chunks = 0
+        for key in self.store.keys(TOKENS_ARTIFACT, f'{self.key}-'):
+            arrays, meta = self.store.load_arrays(TOKENS_ARTIFACT, key, mmap_mode='r')
+            if meta.get('parent') != self.chunk:
+                break
+            hashes.append(arrays['hashes'])
+            lengths.append(arrays['lengths'])
+            ids.append(arrays['ids'])
+            vocab.extend(arrays['vocab'].tolist())
+            self.chunk = meta['chunk']
+            self.n_chunks += 1
+        self.hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+        self.offsets = np.zeros(len(self.hashes) + 1, dtype=np.int64)
+        if lengths:
+            np.cumsum(np.concatenate(lengths), out=self.offsets[1:])
+        self.ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int32)
+        self.vocab = np.array(vocab, dtype=object)
+        self.row_of = {h: row for row, h in enumerate(self.hashes.tolist())}
+        self.word_ids = {word: pos for pos, word in enumerate(vocab)}
+        self.saved_rows = len(self.hashes)
+        self.saved_vocab = len(vocab)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def decode(self, row):
+        return self.vocab[self.ids[self.offsets[row]:self.offsets[row + 1]]].tolist()
+
+    def _add(self, hashes, tokens):
+        for doc in tokens:
+            for word in doc:
+                if word not in self.word_ids:
+                    self.word_ids[word] = len(self.word_ids)
+        new_ids = np.fromiter((self.word_ids[word] for doc in tokens for word in doc), dtype=np.int32)
+        lengths = np.fromiter((len(doc) for doc in tokens), dtype=np.int64, count=len(tokens))
+        for h in hashes:
+            self.row_of[h] = len(self.row_of)
+        self.hashes = np.concatenate([self.hashes, np.array(hashes, dtype=np.uint64)])
+        self.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(lengths)])
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.vocab = np.array(list(self.word_ids), dtype=object)
+
+    # Новая часть: тексты и слова, добавленные после последнего save
+    def save(self):
+        if len(self) == self.saved_rows:
+            return
+        start = self.saved_rows
+        chunk = f'{os.getpid()}-{time.time_ns()}'
+        self.store.save_arrays(TOKENS_ARTIFACT, f'{self.key}-{self.n_chunks:06d}', {
+            'hashes': self.hashes[start:],
+            'lengths': np.diff(self.offsets[start:]),
+            'ids': self.ids[self.offsets[start]:],
+            'vocab': np.array(self.vocab[self.saved_vocab:].tolist(), dtype=str),
+        }, {'chunk': chunk, 'parent': self.chunk, 'texts': len(self) - start, 'vocab_size': len(self.vocab)})
+        self.chunk = chunk
+        self.n_chunks += 1
+        self.saved_rows = len(self)
+        self.saved_vocab = len(self.vocab)
+
+    # Строки кэша для текстов; не найденные токенизируются (параллельно) и сохраняются
+    def rows(self, texts, workers=None):
+        hashes = [text_hash(text) for text in texts]
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in self.row_of and h not in missing:
+                missing[h] = text
+        if missing:
+            self._add(list(missing), tokenize_texts(missing.values(), workers))
+            self.save()
+        return np.fromiter((self.row_of[h] for h in hashes), dtype=np.int64, count=len(hashes))
+
+    def tokens(self, texts, workers=None):
+        return [self.decode(row) for row in self.rows(list(texts), workers)]
+
+
+# Корпус Doc2Vec поверх кэша токенов: документы собираются на лету при каждом проходе
+# (build_vocab и эпохи), в памяти только id токенов. Тексты без кэша токенизируются
+# при создании, скорость этой стадии пишется в лог
+class CourseCorpus:
+    def __init__(self, texts, tags, cache=None, workers=None):
+        self.cache = cache or TokenCache()
+        texts = ['' if text is None else str(text) for text in texts]
+        started = time.perf_counter()
+        self.rows = self.cache.rows(texts, workers)
+        elapsed = time.perf_counter() - started
+        self.tags = [str(tag) for tag in tags]
+        self.preprocess_docs_per_sec = len(texts) / elapsed if elapsed > 0 else float('inf')
+        logger.info('preprocessed %d docs: %.0f docs/sec', len(texts), self.preprocess_docs_per_sec)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        from gensim.models.doc2vec import TaggedDocument
+
+        for tag, row in zip(self.tags, self.rows.tolist()):
+            yield TaggedDocument(words=self.cache.decode(row), tags=[tag])
+
+
+# Векторы новых курсов без переобучения: токены из кэша, затем infer_vector
+def infer_vectors(doc2vec_model, texts, cache=None):
+    cache = cache or TokenCache()
+    vectors = np.zeros((len(texts), doc2vec_model.vector_size), dtype=np.float32)
+    for pos, tokens in enumerate(cache.tokens(texts)):
+        if tokens:
+            vectors[pos] = doc2vec_model.infer_vector(tokens)
+    return vectors
+
+
+# Как preprocess_text был устроен раньше: без кэша основ, регулярка на каждый вызов
+def _reference_preprocess(text):
+    words = re.sub(r"[^a-zA-Z0-9]", " ", text.lower()).split()
+    return [get_stemmer().stem(word) for word in words if len(word) > 2]
+
+
+# Синтетический корпус из описаний каталога: тексты уникальны (для кэша по хэшу),
+# а словарь остаётся словарём каталога
+def synthetic_texts(n_docs, seed=0):
+    from dataset import load_courses
+
+    rng = np.random.default_rng(seed)
+    words = ' '.join(load_courses(columns=['description'])['description']).split()
+    lengths = rng.integers(20, 80, n_docs)
+    starts = rng.integers(0, len(words) - 80, n_docs)
+    return [' '.join(words[start:start + length]) + f' doc{pos}'
+            for pos, (start, length) in enumerate(zip(starts.tolist(), lengths.tolist()))]
+
+
+def bench(n_docs, workers=None, epochs=5):
+    from recommender import DOC2VEC_PARAMS
+    from gensim.models import Doc2Vec
+
+    texts = synthetic_texts(n_docs)
+    rows = []
+
+    def measure(name, func):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        rows.append((name, n_docs / elapsed))
+
+    measure('preprocess: reference', lambda: [_reference_preprocess(text) for text in texts])
+    _stems.clear()
+    measure('preprocess: stem cache', lambda: [preprocess_text(text) for text in texts])
+    _stems.clear()
+    measure(f'preprocess: {workers or os.cpu_count()} processes',
+            lambda: tokenize_texts(texts, workers))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ArtifactStore(tmp)
+        measure('preprocess: cold disk cache', lambda: TokenCache(store).rows(texts, workers))
+        measure('preprocess: warm disk cache', lambda: TokenCache(store).rows(texts, workers))
+        corpus = CourseCorpus(texts, range(n_docs), TokenCache(store))
+        params = dict(DOC2VEC_PARAMS, epochs=epochs)
+        model = Doc2Vec(**params)
+        measure('train: build_vocab', lambda: model.build_vocab(corpus))
+        started = time.perf_counter()
+        model.train(corpus, total_examples=model.corpus_count, epochs=model.epochs)
+        rows.append((f'train: {epochs} epochs (docs x epochs)', n_docs * epochs / (time.perf_counter() - started)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Токенизация описаний и кэш токенов')
+    parser.add_argument('--docs', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--epochs', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, docs_per_sec in bench(args.docs, args.workers, args.epochs):
+        print(f'{name:<40} {docs_per_sec:>12.0f} docs/sec')
+
+
+if __name__ == '__main__':
+    main()
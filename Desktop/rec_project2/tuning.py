@@ -0,0 +1,219 @@
+import argparse
+import copy
+import itertools
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from artifacts import ArtifactStore, artifact_key, frame_hash, load_or_fit_knn
+from coldstart import course_embeddings
+from evaluation import ranking_metrics
+from recommender import (CF_WEIGHT, CONTENT_WEIGHT, COURSES_PATH, KNN_PARAMS, RATINGS_PATH,
+                         add_description, load_doc2vec_model, read_data)
+from profiles import UserProfileStore
+from scoring import KNNBaselineScorer, top_k_indices
+
+CF_SCORES_ARTIFACT = 'tuning_cf'
+CONTENT_SCORES_ARTIFACT = 'tuning_content'
+
+DEFAULT_WEIGHTS = (0.0, 0.3, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+DEFAULT_N_CANDIDATES = (20, 50, 100, 200)
+
+
+# Скользящие временные фолды: n_folds тестовых окон в хвосте шкалы дат (вместе test_ratio),
+# обучение — все оценки до начала окна. n_folds=1 совпадает с temporal_split(by='global').
+def temporal_folds(df_ratings, n_folds=3, test_ratio=0.2):
+    df = df_ratings.reset_index(drop=True).sort_values('date', kind='stable')
+    window = max(1, int(len(df) * test_ratio / n_folds))
+    folds = []
+    for j in range(n_folds):
+        cut = len(df) - window * (n_folds - j)
+        folds.append((df.iloc[:cut], df.iloc[cut:cut + window]))
+    return folds
+
+
+# Сетка KNNBaseline вокруг KNN_PARAMS; каждая комбинация — отдельное обучение
+def knn_grid(ks=(10,), methods=('als',)):
+    grid = []
+    for k, method in itertools.product(ks, methods):
+        params = copy.deepcopy(KNN_PARAMS)
+        params['k'] = k
+        params['bsl_options']['method'] = method
+        grid.append(params)
+    return grid
+
+
+# Фолд в виде, удобном для матриц: тестовые пользователи (с ограничением выборки)
+# и их релевантные курсы как позиции в df_courses
+class _Fold:
+    def __init__(self, train, test, course_index, embeddings, max_users=None, seed=0):
+        self.train = train
+        users = np.unique(test['user_id'].to_numpy())
+        if max_users and len(users) > max_users:
+            users = np.sort(np.random.default_rng(seed).choice(users, max_users, replace=False))
+        self.users = users
+        test = test[test['user_id'].isin(users)]
+        self.rel_users = np.searchsorted(users, test['user_id'].to_numpy())
+        rows = course_index.get_indexer(test['course_id'])
+        # Курсы не из каталога рекомендовать нельзя, но в знаменателе recall они остаются
+        self.rel_items = np.where(rows >= 0, rows, len(course_index))
+        self.profiles = UserProfileStore.build(train, embeddings, course_index)
+        self.data_hash = frame_hash(train, ['user_id', 'course_id', 'rate']) + \
+            frame_hash(pd.DataFrame({'user_id': users}))
+
+
+_tuning_state = {}
+
+
+# Стадия CF: обучение KNNBaseline (или чтение из artifacts) и оценки всех тестовых
+# пользователей по всему каталогу. Результат и время на пользователя — в хранилище.
+def _fit_cf_scores(task):
+    fold_idx, params = task
+    fold, course_ids, store = (_tuning_state['folds'][fold_idx], _tuning_state['course_ids'],
+                               _tuning_state['store'])
+    key = artifact_key(fold.data_hash + frame_hash(pd.DataFrame({'course_id': course_ids})),
+                       {'stage': 'cf', 'knn': params})
+    if store.exists(CF_SCORES_ARTIFACT, key):
+        return key
+
+    started = time.perf_counter()
+    scorer = KNNBaselineScorer(load_or_fit_knn(fold.train, params, store))
+    fit_time = time.perf_counter() - started
+    inner_items = scorer.to_inner_items(course_ids)
+    scores = np.empty((len(fold.users), len(course_ids)), dtype=np.float32)
+    latency = np.empty(len(fold.users))
+    for pos, user_id in enumerate(fold.users):
+        started = time.perf_counter()
+        scores[pos] = scorer.estimate(user_id, inner_items)
+        latency[pos] = time.perf_counter() - started
+    store.save_arrays(CF_SCORES_ARTIFACT, key, {'scores': scores, 'latency': latency},
+                      {'params': params, 'fit_time_s': fit_time})
+    return key
+
+
+# Стадия контента: близость профиля к каждому курсу, от гиперпараметров KNN не зависит
+def _content_scores(fold, embeddings, store):
+    params = {'stage': 'content', 'half_life_days': fold.profiles.half_life_days,
+              'rating_offset': fold.profiles.rating_offset}
+    key = artifact_key(fold.data_hash + frame_hash(fold.train, ['date']) +
+                       frame_hash(pd.DataFrame(embeddings)), params)
+    if not store.exists(CONTENT_SCORES_ARTIFACT, key):
+        scores = fold.profiles.profile_matrix(fold.users) @ embeddings.T
+        store.save_arrays(CONTENT_SCORES_ARTIFACT, key, {'scores': scores}, params)
+    return store.load_arrays(CONTENT_SCORES_ARTIFACT, key)[0]['scores']
+
+
+# Строки top-n по убыванию для каждой строки матрицы
+def _top_n_rows(scores, n):
+    n = min(n, scores.shape[1])
+    part = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1)
+
+
+# Время контентной части живого запроса (профиль, скоринг пула, смешивание, top-k)
+def _content_latency(fold, embeddings, candidates, cf_cand, k, sample):
+    latency = np.empty(min(sample, len(fold.users)))
+    for pos in range(len(latency)):
+        started = time.perf_counter()
+        cb = fold.profiles.scores(fold.users[pos], embeddings, candidates[pos])
+        top_k_indices(CF_WEIGHT * cf_cand[pos] + CONTENT_WEIGHT * cb, k)
+        latency[pos] = time.perf_counter() - started
+    return latency
+
+
+# Перебор по закэшированным матрицам: на каждый (фолд, параметры KNN) — все размеры пула
+# и веса смешивания без повторного обучения и без циклов по пользователям
+def _sweep(fold, cf, content, cf_latency, weights, n_candidates, k, latency_sample, embeddings):
+    rows = []
+    for n_cand in n_candidates:
+        candidates = _top_n_rows(cf, n_cand)
+        cf_cand = np.take_along_axis(cf, candidates, axis=1)
+        cb_cand = np.take_along_axis(content, candidates, axis=1)
+        content_latency = _content_latency(fold, embeddings, candidates, cf_cand, k, latency_sample)
+        latency = 1000 * (cf_latency[:len(content_latency)] + content_latency)
+        for w in weights:
+            combined = w * cf_cand + (1 - w) * cb_cand
+            rec_rows = np.take_along_axis(candidates, _top_n_rows(combined, k), axis=1)
+            row = {'cf_weight': w, 'content_weight': round(1 - w, 6), 'n_candidates': n_cand}
+            row.update(ranking_metrics(rec_rows, fold.rel_users, fold.rel_items, k))
+            row.update({'latency_ms_p50': float(np.percentile(latency, 50)),
+                        'latency_ms_p95': float(np.percentile(latency, 95))})
+            rows.append(row)
+    return rows
+
+
+def search(knn_params_grid=None, weights=DEFAULT_WEIGHTS, n_candidates=DEFAULT_N_CANDIDATES, k=10,
+           n_folds=3, test_ratio=0.2, max_users=2000, n_jobs=-1, latency_sample=200,
+           ratings_path=None, courses_path=None, store=None):
+    store = store or ArtifactStore()
+    df_ratings, df_courses = read_data(ratings_path or RATINGS_PATH, courses_path or COURSES_PATH)
+    add_description(df_courses)
+    course_ids = df_courses['course_id'].to_numpy()
+    course_index = pd.Index(course_ids)
+    embeddings = course_embeddings(load_doc2vec_model(df_courses, store=store), df_courses, store)
+    folds = [_Fold(train, test, course_index, embeddings, max_users)
+             for train, test in temporal_folds(df_ratings, n_folds, test_ratio)]
+    knn_params_grid = knn_params_grid or knn_grid()
+
+    # Переобучение только по сетке гиперпараметров KNN, параллельно по (фолд, параметры)
+    tasks = list(itertools.product(range(len(folds)), knn_params_grid))
+    _tuning_state.update(folds=folds, course_ids=course_ids, store=store)
+    if n_jobs != 1 and len(tasks) > 1 and 'fork' in mp.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=n_jobs if n_jobs > 0 else None,
+                                 mp_context=mp.get_context('fork')) as pool:
+            keys = list(pool.map(_fit_cf_scores, tasks))
+    else:
+        keys = [_fit_cf_scores(task) for task in tasks]
+    _tuning_state.clear()
+
+    content = [_content_scores(fold, embeddings, store) for fold in folds]
+    results = []
+    for (fold_idx, params), key in zip(tasks, keys):
+        arrays, meta = store.load_arrays(CF_SCORES_ARTIFACT, key)
+        fold = folds[fold_idx]
+        for row in _sweep(fold, arrays['scores'], content[fold_idx], arrays['latency'], weights,
+                          n_candidates, k, latency_sample, embeddings):
+            row.update({'fold': fold_idx, 'knn_k': params['k'],
+                        'bsl_method': params['bsl_options']['method'],
+                        'fit_time_s': meta['fit_time_s']})
+            results.append(row)
+
+    config = ['knn_k', 'bsl_method', 'cf_weight', 'content_weight', 'n_candidates']
+    table = pd.DataFrame(results).groupby(config, as_index=False).mean(numeric_only=True)
+    table = table.drop(columns='fold')
+    return table.sort_values([f'NDCG@{k}', 'latency_ms_p95'], ascending=[False, True],
+                             kind='stable').reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Подбор весов гибрида, размера пула и параметров KNN')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--knn-k', type=int, nargs='+', default=[10])
+    parser.add_argument('--bsl-method', nargs='+', default=['als'], choices=['als', 'sgd'])
+    parser.add_argument('--weights', type=float, nargs='+', default=list(DEFAULT_WEIGHTS))
+    parser.add_argument('--n-candidates', type=int, nargs='+', default=list(DEFAULT_N_CANDIDATES))
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--test-ratio', type=float, default=0.2)
+    parser.add_argument('--max-users', type=int, default=2000, help='тестовых пользователей на фолд')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--ratings', default=None)
+    parser.add_argument('--courses', default=None)
+    parser.add_argument('--out', default=None, help='сохранить таблицу в CSV')
+    parser.add_argument('--top', type=int, default=20, help='сколько строк вывести')
+    args = parser.parse_args()
+
+    table = search(knn_grid(args.knn_k, args.bsl_method), args.weights, args.n_candidates, args.k,
+                   args.folds, args.test_ratio, args.max_users, args.n_jobs,
+                   ratings_path=args.ratings, courses_path=args.courses)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(table.head(args.top).round(4).to_string(index=False))
+    if args.out:
+        table.to_csv(args.out, index=False)
+
+
+if __name__ == '__main__':
+    main()
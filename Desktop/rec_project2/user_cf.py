@@ -0,0 +1,150 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator
+
+
+# Построчный top-k разреженной матрицы (по убыванию значения) -> CSR с <= k элементами в строке.
+# exclude_offset: строка r соответствует объекту r + offset, его «сам с собой» выкидываем.
+def sparse_top_k(S, k, exclude_offset=None):
+    S = S.tocsr()
+    n_rows = S.shape[0]
+    rows = np.repeat(np.arange(n_rows), np.diff(S.indptr))
+    cols = S.indices
+    vals = S.data
+    keep = vals != 0
+    if exclude_offset is not None:
+        keep &= cols != rows + exclude_offset
+    rows, cols, vals = rows[keep], cols[keep], vals[keep]
+
+    order = np.lexsort((-vals, rows))
+    rows, cols, vals = rows[order], cols[order], vals[order]
+    starts = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=starts[1:])
+    top = (np.arange(len(rows)) - starts[rows]) < k
+    rows, cols, vals = rows[top], cols[top], vals[top]
+
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return sp.csr_matrix((vals.astype(np.float32), cols.astype(np.int32), indptr),
+                         shape=S.shape)
+
+
+_chunk_state = {}
+
+
+def _init_chunk_worker(Rn, RnT, k):
+    _chunk_state.update(Rn=Rn, RnT=RnT, k=k)
+
+
+def _top_k_chunk(bounds):
+    start, stop = bounds
+    block = _chunk_state['Rn'][start:stop] @ _chunk_state['RnT']
+    return sparse_top_k(block, _chunk_state['k'], exclude_offset=start)
+
+
+# Косинусная близость строк R, посчитанная блоками по chunk_size строк;
+# от каждой строки остаются только k ближайших соседей (без неё самой).
+# n_jobs > 1 — блоки считаются в пуле процессов.
+def chunked_top_k_similarity(R, k, chunk_size=1000, n_jobs=1):
+    R = sp.csr_matrix(R, dtype=np.float32)
+    norms = np.sqrt(np.asarray(R.multiply(R).sum(axis=1)).ravel())
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    Rn = sp.diags(inv.astype(np.float32)) @ R
+    RnT = Rn.T.tocsr()
+
+    bounds = [(start, min(start + chunk_size, R.shape[0]))
+              for start in range(0, R.shape[0], chunk_size)]
+    if not bounds:
+        return sp.csr_matrix((0, R.shape[0]), dtype=np.float32)
+    if n_jobs == 1 or len(bounds) == 1:
+        _init_chunk_worker(Rn, RnT, k)
+        try:
+            blocks = [_top_k_chunk(b) for b in bounds]
+        finally:
+            _chunk_state.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs if n_jobs > 0 else None,
+                                 initializer=_init_chunk_worker, initargs=(Rn, RnT, k)) as pool:
+            blocks = list(pool.map(_top_k_chunk, bounds))
+    return sp.vstack(blocks, format='csr')
+
+
+# User-based CF на разреженных матрицах: та же формула, что у UserBasedCF из rec_prof.ipynb,
+# но без плотной pivot_table и плотной матрицы схожести U×U
+class UserBasedCF(BaseEstimator):
+    def __init__(self, k=50, chunk_size=1000, n_jobs=1):
+        self.k = k
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def fit(self, X, y, user_col='user_id', item_col='course_id'):
+        X = X[[user_col, item_col]].copy()
+        X['y'] = np.asarray(y, dtype=np.float64)
+        # Повторная оценка пары заменяет прежнюю (как в incremental.py), а не суммируется с ней
+        X = X.drop_duplicates([user_col, item_col], keep='last')
+        self.user_col = user_col
+        self.item_col = item_col
+        self.global_mean = X['y'].mean()
+
+        user_codes, self.users = pd.factorize(X[user_col], sort=True)
+        item_codes, self.items = pd.factorize(X[item_col], sort=True)
+        self.user_pos = pd.Index(self.users)
+        self.item_pos = pd.Index(self.items)
+
+        self.mean_y_user = X.groupby(user_col)['y'].mean().reindex(self.users).to_numpy()
+        self.mean_y_item = X.groupby(item_col)['y'].mean().reindex(self.items).to_numpy()
+
+        # Центрирование оценок одним groupby-transform вместо apply по строкам
+        centered = X['y'] - X.groupby(user_col)['y'].transform('mean')
+        self.user_ratings = sp.csr_matrix(
+            (centered.to_numpy(dtype=np.float32), (user_codes, item_codes)),
+            shape=(len(self.users), len(self.items))
+        )
+        self.item_ratings = self.user_ratings.T.tocsr()
+
+        # Соседи пользователя: CSR U×U, не более k элементов в строке
+        self.neighbors = chunked_top_k_similarity(self.user_ratings, self.k, self.chunk_size,
+                                                  self.n_jobs)
+        self.neighbor_norm = np.asarray(abs(self.neighbors).sum(axis=1)).ravel()
+        return self
+
+    def _finish(self, user_idx, numerator):
+        denominator = self.neighbor_norm[user_idx]
+        base = self.mean_y_user[user_idx]
+        safe = denominator > 0
+        pred = base + np.divide(numerator, denominator, out=np.zeros_like(base), where=safe)
+        return np.clip(pred, 1.0, 5.0)
+
+    def predict_rating(self, user_id, item_id):
+        return float(self.predict_pairs([user_id], [item_id])[0])
+
+    # Пакетное предсказание для пар (user, item): строки соседей ⊙ столбцы оценок
+    def predict_pairs(self, user_ids, item_ids):
+        u = self.user_pos.get_indexer(user_ids)
+        i = self.item_pos.get_indexer(item_ids)
+        pred = np.full(len(u), self.global_mean, dtype=np.float64)
+        known = (u >= 0) & (i >= 0)
+        if known.any():
+            uk, ik = u[known], i[known]
+            numerator = np.asarray(
+                self.neighbors[uk].multiply(self.item_ratings[ik]).sum(axis=1)
+            ).ravel()
+            pred[known] = self._finish(uk, numerator)
+        return pred
+
+    # Оценки пользователя для всех items из обучения (одно умножение строки соседей на R)
+    def predict_user(self, user_id):
+        loc = self.user_pos.get_indexer([user_id])[0]
+        if loc < 0:
+            return np.full(len(self.items), self.global_mean)
+        numerator = np.asarray((self.neighbors[loc] @ self.user_ratings).todense()).ravel()
+        return self._finish(np.full(len(self.items), loc), numerator)
+
+    def predict(self, X, user_col=None, item_col=None):
+        user_col = user_col or self.user_col
+        item_col = item_col or self.item_col
+        return pd.Series(self.predict_pairs(X[user_col].to_numpy(), X[item_col].to_numpy()),
+                         index=X.index)
@@ -0,0 +1,269 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from scoring import top_k_indices
+
+
+def _normalize(vectors):
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+# Слияние текущего top-k (m×k) с новым блоком кандидатов (m×b) построчно
+def _merge_top_k(best_ids, best_scores, ids, scores, k):
+    all_ids = np.concatenate([best_ids, ids], axis=1)
+    all_scores = np.concatenate([best_scores, scores], axis=1)
+    k = min(k, all_scores.shape[1])
+    part = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(all_scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    part = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(all_ids, part, axis=1), np.take_along_axis(all_scores, part, axis=1)
+
+
+# Общая часть индексов: L2-нормированные float32 векторы (косинус = скалярное произведение),
+# внешние id и сохранение в каталог с .npy, который читается через mmap
+class _VectorIndex:
+    kind = None
+
+    def __init__(self):
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, vectors, ids=None):
+        vectors = _normalize(vectors)
+        if ids is None:
+            start = int(self.ids.max()) + 1 if len(self.ids) else 0
+            ids = np.arange(start, start + len(vectors))
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.vectors) == 0:
+            self.vectors = vectors
+        else:
+            self.vectors = np.concatenate([self.vectors, vectors])
+        self.ids = np.concatenate([self.ids, ids])
+        return self
+
+    def query(self, vector, k=10):
+        ids, scores = self.query_batch(np.asarray(vector)[None, :], k)
+        return ids[0], scores[0]
+
+    def _arrays(self):
+        return {'vectors': self.vectors, 'ids': self.ids}
+
+    def _params(self):
+        return {}
+
+    def save(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, array in self._arrays().items():
+            np.save(path / f'{name}.npy', np.ascontiguousarray(array))
+        with open(path / 'meta.json', 'w') as f:
+            json.dump({'kind': self.kind, 'params': self._params(),
+                       'arrays': sorted(self._arrays())}, f, indent=2)
+
+    def _restore(self, arrays):
+        self.vectors = arrays['vectors']
+        self.ids = arrays['ids']
+
+
+# Точный поиск: перебор блоками по block_size векторов с потоковым слиянием top-k
+class ExactIndex(_VectorIndex):
+    kind = 'exact'
+
+    def __init__(self, block_size=65536):
+        super().__init__()
+        self.block_size = block_size
+
+    def _params(self):
+        return {'block_size': self.block_size}
+
+    def query_batch(self, vectors, k=10):
+        queries = _normalize(vectors)
+        m = len(queries)
+        best_ids = np.empty((m, 0), dtype=np.int64)
+        best_scores = np.empty((m, 0), dtype=np.float32)
+        for start in range(0, len(self.vectors), self.block_size):
+            block = self.vectors[start:start + self.block_size]
+            scores = queries @ block.T
+            if scores.shape[1] > k:
+                part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, part, axis=1)
+                ids = self.ids[start:start + self.block_size][part]
+            else:
+                ids = np.broadcast_to(self.ids[start:start + self.block_size], scores.shape)
+            best_ids, best_scores = _merge_top_k(best_ids, best_scores, ids, scores, k)
+        return best_ids, best_scores
+
+
+# IVF: сферический k-means на n_lists центроидов, запрос просматривает n_probe ближайших
+# списков. Больше n_probe — выше recall и медленнее; n_probe = n_lists — точный поиск.
+class IVFIndex(_VectorIndex):
+    kind = 'ivf'
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, seed=0):
+        super().__init__()
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self.assign = np.empty(0, dtype=np.int32)
+        self._list_ptr = None
+        self._list_members = None
+
+    def _params(self):
+        return {'n_lists': self.n_lists, 'n_probe': self.n_probe,
+                'n_iter': self.n_iter, 'seed': self.seed}
+
+    def _assign(self, vectors, block_size=65536):
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            out[start:start + block_size] = np.argmax(
+                vectors[start:start + block_size] @ self.centroids.T, axis=1)
+        return out
+
+    def train(self, vectors):
+        vectors = _normalize(vectors)
+        rng = np.random.default_rng(self.seed)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        self.n_lists = n_lists
+        self.centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assign = self._assign(vectors)
+            counts = np.bincount(assign, minlength=n_lists)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(self.centroids)
+            nonempty = counts > 0
+            sums[nonempty] = np.add.reduceat(vectors[np.argsort(assign, kind='stable')],
+                                             starts[nonempty], axis=0)
+            # Пустые кластеры пересеиваем случайными векторами
+            empty = counts == 0
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+            self.centroids = _normalize(sums)
+        return self
+
+    def add(self, vectors, ids=None):
+        n_before = len(self.vectors)
+        super().add(vectors, ids)
+        if self.centroids is None:
+            self.train(self.vectors)
+            self.assign = self._assign(self.vectors)
+        else:
+            self.assign = np.concatenate([self.assign, self._assign(self.vectors[n_before:])])
+        self._list_ptr = None
+        return self
+
+    # Инвертированные списки в CSR-виде, перестраиваются лениво после add
+    def _lists(self):
+        if self._list_ptr is None:
+            self._list_members = np.argsort(self.assign, kind='stable')
+            self._list_ptr = np.zeros(self.n_lists + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.assign, minlength=self.n_lists), out=self._list_ptr[1:])
+        return self._list_ptr, self._list_members
+
+    def query_batch(self, vectors, k=10, n_probe=None):
+        queries = _normalize(vectors)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        ptr, members = self._lists()
+        probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for qi, (query, lists) in enumerate(zip(queries, probes)):
+            counts = ptr[lists + 1] - ptr[lists]
+            offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            pos = np.repeat(ptr[lists] - offsets[:-1], counts) + np.arange(offsets[-1])
+            cand = members[pos]
+            scores = self.vectors[cand] @ query
+            top = top_k_indices(scores, k)
+            out_ids[qi, :len(top)] = self.ids[cand[top]]
+            out_scores[qi, :len(top)] = scores[top]
+        return out_ids, out_scores
+
+    def _arrays(self):
+        return dict(super()._arrays(), centroids=self.centroids, assign=self.assign)
+
+    def _restore(self, arrays):
+        super()._restore(arrays)
+        self.centroids = arrays['centroids']
+        self.assign = arrays['assign']
+
+
+INDEX_KINDS = {'exact': ExactIndex, 'ivf': IVFIndex}
+
+
+def load_index(path, mmap_mode='r'):
+    path = Path(path)
+    with open(path / 'meta.json') as f:
+        meta = json.load(f)
+    index = INDEX_KINDS[meta['kind']](**meta['params'])
+    index._restore({name: np.load(path / f'{name}.npy', mmap_mode=mmap_mode)
+                    for name in meta['arrays']})
+    return index
+
+
+# Индекс по векторам курсов (id = позиция курса в df_courses, как в build_embedding_matrix)
+def build_course_index(embeddings, kind='exact', **params):
+    known = np.flatnonzero(np.linalg.norm(embeddings, axis=1) > 0)
+    return INDEX_KINDS[kind](**params).add(embeddings[known], known)
+
+
+# Recall@k приближённого индекса относительно точного и запросы/сек
+def benchmark(vectors, queries, k=10, n_probes=(1, 4, 16, 64), n_lists=None):
+    exact = ExactIndex().add(vectors)
+    started = time.perf_counter()
+    true_ids, _ = exact.query_batch(queries, k)
+    exact_time = time.perf_counter() - started
+    rows = [{'index': 'exact', 'n_probe': None, f'recall@{k}': 1.0,
+             'qps': len(queries) / exact_time}]
+
+    started = time.perf_counter()
+    ivf = IVFIndex(n_lists=n_lists).add(vectors)
+    build_time = time.perf_counter() - started
+    for n_probe in n_probes:
+        started = time.perf_counter()
+        ids, _ = ivf.query_batch(queries, k, n_probe=n_probe)
+        elapsed = time.perf_counter() - started
+        hits = [len(np.intersect1d(a, b)) for a, b in zip(ids, true_ids)]
+        rows.append({'index': f'ivf(n_lists={ivf.n_lists}, build={build_time:.1f}s)',
+                     'n_probe': n_probe, f'recall@{k}': float(np.mean(hits)) / k,
+                     'qps': len(queries) / elapsed})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк векторного индекса: recall@k и QPS')
+    parser.add_argument('--n', type=int, default=100_000, help='число векторов (синтетика)')
+    parser.add_argument('--dim', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--n-lists', type=int, default=None)
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    # Синтетика с кластерной структурой, похожая на векторы Doc2Vec
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(max(1, args.n // 500), args.dim))
+    vectors = centers[rng.integers(0, len(centers), args.n)] + 0.5 * rng.normal(size=(args.n, args.dim))
+    queries = vectors[rng.choice(args.n, args.queries, replace=False)] + \
+        0.1 * rng.normal(size=(args.queries, args.dim))
+
+    for row in benchmark(vectors, queries, args.k, args.n_probe, args.n_lists):
+        print(f"{row['index']:<40} n_probe={str(row['n_probe']):<5} "
+              f"recall@{args.k}={row[f'recall@{args.k}']:.3f}  qps={row['qps']:.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from profiling import timer
+
+# Отсчёт для time-to-first-render: main.py импортирует модуль первым делом при загрузке
+BOOT_TIME = time.perf_counter()
+
+# Поток загрузки переживает запуск скрипта, а Streamlit добавляет каталог приложения
+# в sys.path только на время запуска (и затем удаляет эту запись) — своя запись в конце
+APP_DIR = str(Path(__file__).resolve().parent)
+sys.path.append(APP_DIR)
+SERVICE_URL_ENV = 'REC_SERVICE_URL'
+STARTUP_ENV = 'REC_STARTUP'
+# 'background' — модели грузятся в потоке, страница сразу показывает популярное;
+# 'blocking' — страница ждёт загрузки моделей, как раньше
+STARTUP_MODES = ('background', 'blocking')
+# Офлайн top-K и векторы отзывов перечитываются не чаще раза в 10 минут
+OPTIONAL_TTL = 600
+# Модули с gensim, surprise, sklearn и nltk: импортируются в потоке загрузки
+MODEL_MODULES = ['recommender', 'artifacts', 'item_cf', 'profiles', 'comments',
+                 'batch_recommend', 'result_cache', 'shared_scoring', 'text_pipeline', 'gensim.models']
+STAGE_LABELS = {
+    'data': 'данные', 'import': 'импорт библиотек', 'doc2vec': 'Doc2Vec', 'cf': 'CF модель',
+    'item_neighbors': 'item-item соседи', 'profiles': 'профили пользователей',
+    'recommender': 'рекомендатель', 'shared_scoring': 'общий сегмент скоринга',
+    'topk_store': 'офлайн top-K', 'comment_vectors': 'векторы отзывов',
+}
+
+
+def startup_mode():
+    mode = os.environ.get(STARTUP_ENV, 'background')
+    return mode if mode in STARTUP_MODES else 'background'
+
+
+def _since_boot_ms():
+    return (time.perf_counter() - BOOT_TIME) * 1000
+
+
+# Загрузка данных, моделей и артефактов рекомендателя — один раз на процесс. В режиме
+# background идёт в отдельном потоке с момента старта main.py, страница модели не ждёт
+# её и до готовности показывает популярное. Длительности стадий — в stages (мс)
+class ModelWarmup:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data_ready = threading.Event()
+        self.done = threading.Event()
+        self.thread = None
+        self.status = 'idle'
+        self.stage = None
+        self.error = None
+        self.data_error = None
+        self.warnings = {}
+        self.stages = {}
+        self.ready_ms = None
+        self.first_render_ms = None
+        self.first_render_ready = None
+        self.df_ratings = None
+        self.df_courses = None
+        self.recommender = None
+        self.optional_lock = threading.Lock()
+        self.optional_loaded_at = None
+        self.optional_versions = {}
+
+    @property
+    def ready(self):
+        return self.status == 'ready'
+
+    @property
+    def stage_label(self):
+        return STAGE_LABELS.get(self.stage, self.stage or '')
+
+    def _run_stage(self, name, func):
+        self.stage = name
+        started = time.perf_counter()
+        with timer.stage(f'startup.{name}'):
+            result = func()
+        self.stages[name] = (time.perf_counter() - started) * 1000
+        return result
+
+    # Необязательные артефакты: ошибка — предупреждение, рекомендатель работает без них
+    def _optional(self, name, func):
+        try:
+            result = self._run_stage(name, func)
+            self.warnings.pop(name, None)
+            return result
+        except Exception as e:
+            self.warnings[name] = str(e)
+            return None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.status = 'loading'
+                self.thread = threading.Thread(target=self._load, name='model-warmup', daemon=True)
+                self.thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        self.start()
+        return self.done.wait(timeout)
+
+    # Кадры рейтингов и курсов: ждёт только первую стадию, а не модели
+    def data(self):
+        self.start()
+        self.data_ready.wait()
+        if self.data_error is not None:
+            raise self.data_error
+        return self.df_ratings, self.df_courses
+
+    def _load(self):
+        try:
+            from dataset import load_courses, load_ratings
+
+            self.df_ratings, self.df_courses = self._run_stage(
+                'data', lambda: (load_ratings(), load_courses()))
+        except Exception as e:
+            self.data_error = e
+            self.error = str(e)
+            self.status = 'failed'
+        finally:
+            self.data_ready.set()
+        try:
+            # С REC_SERVICE_URL модели считает сервис: в процессе нужны только данные
+            if self.data_error is None and not os.environ.get(SERVICE_URL_ENV):
+                self._load_models()
+                self.status = 'ready'
+        except Exception as e:
+            self.error = f'{self.stage_label}: {e}'
+            self.status = 'failed'
+        finally:
+            self.ready_ms = _since_boot_ms()
+            self.done.set()
+
+    def _load_models(self):
+        self._run_stage('import', lambda: [importlib.import_module(name) for name in MODEL_MODULES])
+        from coldstart import course_embeddings
+        from dataset import load_course_tokens
+        from item_cf import load_or_fit_item_neighbors
+        from profiles import load_or_build_profiles
+        from recommender import HybridRecommender, load_cf_model, load_doc2vec_model
+        from result_cache import RecommendationCache
+        from shared_scoring import enable_from_env
+
+        df_ratings, df_courses = self.df_ratings, self.df_courses
+        doc2vec_model = self._run_stage('doc2vec', lambda: load_doc2vec_model(df_courses, load_course_tokens()))
+        cf_model = self._run_stage('cf', lambda: load_cf_model(df_ratings))
+        # Top-N похожих курсов для режима «потому что вы оценили X»
+        item_neighbors = self._optional('item_neighbors',
+                                        lambda: load_or_fit_item_neighbors(df_ratings, df_courses))
+        profiles = self._run_stage('profiles', lambda: load_or_build_profiles(
+            df_ratings, df_courses, course_embeddings(doc2vec_model, df_courses)))
+        recommender = self._run_stage('recommender', lambda: HybridRecommender(
+            cf_model=cf_model, doc2vec_model=doc2vec_model, df_courses=df_courses, df_ratings=df_ratings,
+            item_neighbors=item_neighbors, profiles=profiles, result_cache=RecommendationCache()))
+        # REC_SCORING_WORKERS > 0 и BiasedMF: общий сегмент памяти на все процессы хоста
+        self._optional('shared_scoring', lambda: enable_from_env(recommender))
+        self.recommender = recommender
+        self.refresh_optional()
+
+    # Необязательный артефакт перечитывается, только если сменилась его версия — ключ данных
+    # и время записи из meta.json (None — артефакта нет). Возвращает (сменился ли, значение)
+    def _refresh_artifact(self, name, artifact, key_func, load):
+        from artifacts import ArtifactStore
+
+        store = ArtifactStore()
+        try:
+            key = key_func()
+            version = (key, store.read_meta(artifact, key)['created_at']) if store.exists(artifact, key) else None
+        except Exception as e:
+            self.warnings[name] = str(e)
+            return False, None
+        if name in self.optional_versions and self.optional_versions[name] == version:
+            return False, None
+        value = self._optional(name, lambda: None if version is None else load(store, key))
+        if name not in self.warnings:
+            self.optional_versions[name] = version
+        return True, value
+
+    # Офлайн top-K (batch_recommend.py) и векторы отзывов (comments.py): сначала офлайн
+    # top-K, живой расчёт — только для пользователей, которых там нет. Вызывается из потока
+    # каждой сессии: перечитывает один поток, остальные работают с текущими артефактами
+    def refresh_optional(self, max_age=OPTIONAL_TTL):
+        if self.recommender is None or not self.optional_lock.acquire(blocking=False):
+            return
+        try:
+            if self.optional_loaded_at is not None and time.monotonic() - self.optional_loaded_at < max_age:
+                return
+            from batch_recommend import TOPK_ARTIFACT, TopKStore, topk_key
+            from comments import COMMENTS_ARTIFACT, CommentVectors, comments_key, read_comments
+
+            self.optional_loaded_at = time.monotonic()
+            changed, topk_store = self._refresh_artifact(
+                'topk_store', TOPK_ARTIFACT, lambda: topk_key(self.df_ratings, self.df_courses), TopKStore.load)
+            if changed:
+                self.recommender.topk_store = topk_store
+            changed, comment_vectors = self._refresh_artifact(
+                'comment_vectors', COMMENTS_ARTIFACT,
+                lambda: comments_key(read_comments(), self.df_courses), CommentVectors.load)
+            if changed:
+                # Курсы, добавленные в процессе (add_courses), — нулевые строки, как в add_courses
+                added = len(self.recommender.df_courses) - len(self.df_courses)
+                if comment_vectors is not None and added > 0:
+                    comment_vectors.add_courses(added)
+                self.recommender.comment_vectors = comment_vectors
+        finally:
+            self.optional_lock.release()
+
+    # Первая отрисовка страницы модели в процессе: время с BOOT_TIME и были ли готовы модели
+    def mark_first_render(self):
+        if self.first_render_ms is None:
+            self.first_render_ms = _since_boot_ms()
+            self.first_render_ready = self.ready
+
+    def snapshot(self):
+        return {
+            'mode': startup_mode(), 'status': self.status, 'stage': self.stage, 'error': self.error,
+            'warnings': dict(self.warnings), 'stages_ms': dict(self.stages),
+            'first_render_ms': self.first_render_ms, 'first_render_with_models': self.first_render_ready,
+            'models_ready_ms': self.ready_ms,
+        }
+
+
+warmup = ModelWarmup()
+
+
+# Вызывается из main.py на каждом запуске скрипта; поток загрузки стартует один раз.
+# В режиме blocking загрузку начинает сама страница модели
+def start_background_loading():
+    if startup_mode() == 'background':
+        warmup.start()
+    return warmup
+
+
+# Время импорта модулей, каждый в новом процессе (python -c "import ...")
+def import_times(modules):
+    rows = []
+    for module in modules:
+        code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, check=True).stdout
+        rows.append((module, float(output.split()[-1]) * 1000))
+    return rows
+
+
+_TTFR_SCRIPT = '''
+import json, os, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=600).run()
+first_render = (time.perf_counter() - started) * 1000
+from warmup import warmup
+warmup.wait()
+print(json.dumps({'first_render_ms': first_render, 'with_models': warmup.first_render_ready,
+                  'models_ready_ms': (time.perf_counter() - started) * 1000,
+                  'errors': [e.value for e in at.exception]}))
+'''
+
+
+# Time-to-first-render страницы модели в новом процессе (AppTest) для каждого режима
+def first_render_times(modes=STARTUP_MODES):
+    page = Path(__file__).with_name('streamlit_proj.py')
+    rows = []
+    for mode in modes:
+        env = dict(os.environ, **{STARTUP_ENV: mode})
+        env.pop(SERVICE_URL_ENV, None)
+        output = subprocess.run([sys.executable, '-c', _TTFR_SCRIPT, str(page)], capture_output=True,
+                                text=True, cwd=page.parent, env=env, check=True).stdout
+        rows.append((mode, json.loads(output.strip().splitlines()[-1])))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время запуска приложения: импорт и первая отрисовка')
+    parser.add_argument('--modules', nargs='+',
+                        default=['streamlit', 'dataset', 'coldstart', 'warmup', 'recommender', 'service',
+                                 'nltk', 'gensim', 'surprise', 'sklearn', 'matplotlib.pyplot'])
+    parser.add_argument('--modes', nargs='+', choices=STARTUP_MODES, default=list(STARTUP_MODES))
+    args = parser.parse_args()
+
+    print('import time (fresh process):')
+    for module, ms in import_times(args.modules):
+        print(f'  {module:<20} {ms:>9.0f} ms')
+    print('model page, fresh process:')
+    for mode, result in first_render_times(args.modes):
+        print(f"  {mode:<11} first render {result['first_render_ms']:>8.0f} ms"
+              f"  (models ready: {result['with_models']}),"
+              f"  models ready {result['models_ready_ms']:>8.0f} ms  errors: {result['errors']}")
+
+
+if __name__ == '__main__':
+    main()